@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# CraftMCP benchmark suite
+#
+# Creates stub versions of the Library/MCPs servers through the REST API, drives
+# /infere-mcp and the Usecases_Templates chains at the requested concurrency and
+# writes throughput + p50/p95/p99 latency for cold and warm calls to a JSON file.
+#
+#   python benchmark.py --token $TOKEN --concurrency 1,4,16 --requests 50 --output bench.json
+#   python benchmark.py --token $TOKEN --compare bench_v1.json --output bench_v2.json
+#
+# Only the standard library is used so it runs anywhere the API is reachable.
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import textwrap
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+# Stub tools keep the Library/MCPs names and params, but answer locally.
+# STUB_LATENCY_MS emulates the remote API round trip of the real tool.
+def _snippet(code: str) -> str:
+    return textwrap.indent(textwrap.dedent(code).strip(), "    ")
+
+
+STUB_MCPS = {
+    "search": {
+        "mcp": {"name": "bench-search-internet", "description": "SerpAPI stub",
+                "imports": ["import time"], "globals": {"STUB_LATENCY_MS": 50}},
+        "tool": {"tool_name": "google_search", "is_async": False,
+                 "params": {"query": {"type": "str"}, "max_results": {"type": "int", "default": 3}},
+                 "snippet": _snippet("""
+                     time.sleep(STUB_LATENCY_MS / 1000)
+                     return "\\n".join(f"Result {i} for {query}: https://example.com/{i}" for i in range(max_results))
+                 """)},
+    },
+    "ollama": {
+        "mcp": {"name": "bench-prompt-ollama", "description": "Ollama stub",
+                "imports": ["import time", "import hashlib"], "globals": {"STUB_LATENCY_MS": 200}},
+        "tool": {"tool_name": "prompt_ollama", "is_async": False,
+                 "params": {"model": {"type": "str"}, "prompt": {"type": "str"}},
+                 "snippet": _snippet("""
+                     time.sleep(STUB_LATENCY_MS / 1000)
+                     digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+                     return f"[{model}] summary {digest} of {len(prompt)} chars"
+                 """)},
+    },
+    "vt": {
+        "mcp": {"name": "bench-check-vt", "description": "VirusTotal stub",
+                "imports": ["import time", "import hashlib"], "globals": {"STUB_LATENCY_MS": 80}},
+        "tool": {"tool_name": "check_vt", "is_async": False,
+                 "params": {"hash": {"type": "str", "default": ""}, "ip": {"type": "str", "default": ""}},
+                 "snippet": _snippet("""
+                     time.sleep(STUB_LATENCY_MS / 1000)
+                     key = hash or ip
+                     if not key:
+                         return "Error: Provide either hash or ip"
+                     seed = int(hashlib.md5(key.encode()).hexdigest(), 16)
+                     return str({"malicious": seed % 5, "suspicious": seed % 3, "harmless": 60 + seed % 10, "undetected": 10})
+                 """)},
+    },
+    "splunk": {
+        "mcp": {"name": "bench-splunk-search", "description": "Splunk stub",
+                "imports": ["import time", "import json"], "globals": {"STUB_LATENCY_MS": 120}},
+        "tool": {"tool_name": "splunk_spl_search", "is_async": False,
+                 "params": {"spl_query": {"type": "str"}},
+                 "snippet": _snippet("""
+                     time.sleep(STUB_LATENCY_MS / 1000)
+                     return json.dumps({"results": [{"src_ip": f"10.0.0.{i}", "count": 100 - i} for i in range(1, 4)]})
+                 """)},
+    },
+    "chromadb": {
+        "mcp": {"name": "bench-chromadb-store-search", "description": "ChromaDB stub",
+                "imports": ["import time"], "globals": {"STUB_LATENCY_MS": 30}},
+        "tool": {"tool_name": "chromadb_store_and_query", "is_async": False,
+                 "params": {"collection_name": {"type": "str"},
+                            "documents": {"type": "list", "default": []},
+                            "ids": {"type": "list", "default": []},
+                            "query_texts": {"type": "list", "default": []},
+                            "embeddings": {"type": "list", "default": []}},
+                 "snippet": _snippet("""
+                     time.sleep(STUB_LATENCY_MS / 1000)
+                     if query_texts:
+                         return str({"ids": [["alert1", "alert2"]], "documents": [["stub document"] * 2]})
+                     return "Documents stored successfully."
+                 """)},
+    },
+    # The CSV/JSON parser has no external dependency, so the shipped tool is used as-is
+    "parse": {
+        "mcp": {"name": "bench-parse-csv-json", "description": "Parse CSV or JSON string content",
+                "imports": ["import csv", "import json", "from io import StringIO"], "globals": {}},
+        "tool": {"tool_name": "parse_file", "is_async": False,
+                 "params": {"file_content": {"type": "str"}, "file_type": {"type": "str"},
+                            "flatten": {"type": "bool", "default": False}},
+                 "snippet": _snippet("""
+                     stream = StringIO(file_content)
+                     if file_type == "csv":
+                         return json.dumps(list(csv.DictReader(stream)))
+                     data = json.load(stream)
+                     return json.dumps(data if isinstance(data, list) else [data])
+                 """)},
+    },
+}
+
+SAMPLE_CSV = "id,text\n" + "\n".join(f"{i},Alert number {i} unauthorized access detected" for i in range(1, 51))
+
+
+class Client:
+
+    def __init__(self, url: str, token: str, timeout: float):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+
+    def call(self, method: str, path: str, body: dict | None = None, headers: dict | None = None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.url + path, data=data, method=method)
+        req.add_header("Authorization", f"Bearer {self.token}")
+        req.add_header("Content-Type", "application/json")
+        for k, v in (headers or {}).items():
+            req.add_header(k, str(v))
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read() or b"null")
+
+
+    def infere(self, mcp_id: int, name: str, arguments: dict):
+        return self.call("POST", "/infere-mcp", {"mcp_id": mcp_id, "type": "tool", "name": name, "arguments": arguments})
+
+
+def _result_text(response) -> str:
+    try:
+        return "".join(c.get("text", "") for c in response["result"]["content"])
+    except (KeyError, TypeError):
+        return json.dumps(response)
+
+
+def setup_mcps(client: Client) -> dict:
+    # Unique names per run, so earlier runs never clash. The new id is returned by /create-mcp
+    suffix = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    ids = {}
+    for key, spec in STUB_MCPS.items():
+        created = client.call("POST", "/create-mcp", dict(spec["mcp"], name=f"{spec['mcp']['name']}-{suffix}"))
+        mcp_id = created["id"]
+        client.call("POST", "/create-tool", dict(spec["tool"], mcp_id=mcp_id))
+        ids[key] = mcp_id
+        print(f">>> Created {spec['mcp']['name']} as MCP {mcp_id}")
+    return ids
+
+
+def start_mcps(client: Client, ids: dict):
+    for key, mcp_id in ids.items():
+        status = client.call("POST", "/run-mcp", {"mcp_id": mcp_id})
+        if status.get("status") == "failed":
+            raise RuntimeError(f"MCP {key} failed to start: {status.get('error')}")
+
+
+def teardown_mcps(client: Client, ids: dict):
+    for mcp_id in ids.values():
+        try:
+            client.call("POST", "/stop-mcp", {"mcp_id": mcp_id})
+            client.call("POST", "/delete-mcp", headers={"mcp-id": mcp_id})
+        except urllib.error.URLError as e:
+            print(f">>> Cleanup of MCP {mcp_id} failed: {e}")
+
+
+# Scenarios: each returns a callable doing one unit of work
+def scenario_tool(client, ids, key, arguments):
+    spec = STUB_MCPS[key]["tool"]
+    return lambda i: client.infere(ids[key], spec["tool_name"], arguments)
+
+
+def scenario_usecase_01(client, ids):
+    def run(i):
+        news = _result_text(client.infere(ids["search"], "google_search", {"query": f"latest threats {i}", "max_results": 3}))
+        client.infere(ids["ollama"], "prompt_ollama", {"model": "mistral", "prompt": f"Summarize:\n{news}"})
+    return run
+
+
+def scenario_usecase_02(client, ids):
+    def run(i):
+        splunk = _result_text(client.infere(ids["splunk"], "splunk_spl_search", {"spl_query": "index=threats | top limit=3 src_ip"}))
+        ips = [r["src_ip"] for r in json.loads(splunk).get("results", [])]
+        reports = [_result_text(client.infere(ids["vt"], "check_vt", {"ip": ip})) for ip in ips]
+        client.infere(ids["ollama"], "prompt_ollama", {"model": "mistral", "prompt": "Summarize:\n" + "\n".join(reports)})
+    return run
+
+
+def scenario_usecase_03(client, ids):
+    def run(i):
+        rows = json.loads(_result_text(client.infere(ids["parse"], "parse_file", {"file_type": "csv", "file_content": SAMPLE_CSV})))
+        texts = [r["text"] for r in rows]
+        client.infere(ids["ollama"], "prompt_ollama", {"model": "bge-base-en-v1.5", "prompt": json.dumps(texts)})
+        client.infere(ids["chromadb"], "chromadb_store_and_query", {
+            "collection_name": "alerts", "documents": texts, "ids": [f"alert{r['id']}" for r in rows]})
+        hits = _result_text(client.infere(ids["chromadb"], "chromadb_store_and_query", {
+            "collection_name": "alerts", "query_texts": ["unauthorized activity"]}))
+        client.infere(ids["ollama"], "prompt_ollama", {"model": "mistral", "prompt": f"Summarize:\n{hits}"})
+    return run
+
+
+def build_scenarios(client: Client, ids: dict) -> dict:
+    return {
+        "tool:google_search": scenario_tool(client, ids, "search", {"query": "latest cybersecurity threats", "max_results": 3}),
+        "tool:prompt_ollama": scenario_tool(client, ids, "ollama", {"model": "mistral", "prompt": "Summarize the threat landscape"}),
+        "tool:check_vt": scenario_tool(client, ids, "vt", {"hash": "44d88612fea8a8f36de82e1278abb02f"}),
+        "tool:splunk_spl_search": scenario_tool(client, ids, "splunk", {"spl_query": "index=threats | top limit=3 src_ip"}),
+        "tool:parse_file": scenario_tool(client, ids, "parse", {"file_type": "csv", "file_content": SAMPLE_CSV}),
+        "usecase:01_threat_news": scenario_usecase_01(client, ids),
+        "usecase:02_ioc_enrichment": scenario_usecase_02(client, ids),
+        "usecase:03_embed_store_search": scenario_usecase_03(client, ids),
+    }
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(scenario: str, phase: str, concurrency: int, latencies: list, errors: int, wall: float) -> dict:
+    latencies = sorted(latencies)
+    completed = len(latencies)
+    return {
+        "scenario": scenario,
+        "phase": phase,
+        "concurrency": concurrency,
+        "requests": completed + errors,
+        "errors": errors,
+        "wall_s": round(wall, 4),
+        "throughput_rps": round(completed / wall, 3) if wall else 0.0,
+        "mean_ms": round(sum(latencies) / completed * 1000, 3) if completed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def drive(fn, total: int, concurrency: int):
+    latencies = []
+    errors = 0
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for elapsed, error in pool.map(one, range(total)):
+            if error is None:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+    return latencies, errors, time.perf_counter() - start
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def compare(current: list, baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["phase"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    regressed = False
+    print(f"\n{'scenario':34} {'phase':5} {'conc':>4} {'p50 Δ%':>8} {'p95 Δ%':>8} {'p99 Δ%':>8} {'rps Δ%':>8}")
+    for r in current:
+        base = baseline.get((r["scenario"], r["phase"], r["concurrency"]))
+        if not base:
+            continue
+        deltas = {}
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            deltas[key] = (r[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+        flag = ""
+        if deltas["p95_ms"] > threshold or -deltas["throughput_rps"] > threshold:
+            regressed = True
+            flag = "  REGRESSION"
+        print(f"{r['scenario']:34} {r['phase']:5} {r['concurrency']:>4} {deltas['p50_ms']:>8.1f} "
+              f"{deltas['p95_ms']:>8.1f} {deltas['p99_ms']:>8.1f} {deltas['throughput_rps']:>8.1f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CraftMCP benchmark suite")
+    parser.add_argument("--url", default=os.environ.get("CRAFTMCP_URL", "http://localhost:8000"))
+    parser.add_argument("--token", default=os.environ.get("CRAFTMCP_TOKEN"))
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Warm requests per scenario and concurrency level")
+    parser.add_argument("--scenarios", default="", help="Comma separated scenario prefixes (default: all)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", default=f"bench_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    parser.add_argument("--keep", action="store_true", help="Keep the stub MCPs after the run")
+    args = parser.parse_args()
+
+    if not args.token:
+        parser.error("--token or CRAFTMCP_TOKEN is required")
+
+    client = Client(args.url, args.token, args.timeout)
+    levels = [int(c) for c in args.concurrency.split(",") if c]
+    wanted = [s for s in args.scenarios.split(",") if s]
+
+    ids = setup_mcps(client)
+    results = []
+    try:
+        start_mcps(client, ids)
+        scenarios = build_scenarios(client, ids)
+        for name, fn in scenarios.items():
+            if wanted and not any(name.startswith(w) for w in wanted):
+                continue
+
+            # Cold: first call right after the MCPs were (re)started
+            start_mcps(client, ids)
+            latencies, errors, wall = drive(fn, 1, 1)
+            results.append(summarize(name, "cold", 1, latencies, errors, wall))
+
+            for level in levels:
+                drive(fn, level, level)  # warm-up, not recorded
+                latencies, errors, wall = drive(fn, args.requests, level)
+                row = summarize(name, "warm", level, latencies, errors, wall)
+                results.append(row)
+                print(f">>> {name:34} c={level:<3} {row['throughput_rps']:>8} rps  p50={row['p50_ms']}ms "
+                      f"p95={row['p95_ms']}ms p99={row['p99_ms']}ms errors={errors}")
+    finally:
+        if not args.keep:
+            teardown_mcps(client, ids)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "url": args.url,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": levels,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f">>> Results written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
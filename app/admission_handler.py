@@ -0,0 +1,183 @@
+from fastapi import HTTPException
+from contextlib import asynccontextmanager
+from collections import deque
+import asyncio
+import math
+import time
+import os
+from metrics_handler import Counter, register_collector
+
+
+MAX_CONCURRENT = int(os.environ.get("CRAFTMCP_MAX_CONCURRENT", "32"))
+MAX_CONCURRENT_PER_USER = int(os.environ.get("CRAFTMCP_MAX_CONCURRENT_PER_USER", "4"))
+MAX_CONCURRENT_PER_MCP = int(os.environ.get("CRAFTMCP_MAX_CONCURRENT_PER_MCP", "8"))
+MAX_QUEUE = int(os.environ.get("CRAFTMCP_MAX_QUEUE", "64"))
+MAX_QUEUE_PER_USER = int(os.environ.get("CRAFTMCP_MAX_QUEUE_PER_USER", "16"))
+QUEUE_TIMEOUT_S = float(os.environ.get("CRAFTMCP_QUEUE_TIMEOUT_S", "30"))
+
+
+def _parse_weights(value: str) -> dict:
+    # "alice=3,bob=1"
+    weights = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, weight = item.split("=", 1)
+            weights[name.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+USER_WEIGHTS = _parse_weights(os.environ.get("CRAFTMCP_USER_WEIGHTS", ""))
+
+admission_rejections = Counter("craftmcp_admission_rejections_total", "Inference calls rejected by admission control", ("reason",))
+
+
+class _Waiter:
+
+    def __init__(self, user: str, mcp_id: int, mcp_limit: int):
+        self.user = user
+        self.mcp_id = mcp_id
+        self.mcp_limit = mcp_limit
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class AdmissionController:
+    # Concurrency limits per user, per MCP and overall, with a bounded queue
+    # served by start-time fair queueing: each dispatch advances the user's
+    # virtual time by 1/weight and the waiting user with the lowest virtual time goes next.
+
+    def __init__(self):
+        self.running = 0
+        self.running_by_user = {}
+        self.running_by_mcp = {}
+        self.queues = {}          # user -> deque of _Waiter
+        self.queued = 0
+        self.vtime = {}           # user -> virtual time
+        self.global_vtime = 0.0
+        self.service_time_s = 1.0  # EWMA of slot hold time, used for Retry-After
+
+
+    def _weight(self, user: str) -> float:
+        return USER_WEIGHTS.get(user, 1.0)
+
+
+    def _admissible(self, user: str, mcp_id: int, mcp_limit: int) -> bool:
+        return (self.running < MAX_CONCURRENT
+                and self.running_by_user.get(user, 0) < MAX_CONCURRENT_PER_USER
+                and self.running_by_mcp.get(mcp_id, 0) < mcp_limit)
+
+
+    def _start(self, user: str, mcp_id: int):
+        self.running += 1
+        self.running_by_user[user] = self.running_by_user.get(user, 0) + 1
+        self.running_by_mcp[mcp_id] = self.running_by_mcp.get(mcp_id, 0) + 1
+        start = max(self.vtime.get(user, 0.0), self.global_vtime)
+        self.global_vtime = start
+        self.vtime[user] = start + 1.0 / self._weight(user)
+
+
+    def _finish(self, user: str, mcp_id: int, held_s: float):
+        self.running -= 1
+        self.running_by_user[user] -= 1
+        if not self.running_by_user[user]:
+            del self.running_by_user[user]
+        self.running_by_mcp[mcp_id] -= 1
+        if not self.running_by_mcp[mcp_id]:
+            del self.running_by_mcp[mcp_id]
+        self.service_time_s = 0.9 * self.service_time_s + 0.1 * held_s
+
+
+    def _dispatch(self):
+        while self.queued:
+            candidates = []
+            for user, waiters in self.queues.items():
+                head = waiters[0]
+                if self._admissible(head.user, head.mcp_id, head.mcp_limit):
+                    candidates.append((max(self.vtime.get(user, 0.0), self.global_vtime), head.enqueued, user))
+            if not candidates:
+                return
+            _, _, user = min(candidates)
+            waiter = self._pop(user)
+            self._start(waiter.user, waiter.mcp_id)
+            waiter.future.set_result(True)
+
+
+    def _pop(self, user: str) -> _Waiter:
+        waiters = self.queues[user]
+        waiter = waiters.popleft()
+        if not waiters:
+            del self.queues[user]
+        self.queued -= 1
+        return waiter
+
+
+    def _remove(self, waiter: _Waiter):
+        waiters = self.queues.get(waiter.user)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            self.queued -= 1
+            if not waiters:
+                del self.queues[waiter.user]
+
+
+    def retry_after(self) -> int:
+        backlog = self.queued + 1
+        return max(1, math.ceil(backlog * self.service_time_s / max(MAX_CONCURRENT, 1)))
+
+
+    def _reject(self, reason: str, detail: str):
+        admission_rejections.inc((reason,))
+        raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+
+    @asynccontextmanager
+    async def slot(self, user: str, mcp_id: int, mcp_limit: int | None = None):
+        # mcp_limit comes from the MCP's limits.max_concurrency, falling back to the global default
+        mcp_limit = int(mcp_limit or MAX_CONCURRENT_PER_MCP)
+        # Fast path: nobody waiting for this user and all limits free
+        if user not in self.queues and self._admissible(user, mcp_id, mcp_limit):
+            self._start(user, mcp_id)
+        else:
+            if self.queued >= MAX_QUEUE:
+                self._reject("queue_full", "Inference queue is full, retry later")
+            if len(self.queues.get(user, ())) >= MAX_QUEUE_PER_USER:
+                self._reject("user_queue_full", "Too many queued inference calls for this user")
+
+            waiter = _Waiter(user, mcp_id, mcp_limit)
+            self.queues.setdefault(user, deque()).append(waiter)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), QUEUE_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                if not waiter.future.done():
+                    self._remove(waiter)
+                    self._reject("queue_timeout", "Timed out waiting for an inference slot")
+            except asyncio.CancelledError:
+                # Client went away: give the slot back if it was granted meanwhile
+                if waiter.future.done():
+                    self._finish(user, mcp_id, 0.0)
+                    self._dispatch()
+                else:
+                    self._remove(waiter)
+                raise
+
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._finish(user, mcp_id, time.monotonic() - started)
+            self._dispatch()
+
+
+admission = AdmissionController()
+
+
+@register_collector
+def _admission_gauges() -> list[str]:
+    lines = ["# HELP craftmcp_inference_running Inference calls holding a slot",
+             "# TYPE craftmcp_inference_running gauge",
+             f"craftmcp_inference_running {admission.running}",
+             "# HELP craftmcp_inference_queued Inference calls waiting for a slot",
+             "# TYPE craftmcp_inference_queued gauge",
+             f"craftmcp_inference_queued {admission.queued}"]
+    return lines
@@ -1,4 +1,6 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
+import asyncio
 from user_handler import router as user_router
 from mcp_handler import router as mcp_router
 from tool_handler import router as tool_router
@@ -7,9 +9,31 @@ from prompt_handler import router as prompt_router
 from library_handler import router as library_router
 from runtime_handler import router as runtime_router
 from inference_handler import router as inference_router
+from metrics_handler import router as metrics_router, MetricsMiddleware
+from tracing_handler import router as tracing_router, TracingMiddleware
+from profiling_handler import router as profiling_router
+from blob_handler import router as blob_router
+from supervisor_handler import supervisor_loop
+from logging_handler import RequestLogMiddleware
+from pool_handler import pool
+from response_handler import FastJSONResponse, CompressionMiddleware
 
 
-app = FastAPI(title="CraftMCP API", version="0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    supervisor = asyncio.create_task(supervisor_loop(pool))
+    evictor = asyncio.create_task(pool.evict_loop())
+    yield
+    evictor.cancel()
+    supervisor.cancel()
+    await pool.close()
+
+
+app = FastAPI(title="CraftMCP API", version="0.1", lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(RequestLogMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 # Register routers
@@ -20,4 +44,8 @@ app.include_router(resource_router)
 app.include_router(prompt_router)
 app.include_router(library_router)
 app.include_router(runtime_router)
-app.include_router(inference_router)
\ No newline at end of file
+app.include_router(inference_router)
+app.include_router(metrics_router)
+app.include_router(tracing_router)
+app.include_router(profiling_router)
+app.include_router(blob_router)
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import FileResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import tempfile
+import hashlib
+import asyncio
+import re
+import os
+from system_db_handler import SystemDBHandler
+
+
+router = APIRouter()
+db = SystemDBHandler()
+security = HTTPBearer()
+
+
+# Content-addressed store shared by the API and the MCP servers, which map blobs read-only
+BLOB_DIR = os.path.abspath(os.environ.get("CRAFTMCP_BLOB_DIR", "blobs"))
+BLOB_MAX_BYTES = int(os.environ.get("CRAFTMCP_BLOB_MAX_MB", "1024")) * 1024 * 1024
+DIGEST_RE = re.compile(r"^sha256:[0-9a-f]{64}$")
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _user(token: str):
+    user = db.fetch_records("users", f"token='{hash_token(token)}'")
+    if not user:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return user[0]
+
+
+def blob_path(digest: str) -> str:
+    # sha256:<hex> -> blobs/sha256/<hex[:2]>/<hex>
+    if not DIGEST_RE.match(digest):
+        raise HTTPException(status_code=400, detail="Invalid blob digest, expected sha256:<64 hex chars>")
+    algo, hexdigest = digest.split(":")
+    return os.path.join(BLOB_DIR, algo, hexdigest[:2], hexdigest)
+
+
+@router.post("/upload-blob")
+async def upload_blob(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    _user(credentials.credentials)
+
+    # The body is streamed to disk and hashed on the way, never held in memory
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=BLOB_DIR, prefix=".upload-")
+    sha, size = hashlib.sha256(), 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > BLOB_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Blob exceeds {BLOB_MAX_BYTES // (1024 * 1024)} MB")
+                sha.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty blob")
+
+        digest = f"sha256:{sha.hexdigest()}"
+        path = blob_path(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return {"status": "stored", "digest": digest, "ref": f"blob:{digest}", "size": size}
+
+
+@router.get("/blob/{digest}")
+def download_blob(digest: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    _user(credentials.credentials)
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return FileResponse(path, media_type="application/octet-stream", headers={"ETag": f'"{digest}"'})
+
+
+@router.delete("/blob/{digest}")
+def delete_blob(digest: str, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # Blobs are shared between users by content, only admins remove them
+    if not _user(credentials.credentials)[3]:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    os.remove(path)
+    return {"status": "deleted", "digest": digest}
@@ -0,0 +1,615 @@
+# Built-in tools an MCP enables by name through "builtins" in its metadata.
+# Each entry is plain Python rendered after the user tools and before the
+# runtime hooks, so blob references, tracing and profiling apply to it too.
+
+
+# CSV, JSON and NDJSON parsed as a stream from a blob reference (mmap) or
+# inline content. Rows are read one at a time and returned a page at a time,
+# or written to the blob store as NDJSON in bounded chunks, so memory stays
+# flat whatever the file size. Line formats also page by byte cursor.
+PARSE_STREAM_TOOL = '''
+import io as _craft_io
+import itertools as _craft_itertools
+import csv as _craft_csv
+import json as _craft_parse_json
+import codecs as _craft_codecs
+import asyncio as _craft_parse_asyncio
+
+_CRAFT_PARSE_FORMATS = ["csv", "json", "ndjson"]
+_CRAFT_PARSE_MAX_LIMIT = 10000
+_CRAFT_PARSE_CHUNK_ROWS = 1000
+_CRAFT_PARSE_READ_BYTES = 1 << 16
+
+
+def _craft_parse_bool(value):
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "1", "yes", "y", "t"):
+            return True
+        if lowered in ("false", "0", "no", "n", "f"):
+            return False
+        raise ValueError(value)
+    return bool(value)
+
+
+_CRAFT_PARSE_TYPES = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": _craft_parse_bool,
+    "json": lambda value: _craft_parse_json.loads(value) if isinstance(value, str) else value,
+}
+
+
+def _craft_parse_open(source):
+    if isinstance(source, str):
+        return _craft_io.BytesIO(source.encode())
+    source.seek(0)
+    return source
+
+
+def _craft_parse_csv_rows(f, cursor, delimiter):
+    header_line = f.readline().decode("utf-8-sig", "replace")
+    header = next(_craft_csv.reader([header_line], delimiter=delimiter), [])
+    if cursor:
+        f.seek(cursor)
+
+    def lines():
+        for line in iter(f.readline, b""):
+            yield line.decode("utf-8", "replace")
+
+    # csv pulls one line at a time, so tell() after a row is where the next one starts
+    for row in _craft_csv.reader(lines(), delimiter=delimiter):
+        if row:
+            yield dict(zip(header, row)), f.tell()
+
+
+def _craft_parse_ndjson_rows(f, cursor):
+    if cursor:
+        f.seek(cursor)
+    for line in iter(f.readline, b""):
+        line = line.strip()
+        if line:
+            yield _craft_parse_json.loads(line), f.tell()
+
+
+def _craft_parse_json_rows(f):
+    # Items of a top-level array are decoded one by one from a sliding window
+    decoder = _craft_parse_json.JSONDecoder()
+    text = _craft_codecs.getincrementaldecoder("utf-8-sig")("replace")
+    state = {"buf": "", "pos": 0, "eof": False, "read": _CRAFT_PARSE_READ_BYTES}
+
+    def fill():
+        chunk = f.read(state["read"])
+        state["eof"] = not chunk
+        state["buf"] = state["buf"][state["pos"]:] + text.decode(chunk, final=state["eof"])
+        state["pos"] = 0
+
+    def skip(chars):
+        while True:
+            buf, pos = state["buf"], state["pos"]
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            state["pos"] = pos
+            if pos < len(buf) or state["eof"]:
+                return
+            fill()
+
+    skip(" \\t\\r\\n")
+    if state["buf"][state["pos"]:state["pos"] + 1] != "[":
+        # A single document is one row
+        while not state["eof"]:
+            fill()
+        yield _craft_parse_json.loads(state["buf"][state["pos"]:]), None
+        return
+
+    state["pos"] += 1
+    while True:
+        skip(" \\t\\r\\n,")
+        buf, pos = state["buf"], state["pos"]
+        if pos >= len(buf):
+            raise ValueError("Unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if state["eof"]:
+                raise
+            end = None
+        # An item cut by the window (or a number that may continue) needs more input
+        if end is None or (end == len(buf) and not state["eof"]):
+            state["read"] *= 2
+            fill()
+            continue
+        state["pos"], state["read"] = end, _CRAFT_PARSE_READ_BYTES
+        yield value, None
+
+
+def _craft_parse_flatten(record):
+    out, stack = {}, [("", record)]
+    while stack:
+        name, value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend((f"{name}{key}_", item) for key, item in reversed(list(value.items())))
+        elif isinstance(value, list):
+            stack.extend((f"{name}{i}_", item) for i, item in reversed(list(enumerate(value))))
+        else:
+            out[name[:-1]] = value
+    return out
+
+
+def _craft_parse_records(source, file_type, columns, types, offset, cursor, delimiter, flatten, stats):
+    f = _craft_parse_open(source)
+    if file_type == "csv":
+        rows = _craft_parse_csv_rows(f, cursor, delimiter)
+    elif file_type == "ndjson":
+        rows = _craft_parse_ndjson_rows(f, cursor)
+    else:
+        rows = _craft_parse_json_rows(f)
+
+    converters = {key: _CRAFT_PARSE_TYPES[kind] for key, kind in (types or {}).items()}
+    for record, position in _craft_itertools.islice(rows, offset, None):
+        if not isinstance(record, dict):
+            record = {"value": record}
+        elif flatten:
+            record = _craft_parse_flatten(record)
+        if columns:
+            record = {key: record.get(key) for key in columns}
+        for key, convert in converters.items():
+            value = record.get(key)
+            if value is None or value == "":
+                if key in record:
+                    record[key] = None
+                continue
+            try:
+                record[key] = convert(value)
+            except (ValueError, TypeError):
+                record[key] = None
+                stats["conversion_errors"] += 1
+        yield record, position
+
+
+def _craft_parse_stream(source, file_type, columns, types, offset, limit, cursor, delimiter, flatten, output):
+    if file_type not in _CRAFT_PARSE_FORMATS:
+        raise ValueError(f"file_type must be one of {', '.join(_CRAFT_PARSE_FORMATS)}")
+    unknown = sorted(set((types or {}).values()) - set(_CRAFT_PARSE_TYPES))
+    if unknown:
+        raise ValueError(f"Unknown type(s) {', '.join(unknown)}, use one of {', '.join(_CRAFT_PARSE_TYPES)}")
+    if cursor and file_type == "json":
+        raise ValueError("cursor is only supported for csv and ndjson, page json with offset")
+    if output not in ("page", "blob"):
+        raise ValueError("output must be 'page' or 'blob'")
+    if output == "page" and not 0 < limit <= _CRAFT_PARSE_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {_CRAFT_PARSE_MAX_LIMIT}")
+
+    stats = {"conversion_errors": 0}
+    records = _craft_parse_records(source, file_type, columns, types, offset, cursor, delimiter, flatten, stats)
+
+    if output == "blob":
+        writer, count = CraftBlobWriter(), 0
+        try:
+            while True:
+                chunk = [record for record, _ in _craft_itertools.islice(records, _CRAFT_PARSE_CHUNK_ROWS)]
+                if not chunk:
+                    break
+                writer.write("".join(_craft_parse_json.dumps(row, default=str) + "\\n" for row in chunk))
+                count += len(chunk)
+        except BaseException:
+            writer.discard()
+            raise
+        return {"ref": writer.close(), "format": "ndjson", "count": count, "conversion_errors": stats["conversion_errors"]}
+
+    rows, position = [], None
+    for record, position in _craft_itertools.islice(records, limit):
+        rows.append(record)
+    # Peeking one more row tells whether this page is the last
+    more = next(records, None) is not None
+    return {
+        "rows": rows,
+        "count": len(rows),
+        "offset": offset,
+        "next_offset": offset + len(rows) if more else None,
+        "next_cursor": position if more else None,
+        "conversion_errors": stats["conversion_errors"],
+    }
+
+
+@mcp.tool()
+async def parse_stream(source: str, file_type: str = "csv", columns: list[str] | None = None,
+                       types: dict[str, str] | None = None, offset: int = 0, limit: int = 1000,
+                       cursor: int | None = None, delimiter: str = ",", flatten: bool = False,
+                       output: str = "page") -> dict:
+    """Parse CSV, JSON (array or single document) or NDJSON as a stream.
+
+    source is a blob reference (blob:sha256:...) or inline content. columns keeps only
+    those fields, types converts fields to str, int, float, bool or json (failures become
+    null and are counted). Returns up to limit rows after offset, with next_offset and,
+    for csv and ndjson, a byte next_cursor to continue from. output="blob" writes every
+    row as NDJSON to the blob store and returns its reference instead.
+    """
+    return await _craft_parse_asyncio.to_thread(_craft_parse_stream, source, file_type, columns, types,
+                                                offset, limit, cursor, delimiter, flatten, output)
+'''
+
+
+
+# Batched embeddings from an Ollama (/api/embed) or OpenAI-compatible
+# (/v1/embeddings) endpoint. Texts are grouped by count and size, sent with
+# bounded concurrency over the shared HTTP client (craft_http), and returned
+# as one float32 matrix, base64 encoded or stored as a blob, instead of nested
+# JSON lists. The endpoint is the EMBED_URL global of the MCP, else
+# CRAFTMCP_EMBED_URL, else a local Ollama.
+EMBED_TEXTS_TOOL = '''
+import os as _craft_embed_os
+import base64 as _craft_base64
+import asyncio as _craft_embed_asyncio
+import numpy as _craft_np
+
+_CRAFT_EMBED_DEFAULT_URL = "http://localhost:11434/api/embed"
+_CRAFT_EMBED_MAX_BATCH = 512
+_CRAFT_EMBED_MAX_CONCURRENCY = 32
+# Long texts make smaller batches, so one request never carries megabytes of input
+_CRAFT_EMBED_MAX_BATCH_CHARS = 64000
+
+
+def _craft_embed_batches(texts, batch_size):
+    start, batch, chars = 0, [], 0
+    for i, text in enumerate(texts):
+        if batch and (len(batch) == batch_size or chars + len(text) > _CRAFT_EMBED_MAX_BATCH_CHARS):
+            yield start, batch
+            start, batch, chars = i, [], 0
+        batch.append(text)
+        chars += len(text)
+    if batch:
+        yield start, batch
+
+
+async def _craft_embed_request(url, model, texts):
+    response = await craft_http.post(url, json={"model": model, "input": texts}, timeout=120.0)
+    if response.status_code == 413 and len(texts) > 1:
+        # Too large for the endpoint, halve the batch
+        middle = len(texts) // 2
+        first, second = await _craft_embed_asyncio.gather(_craft_embed_request(url, model, texts[:middle]),
+                                                          _craft_embed_request(url, model, texts[middle:]))
+        return _craft_np.concatenate([first, second])
+    response.raise_for_status()
+    body = response.json()
+    if "embeddings" in body:
+        vectors = body["embeddings"]
+    else:
+        vectors = [item["embedding"] for item in sorted(body["data"], key=lambda item: item["index"])]
+    if len(vectors) != len(texts):
+        raise ValueError(f"Endpoint returned {len(vectors)} embeddings for {len(texts)} texts")
+    return _craft_np.asarray(vectors, dtype=_craft_np.float32)
+
+
+@mcp.tool()
+async def embed_texts(texts: list[str], model: str, batch_size: int = 64, concurrency: int = 4,
+                      normalize: bool = False, output: str = "base64") -> dict:
+    """Embed a list of texts in batches and return one float32 matrix.
+
+    Rows follow the order of texts. normalize scales rows to unit length for cosine search.
+    output="base64" returns the little-endian float32 bytes base64 encoded in data,
+    output="blob" stores them in the blob store and returns ref. Both come with shape.
+    """
+    if not 0 < batch_size <= _CRAFT_EMBED_MAX_BATCH:
+        raise ValueError(f"batch_size must be between 1 and {_CRAFT_EMBED_MAX_BATCH}")
+    if not 0 < concurrency <= _CRAFT_EMBED_MAX_CONCURRENCY:
+        raise ValueError(f"concurrency must be between 1 and {_CRAFT_EMBED_MAX_CONCURRENCY}")
+    if output not in ("base64", "blob"):
+        raise ValueError("output must be 'base64' or 'blob'")
+
+    url = globals().get("EMBED_URL") or _craft_embed_os.environ.get("CRAFTMCP_EMBED_URL") or _CRAFT_EMBED_DEFAULT_URL
+    semaphore = _craft_embed_asyncio.Semaphore(concurrency)
+    parts = {}
+
+    async def run(start, batch):
+        async with semaphore:
+            parts[start] = await _craft_embed_request(url, model, batch)
+
+    await _craft_embed_asyncio.gather(*[run(start, batch) for start, batch in _craft_embed_batches(texts, batch_size)])
+    matrix = (_craft_np.concatenate([parts[start] for start in sorted(parts)]) if parts
+              else _craft_np.empty((0, 0), dtype=_craft_np.float32))
+    if normalize and matrix.size:
+        norms = _craft_np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / _craft_np.where(norms == 0, 1, norms)
+
+    data = matrix.astype("<f4", copy=False).tobytes()
+    result = {"dtype": "float32", "byteorder": "little", "shape": list(matrix.shape)}
+    if output == "blob" and data:
+        return {**result, "ref": craft_blob_put(data)}
+    return {**result, "data": _craft_base64.b64encode(data).decode()}
+'''
+
+
+# Local vector store kept outside the MCP folder, which /stop-mcp and a failed
+# /run-mcp delete, under CRAFTMCP_VECTOR_DIR/mcp_<id>, one directory per collection:
+# unit-length float32 rows appended to vectors.f32 and memory-mapped for
+# search, and an append-only log.jsonl mapping ids (and documents) to rows.
+# Queries scan the matrix in blocks with a NumPy dot product and top-k
+# selection. Writers from several processes serialize on a file lock, readers
+# pick up new log lines incrementally.
+VECTOR_INDEX_TOOL = '''
+import os as _craft_vec_os
+import re as _craft_vec_re
+import json as _craft_vec_json
+import fcntl as _craft_fcntl
+import base64 as _craft_vec_base64
+import asyncio as _craft_vec_asyncio
+import threading as _craft_vec_threading
+import numpy as _craft_vec_np
+
+# Vector store
+_CRAFT_VEC_NAME = _craft_vec_re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]{0,63}$")
+_CRAFT_VEC_BLOCK_ROWS = 65536
+_CRAFT_VEC_MAX_K = 1000
+_craft_vec_lock = _craft_vec_threading.Lock()
+_craft_vec_collections = {}
+
+
+class _CraftVectorCollection:
+
+    def __init__(self, name):
+        self.folder = _craft_vec_os.path.join(_CRAFT_VEC_DIR, name)
+        self.lock = _craft_vec_threading.Lock()
+        self.dim = None
+        self.ids = []           # row -> id, None once replaced or deleted
+        self.offsets = []       # row -> offset of its log line, where the document is
+        self.index = {}         # id -> live row
+        self.live = _craft_vec_np.zeros(0, dtype=bool)
+        self.log_size = 0
+        self.matrix = None
+
+    def _path(self, name):
+        return _craft_vec_os.path.join(self.folder, name)
+
+    def refresh(self):
+        # Applies log lines appended since the last call, by this process or another one
+        if self.dim is None:
+            if not _craft_vec_os.path.exists(self._path("meta.json")):
+                return
+            with open(self._path("meta.json")) as f:
+                self.dim = _craft_vec_json.load(f)["dim"]
+        log = self._path("log.jsonl")
+        if not _craft_vec_os.path.exists(log) or _craft_vec_os.path.getsize(log) == self.log_size:
+            return
+        with open(log, "rb") as f:
+            f.seek(self.log_size)
+            offset = self.log_size
+            for line in f:
+                if not line.endswith(b"\\n"):
+                    break
+                event = _craft_vec_json.loads(line)
+                old = self.index.pop(event["id"], None)
+                if old is not None:
+                    self.ids[old] = None
+                    self.live[old] = False
+                if not event.get("deleted"):
+                    row = event["row"]
+                    # Rows of a write that never reached the log stay empty
+                    while len(self.ids) <= row:
+                        self.ids.append(None)
+                        self.offsets.append(None)
+                    if len(self.live) < len(self.ids):
+                        grown = _craft_vec_np.zeros(max(len(self.ids), 2 * len(self.live), 1024), dtype=bool)
+                        grown[:len(self.live)] = self.live
+                        self.live = grown
+                    self.ids[row], self.offsets[row] = event["id"], offset
+                    self.index[event["id"]] = row
+                    self.live[row] = True
+                offset += len(line)
+        self.log_size = offset
+        if self.ids:
+            self.matrix = _craft_vec_np.memmap(self._path("vectors.f32"), dtype="<f4", mode="r", shape=(len(self.ids), self.dim))
+
+    def _locked(self):
+        _craft_vec_os.makedirs(self.folder, exist_ok=True)
+        f = open(self._path(".lock"), "w")
+        _craft_fcntl.flock(f, _craft_fcntl.LOCK_EX)
+        return f
+
+    def upsert(self, ids, vectors, documents):
+        with self._locked():
+            self.refresh()
+            if self.dim is None:
+                with open(self._path("meta.json"), "w") as f:
+                    _craft_vec_json.dump({"dim": vectors.shape[1]}, f)
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Collection has dimension {self.dim}, got {vectors.shape[1]}")
+            row_bytes = 4 * self.dim
+            with open(self._path("vectors.f32"), "ab") as f:
+                # A partial row left by a crashed writer is dropped, the log never points at it
+                start = f.tell() // row_bytes
+                f.truncate(start * row_bytes)
+                f.seek(start * row_bytes)
+                f.write(vectors.astype("<f4", copy=False).tobytes())
+            lines = []
+            for i, vector_id in enumerate(ids):
+                event = {"id": vector_id, "row": start + i}
+                if documents is not None:
+                    event["document"] = documents[i]
+                lines.append(_craft_vec_json.dumps(event) + "\\n")
+            with open(self._path("log.jsonl"), "a") as f:
+                f.write("".join(lines))
+            self.refresh()
+
+    def delete(self, ids):
+        with self._locked():
+            self.refresh()
+            known = [vector_id for vector_id in ids if vector_id in self.index]
+            if known:
+                with open(self._path("log.jsonl"), "a") as f:
+                    f.write("".join(_craft_vec_json.dumps({"id": vector_id, "deleted": True}) + "\\n" for vector_id in known))
+            self.refresh()
+        return len(known)
+
+    def query(self, queries, k):
+        self.refresh()
+        if self.matrix is None or not self.index:
+            return [[] for _ in queries]
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Collection has dimension {self.dim}, got {queries.shape[1]}")
+        # Best k rows per query so far, merged block by block so memory stays bounded
+        best_rows = _craft_vec_np.empty((0, len(queries)), dtype=_craft_vec_np.int64)
+        best_scores = _craft_vec_np.empty((0, len(queries)), dtype=_craft_vec_np.float32)
+        for start in range(0, len(self.matrix), _CRAFT_VEC_BLOCK_ROWS):
+            block = self.matrix[start:start + _CRAFT_VEC_BLOCK_ROWS]
+            scores = block @ queries.T
+            scores[~self.live[start:start + len(block)]] = -_craft_vec_np.inf
+            if len(block) > k:
+                top = _craft_vec_np.argpartition(-scores, k - 1, axis=0)[:k]
+                scores = _craft_vec_np.take_along_axis(scores, top, axis=0)
+                rows = top + start
+            else:
+                rows = _craft_vec_np.arange(start, start + len(block))[:, None].repeat(len(queries), axis=1)
+            best_rows = _craft_vec_np.concatenate([best_rows, rows])
+            best_scores = _craft_vec_np.concatenate([best_scores, scores])
+            if len(best_scores) > k:
+                top = _craft_vec_np.argpartition(-best_scores, k - 1, axis=0)[:k]
+                best_rows = _craft_vec_np.take_along_axis(best_rows, top, axis=0)
+                best_scores = _craft_vec_np.take_along_axis(best_scores, top, axis=0)
+        order = _craft_vec_np.argsort(-best_scores, axis=0, kind="stable")
+        best_rows = _craft_vec_np.take_along_axis(best_rows, order, axis=0)
+        best_scores = _craft_vec_np.take_along_axis(best_scores, order, axis=0)
+        return [[(int(row), float(score)) for row, score in zip(best_rows[:, q], best_scores[:, q]) if score != -_craft_vec_np.inf]
+                for q in range(len(queries))]
+
+    def document(self, row):
+        with open(self._path("log.jsonl"), "rb") as f:
+            f.seek(self.offsets[row])
+            return _craft_vec_json.loads(f.readline()).get("document")
+
+
+def _craft_vec_collection(name):
+    if not _CRAFT_VEC_NAME.match(name):
+        raise ValueError("collection must be 1 to 64 letters, digits, '_', '-' or '.', not starting with '.' or '-'")
+    with _craft_vec_lock:
+        collection = _craft_vec_collections.get(name)
+        if collection is None:
+            collection = _craft_vec_collections[name] = _CraftVectorCollection(name)
+    return collection
+
+
+def _craft_vec_matrix(embeddings):
+    # Lists of floats, or the float32 matrix returned by embed_texts (data or ref)
+    if isinstance(embeddings, dict):
+        if "ref" in embeddings:
+            # Only well-formed digests map to a path in the blob store
+            match = _CRAFT_BLOB_REF.match(embeddings["ref"]) if isinstance(embeddings["ref"], str) else None
+            if not match:
+                raise ValueError("ref must be a blob reference, blob:sha256:<64 hex chars>")
+            raw = CraftBlob(match.group(1))
+        else:
+            raw = _craft_vec_base64.b64decode(embeddings["data"])
+        matrix = _craft_vec_np.frombuffer(raw, dtype="<f4").reshape(embeddings["shape"])
+    else:
+        matrix = _craft_vec_np.asarray(embeddings, dtype=_craft_vec_np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    if matrix.ndim != 2 or not matrix.shape[1]:
+        raise ValueError("embeddings must be a vector or a list of vectors")
+    # Unit length, so the dot product is the cosine similarity
+    norms = _craft_vec_np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / _craft_vec_np.where(norms == 0, 1, norms)).astype(_craft_vec_np.float32)
+
+
+def _craft_vec_upsert(collection, ids, embeddings, documents):
+    vectors = _craft_vec_matrix(embeddings)
+    if len(ids) != len(vectors):
+        raise ValueError(f"Got {len(ids)} ids for {len(vectors)} embeddings")
+    if len(set(ids)) != len(ids):
+        raise ValueError("ids must be unique")
+    if documents is not None and len(documents) != len(ids):
+        raise ValueError(f"Got {len(documents)} documents for {len(ids)} ids")
+    store = _craft_vec_collection(collection)
+    with store.lock:
+        store.upsert(ids, vectors, documents)
+        return {"collection": collection, "upserted": len(ids), "count": len(store.index), "dim": store.dim}
+
+
+def _craft_vec_query(collection, embeddings, k, include_documents):
+    if not 0 < k <= _CRAFT_VEC_MAX_K:
+        raise ValueError(f"k must be between 1 and {_CRAFT_VEC_MAX_K}")
+    queries = _craft_vec_matrix(embeddings)
+    store = _craft_vec_collection(collection)
+    with store.lock:
+        results = []
+        for matches in store.query(queries, k):
+            results.append([{"id": store.ids[row], "score": round(score, 6),
+                             **({"document": store.document(row)} if include_documents else {})}
+                            for row, score in matches])
+        return {"collection": collection, "results": results}
+
+
+def _craft_vec_delete(collection, ids):
+    store = _craft_vec_collection(collection)
+    with store.lock:
+        deleted = store.delete(ids)
+        return {"collection": collection, "deleted": deleted, "count": len(store.index)}
+
+
+@mcp.tool()
+async def vector_upsert(collection: str, ids: list[str], embeddings: list[list[float]] | dict,
+                        documents: list[str] | None = None) -> dict:
+    """Store embeddings under ids in a local collection, replacing existing ids.
+
+    embeddings is a list of vectors or the result of embed_texts. documents, when given,
+    are stored alongside and returned by vector_query.
+    """
+    return await _craft_vec_asyncio.to_thread(_craft_vec_upsert, collection, ids, embeddings, documents)
+
+
+@mcp.tool()
+async def vector_query(collection: str, embeddings: list[list[float]] | list[float] | dict, k: int = 5,
+                       include_documents: bool = True) -> dict:
+    """Return the k most similar stored vectors (cosine) for each query vector."""
+    return await _craft_vec_asyncio.to_thread(_craft_vec_query, collection, embeddings, k, include_documents)
+
+
+@mcp.tool()
+async def vector_delete(collection: str, ids: list[str]) -> dict:
+    """Remove ids from a local collection."""
+    return await _craft_vec_asyncio.to_thread(_craft_vec_delete, collection, ids)
+'''
+
+
+BUILTIN_TOOLS = {
+    "parse_stream": PARSE_STREAM_TOOL,
+    "embed_texts": EMBED_TEXTS_TOOL,
+    "vector_index": VECTOR_INDEX_TOOL,
+}
+
+# Packages each built-in imports, /run-mcp installs them in the server's environment
+BUILTIN_DEPENDENCIES = {
+    "parse_stream": [],
+    "embed_texts": ["numpy"],
+    "vector_index": ["numpy"],
+}
+
+
+def validate_builtins(builtins: list) -> list:
+    unknown = [name for name in builtins if name not in BUILTIN_TOOLS]
+    if unknown:
+        raise ValueError(f"Unknown built-in tool(s): {', '.join(unknown)}, available: {', '.join(BUILTIN_TOOLS)}")
+    return builtins
+
+
+def builtin_dependencies(mcp_metadata: dict) -> list[str]:
+    packages = []
+    for name in mcp_metadata.get("builtins", []):
+        packages += [package for package in BUILTIN_DEPENDENCIES[name] if package not in packages]
+    return packages
+
+
+def render_builtins(mcp_metadata: dict, mcp_id: int = 0, vector_dir: str = "vectors") -> str:
+    blocks = []
+    for name in mcp_metadata.get("builtins", []):
+        block = BUILTIN_TOOLS[name]
+        if name == "vector_index":
+            # Absolute, the server runs from its own folder
+            block = block.replace("# Vector store\n", "# Vector store\n_CRAFT_VEC_DIR = _craft_vec_os.path.join("
+                                  f"_craft_vec_os.environ.get(\"CRAFTMCP_VECTOR_DIR\", {vector_dir!r}), \"mcp_{int(mcp_id)}\")\n", 1)
+        blocks.append(block.strip("\n"))
+    return "\n\n\n".join(blocks)
@@ -0,0 +1,36 @@
+import asyncio
+import json
+import os
+from metrics_handler import cache_hit, cache_miss
+
+
+# Set to 0 to run every call separately, regardless of tool settings
+COALESCE_ENABLED = os.environ.get("CRAFTMCP_COALESCE", "1") != "0"
+
+
+def call_key(mcp_id: int, type_: str, name: str, arguments: dict) -> str:
+    return json.dumps([mcp_id, type_, name, arguments], sort_keys=True, separators=(",", ":"), default=str)
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution. The execution runs in its
+    # own task so a caller that goes away does not cancel it for the others.
+
+    def __init__(self):
+        self.inflight = {}          # key -> asyncio.Task
+
+
+    async def run(self, key: str, fn):
+        task = self.inflight.get(key)
+        if task is not None:
+            cache_hit("coalesce")
+            return await asyncio.shield(task)
+
+        cache_miss("coalesce")
+        task = asyncio.create_task(fn())
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,1042 @@
+# Runtime hooks appended to generated MCP servers by /export-full-mcp.
+# Each hook is plain Python appended after the tools, resources and prompts
+# so the exported file stays a single standalone module.
+
+from urllib.parse import urlsplit
+import keyword
+import ast
+import textwrap
+
+
+HOOK_IMPORTS = '''
+import os as _craft_os
+import json as _craft_json
+import time as _craft_time
+import secrets as _craft_secrets
+import inspect as _craft_inspect
+import functools as _craft_functools
+'''
+
+
+def validate_imports(imports: list[str]) -> list[str]:
+    for statement in imports:
+        try:
+            compile(statement, "<import>", "exec")
+        except SyntaxError as e:
+            raise ValueError(f"Invalid import {statement!r}: {e.msg}")
+    return imports
+
+
+def validate_globals(globals_: dict) -> dict:
+    for name in globals_:
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError(f"Invalid global name: {name}")
+    return globals_
+
+
+def render_globals(globals_: dict) -> str:
+    # Python literals, JSON's true, false and null would be undefined names in the server
+    return "\n".join(f"{name} = {value!r}" for name, value in globals_.items())
+
+
+def render_signature(params: dict) -> str:
+    # Names, types and defaults go through the ast module so they are parsed, not pasted
+    rendered, has_default = [], False
+    for name, spec in params.items():
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ValueError(f"Invalid parameter name: {name}")
+        type_str = spec.get("type", "str") if isinstance(spec, dict) else spec
+        try:
+            annotation = ast.unparse(ast.parse(type_str, mode="eval").body)
+        except (SyntaxError, TypeError, ValueError):
+            raise ValueError(f"Invalid type for parameter {name}: {type_str}")
+        if isinstance(spec, dict):
+            # Parameters given as an object are optional, None unless a default is set
+            default = ast.unparse(ast.parse(repr(spec.get("default")), mode="eval").body)
+            rendered.append(f"{name}: {annotation} = {default}")
+            has_default = True
+        elif has_default:
+            raise ValueError(f"Parameter {name} has no default but follows one that has")
+        else:
+            rendered.append(f"{name}: {annotation}")
+    return ", ".join(rendered)
+
+
+def render_component(kind: str, metadata: dict) -> str:
+    # Source of one tool, prompt or resource from its stored metadata. Compiled here,
+    # so a broken snippet is rejected when it is saved rather than when the server starts.
+    name = metadata[f"{kind}_name"]
+    if not name.isidentifier() or keyword.iskeyword(name):
+        raise ValueError(f"Invalid {kind} name: {name}")
+    decorator = f"@mcp.resource({metadata['path_template']!r})" if kind == "resource" else f"@mcp.{kind}()"
+    fn_def = "async def" if metadata.get("is_async") else "def"
+    code = f"{decorator}\n{fn_def} {name}({render_signature(metadata.get('params', {}))}) -> str:\n    {metadata['snippet'].strip()}\n"
+    try:
+        compile(code, f"<{kind} {name}>", "exec")
+    except SyntaxError as e:
+        # The snippet starts on the third line, after the decorator and the def
+        raise ValueError(f"{kind.capitalize()} {name} does not compile: {e.msg} (snippet line {max((e.lineno or 3) - 2, 1)})")
+    return code
+
+
+EXECUTION_MODES = ["inline", "thread", "process"]
+POOL_DEFAULTS = {"threads": 4, "processes": 2}
+
+
+def validate_pools(pools: dict) -> dict:
+    unknown = [k for k in pools if k not in POOL_DEFAULTS]
+    if unknown:
+        raise ValueError(f"Unknown pool setting(s): {', '.join(unknown)}")
+    for key, value in pools.items():
+        if not isinstance(value, int) or not 0 < value <= 64:
+            raise ValueError(f"{key} must be between 1 and 64")
+    return pools
+
+
+HTTP_DEFAULTS = {"timeout_s": 30.0, "connect_timeout_s": 5.0, "max_connections": 100,
+                 "max_keepalive": 20, "max_per_host": 10, "http2": True}
+
+
+def validate_http(http: dict) -> dict:
+    unknown = [k for k in http if k not in HTTP_DEFAULTS]
+    if unknown:
+        raise ValueError(f"Unknown http setting(s): {', '.join(unknown)}")
+    for key, value in http.items():
+        if key == "http2":
+            if not isinstance(value, bool):
+                raise ValueError("http2 must be true or false")
+        elif not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            raise ValueError(f"{key} must be a positive number")
+    return http
+
+
+RATE_DEFAULTS = {"per_s": 1.0, "max_wait_s": 60.0, "retries": 3}
+
+
+def validate_rate_limits(rate_limits: dict) -> dict:
+    # Keyed by the name of a global holding the API key, e.g. {"VT_API_KEY": {"rate": 4, "per_s": 60}}
+    for name, limit in rate_limits.items():
+        if not name.isidentifier():
+            raise ValueError(f"Rate limit key must be the name of a global: {name}")
+        if not isinstance(limit, dict):
+            raise ValueError(f"Rate limit of {name} must be an object, e.g. {{'rate': 4, 'per_s': 60}}")
+        unknown = [k for k in limit if k not in ("rate", "burst", *RATE_DEFAULTS)]
+        if unknown:
+            raise ValueError(f"Unknown rate limit setting(s) for {name}: {', '.join(unknown)}")
+        if "rate" not in limit:
+            raise ValueError(f"Rate limit of {name} needs a rate")
+        for key, value in limit.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                raise ValueError(f"{name}.{key} must be a number")
+        for key in ("rate", "per_s"):
+            if key in limit and limit[key] <= 0:
+                raise ValueError(f"{name}.{key} must be positive")
+        if limit.get("burst", 1) < 1:
+            raise ValueError(f"{name}.burst must be at least 1")
+        if limit.get("max_wait_s", 0) < 0:
+            raise ValueError(f"{name}.max_wait_s must not be negative")
+        if not isinstance(limit.get("retries", 0), int) or not 0 <= limit.get("retries", 0) <= 10:
+            raise ValueError(f"{name}.retries must be an integer between 0 and 10")
+    return rate_limits
+
+
+def validate_lifespan(startup: str, shutdown: str, context: dict) -> dict:
+    # Snippets are bodies of async functions taking the shared context
+    for label, snippet in (("startup", startup), ("shutdown", shutdown)):
+        try:
+            compile(_async_body("_craft_check", snippet), f"<{label}>", "exec")
+        except SyntaxError as e:
+            raise ValueError(f"{label} is not valid Python: {e.msg} (line {(e.lineno or 2) - 1})")
+    for name, type_str in context.items():
+        if not name.isidentifier() or keyword.iskeyword(name) or name.startswith("_"):
+            raise ValueError(f"Invalid context field name: {name}")
+        if not isinstance(type_str, str):
+            raise ValueError(f"Type of context field {name} must be a string, e.g. 'httpx.AsyncClient'")
+        try:
+            compile(type_str, f"<context {name}>", "eval")
+        except SyntaxError:
+            raise ValueError(f"Invalid type for context field {name}: {type_str}")
+    return context
+
+
+def _async_body(name: str, snippet: str) -> str:
+    body = textwrap.indent(textwrap.dedent(snippet).strip("\n"), "    ") if snippet.strip() else "    pass"
+    return f"async def {name}(shared):\n{body}"
+
+
+# Stand-ins for the MCP's plain "import x" statements when "lazy_imports" is on.
+# The real module is imported on the first attribute access, usually inside the
+# first tool call that needs it, and its namespace is copied in so later lookups
+# cost the same as on the module itself.
+LAZY_IMPORT_HOOK = '''
+# Lazy imports
+import types as _craft_types
+import importlib as _craft_importlib
+import threading as _craft_lazy_threading
+
+
+class _CraftLazyModule(_craft_types.ModuleType):
+
+    def __init__(self, name, targets):
+        super().__init__(name)
+        self._craft_targets = targets    # "a.b" and "a.c" for "import a.b, a.c"
+        self._craft_lock = _craft_lazy_threading.Lock()
+
+    def __getattr__(self, attr):
+        if attr.startswith("_craft_"):
+            raise AttributeError(attr)
+        with self._craft_lock:
+            if "_craft_module" not in self.__dict__:
+                for target in self._craft_targets:
+                    _craft_importlib.import_module(target)
+                module = _craft_importlib.import_module(self.__name__)
+                self.__dict__.update(module.__dict__)
+                self.__dict__["_craft_module"] = module
+        return getattr(self.__dict__["_craft_module"], attr)
+
+
+def _craft_lazy_module(name, *targets):
+    return _CraftLazyModule(name, targets or (name,))
+'''
+
+
+def render_imports(mcp_metadata: dict) -> str:
+    # "from x import y" needs the object itself and stays eager, like any statement
+    # that is not only plain imports
+    imports = mcp_metadata.get("imports", [])
+    if not mcp_metadata.get("lazy_imports"):
+        return "\n".join(imports)
+    lines, proxies = [], {}
+    for statement in imports:
+        tree = ast.parse(statement)
+        if not tree.body or not all(isinstance(node, ast.Import) for node in tree.body):
+            lines.append(statement)
+            continue
+        for node in tree.body:
+            for alias in node.names:
+                # "import a.b" binds a and must load a.b, "import a.b as c" binds the submodule
+                bound, module = (alias.asname, alias.name) if alias.asname else (alias.name.split(".")[0],) * 2
+                if bound not in proxies:
+                    proxies[bound] = (module, [])
+                    lines.append(bound)
+                proxies[bound][1].append(alias.name)
+    rendered = []
+    for line in lines:
+        if line in proxies:
+            module, targets = proxies[line]
+            line = f"{line} = _craft_lazy_module({', '.join(repr(name) for name in (module, *dict.fromkeys(targets)))})"
+        rendered.append(line)
+    return LAZY_IMPORT_HOOK.strip("\n") + "\n\n" + "\n".join(rendered)
+
+
+# Runs sync tools marked "thread" or "process" on bounded pools so a slow body
+# does not block the server's event loop. Rendered with the tool policies and
+# pool sizes under its header. Process workers are spawned, they re-import
+# this file as __mp_main__ and look the tool function up by name.
+EXECUTION_HOOK = '''
+# Execution policies
+import asyncio as _craft_asyncio
+import multiprocessing as _craft_mp
+import concurrent.futures as _craft_futures
+
+_craft_pools = {}
+
+
+def _craft_pool(kind):
+    pool = _craft_pools.get(kind)
+    if pool is None:
+        if kind == "thread":
+            pool = _craft_futures.ThreadPoolExecutor(max_workers=_CRAFT_POOL_SIZES["threads"], thread_name_prefix="craft-tool")
+        else:
+            pool = _craft_futures.ProcessPoolExecutor(max_workers=_CRAFT_POOL_SIZES["processes"], mp_context=_craft_mp.get_context("spawn"))
+        _craft_pools[kind] = pool
+    return pool
+
+
+def _craft_offloaded(fn, kind):
+    @_craft_functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        loop = _craft_asyncio.get_running_loop()
+        return await loop.run_in_executor(_craft_pool(kind), _craft_functools.partial(fn, *args, **kwargs))
+    return wrapper
+
+
+# Only the server itself offloads, not pool workers or the API's in-process workers
+if __name__ == "__main__":
+    for _craft_tool in mcp._tool_manager.list_tools():
+        _craft_kind = _CRAFT_EXECUTION.get(_craft_tool.name, "inline")
+        if _craft_kind != "inline" and not _craft_tool.is_async:
+            _craft_tool.fn = _craft_offloaded(_craft_tool.fn, _craft_kind)
+            _craft_tool.is_async = True
+'''
+
+
+# Replaces "blob:sha256:<hex>" arguments (top level or inside a list) with a
+# read-only mmap of the blob, so large inputs never travel through JSON-RPC.
+# Placed outside the execution hook: a CraftBlob pickles as its digest and is
+# mapped again in process workers. craft_blob_put and CraftBlobWriter store
+# tool output.
+BLOB_HOOK = '''
+# Blob references
+import re as _craft_re
+import mmap as _craft_mmap
+import hashlib as _craft_hashlib
+import tempfile as _craft_tempfile
+
+_CRAFT_BLOB_REF = _craft_re.compile(r"^blob:(sha256:[0-9a-f]{64})$")
+
+
+def _craft_blob_path(digest):
+    algo, hexdigest = digest.split(":")
+    return _craft_os.path.join(_CRAFT_BLOB_DIR, algo, hexdigest[:2], hexdigest)
+
+
+class _CraftEmptyBlob(bytes):
+    # An empty file cannot be mapped, zero-byte blobs are empty bytes with the reader methods used on a CraftBlob
+    def __new__(cls, digest):
+        blob = super().__new__(cls)
+        blob.digest = digest
+        return blob
+
+    def __reduce__(self):
+        return (CraftBlob, (self.digest,))
+
+    def read(self, n=-1):
+        return b""
+
+    def readline(self):
+        return b""
+
+    def close(self):
+        pass
+
+
+class CraftBlob(_craft_mmap.mmap):
+    def __new__(cls, digest):
+        with open(_craft_blob_path(digest), "rb") as f:
+            if _craft_os.fstat(f.fileno()).st_size == 0:
+                return _CraftEmptyBlob(digest)
+            blob = super().__new__(cls, f.fileno(), 0, access=_craft_mmap.ACCESS_READ)
+        blob.digest = digest
+        return blob
+
+    def __reduce__(self):
+        return (CraftBlob, (self.digest,))
+
+
+class CraftBlobWriter:
+    # Streams bytes into the store, the reference is known once closed
+    def __init__(self):
+        _craft_os.makedirs(_CRAFT_BLOB_DIR, exist_ok=True)
+        fd, self.tmp_path = _craft_tempfile.mkstemp(dir=_CRAFT_BLOB_DIR, prefix=".put-")
+        self.file = _craft_os.fdopen(fd, "wb")
+        self.sha = _craft_hashlib.sha256()
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.sha.update(data)
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        digest = "sha256:" + self.sha.hexdigest()
+        path = _craft_blob_path(digest)
+        if _craft_os.path.exists(path):
+            _craft_os.remove(self.tmp_path)
+        else:
+            _craft_os.makedirs(_craft_os.path.dirname(path), exist_ok=True)
+            _craft_os.chmod(self.tmp_path, 0o444)
+            _craft_os.replace(self.tmp_path, path)
+        return "blob:" + digest
+
+    def discard(self):
+        self.file.close()
+        _craft_os.remove(self.tmp_path)
+
+
+def craft_blob_put(data):
+    # Stores bytes (or str as UTF-8) and returns the reference to put in a tool result
+    writer = CraftBlobWriter()
+    writer.write(data)
+    return writer.close()
+
+
+def _craft_resolve(value):
+    if isinstance(value, str):
+        match = _CRAFT_BLOB_REF.match(value)
+        return CraftBlob(match.group(1)) if match else value
+    if isinstance(value, list):
+        return [_craft_resolve(item) for item in value]
+    return value
+
+
+def _craft_blob_args(fn):
+    if _craft_inspect.iscoroutinefunction(fn):
+        @_craft_functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await fn(*args, **{k: _craft_resolve(v) for k, v in kwargs.items()})
+    else:
+        @_craft_functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return fn(*args, **{k: _craft_resolve(v) for k, v in kwargs.items()})
+    return wrapper
+
+
+for _craft_tool in mcp._tool_manager.list_tools():
+    _craft_tool.fn = _craft_blob_args(_craft_tool.fn)
+'''
+
+
+# Token buckets for quota-bound APIs, keyed by the value of a global such as
+# VT_API_KEY so every server process using the same key shares one quota. The
+# buckets live in one SQLite file for the whole host. A caller takes a token,
+# or reserves the next free one and sleeps until it is due, so queued callers
+# go out spaced at the allowed rate. A 429 pushes every pending reservation back
+# by its Retry-After. Rendered with the MCP's rate limits under its header.
+RATE_HOOK = '''
+# Rate limits
+import asyncio as _craft_rate_asyncio
+import hashlib as _craft_rate_hashlib
+import sqlite3 as _craft_rate_sqlite3
+import threading as _craft_rate_threading
+import email.utils as _craft_rate_email_utils
+
+
+class CraftRateLimited(Exception):
+    pass
+
+
+class _CraftRate:
+
+    def __init__(self):
+        self._local = _craft_rate_threading.local()
+
+    def _db(self):
+        # One connection per thread, BEGIN IMMEDIATE serializes processes on the file lock
+        db = getattr(self._local, "db", None)
+        if db is None:
+            _craft_os.makedirs(_craft_os.path.dirname(_CRAFT_RATE_DB), exist_ok=True)
+            db = _craft_rate_sqlite3.connect(_CRAFT_RATE_DB, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                       "updated REAL NOT NULL, shifted REAL NOT NULL DEFAULT 0)")
+            self._local.db = db
+        return db
+
+    def _limit(self, name):
+        limit = _CRAFT_RATE.get(name)
+        if limit is None:
+            raise ValueError(f"No rate limit configured for {name}")
+        # Buckets are shared by key value, the global name only picks the settings
+        value = globals().get(name, name)
+        key = _craft_rate_hashlib.sha256(str(value).encode()).hexdigest()[:32]
+        return key, limit["rate"] / limit["per_s"], limit.get("burst", limit["rate"]), limit
+
+    def _update(self, key, fn):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT tokens, updated, shifted FROM buckets WHERE key=?", (key,)).fetchone()
+            result, row = fn(row)
+            db.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated, shifted) VALUES (?, ?, ?, ?)", (key, *row))
+            db.execute("COMMIT")
+            return result
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _reserve(self, name):
+        key, rate, burst, limit = self._limit(name)
+
+        def take(row):
+            now = _craft_time.time()
+            tokens, updated, shifted = row or (burst, now, 0.0)
+            if now >= updated:
+                tokens, updated = min(burst, tokens + (now - updated) * rate), now
+            # Negative tokens are reservations of callers already waiting
+            wait = max(0.0, (1 - tokens) / rate + (updated - now))
+            if wait > limit["max_wait_s"]:
+                raise CraftRateLimited(f"{name} quota is exhausted for the next {wait:.1f}s")
+            return (wait, shifted), (tokens - 1, updated, shifted)
+
+        return self._update(key, take)
+
+    def _shifted(self, name):
+        key = self._limit(name)[0]
+        row = self._db().execute("SELECT shifted FROM buckets WHERE key=?", (key,)).fetchone()
+        return row[0] if row else 0.0
+
+    def backoff(self, name, seconds):
+        """Hold every caller of this key back for seconds, e.g. after a 429 with Retry-After."""
+        key, rate, burst, limit = self._limit(name)
+
+        def push(row):
+            now = _craft_time.time()
+            tokens, updated, shifted = row or (burst, now, 0.0)
+            if now >= updated:
+                tokens, updated = min(burst, tokens + (now - updated) * rate), now
+            shift = max(0.0, now + seconds - updated)
+            return None, (min(tokens, 1.0), updated + shift, shifted + shift)
+
+        self._update(key, push)
+
+    async def acquire(self, name):
+        """Wait until a call with this key is within its quota."""
+        wait, shifted = await _craft_rate_asyncio.to_thread(self._reserve, name)
+        while wait > 0:
+            await _craft_rate_asyncio.sleep(wait)
+            # A backoff while we slept moves our reservation back by the same amount
+            current = await _craft_rate_asyncio.to_thread(self._shifted, name)
+            wait, shifted = current - shifted, current
+
+    def acquire_sync(self, name):
+        """acquire for sync tools."""
+        wait, shifted = self._reserve(name)
+        while wait > 0:
+            _craft_time.sleep(wait)
+            current = self._shifted(name)
+            wait, shifted = current - shifted, current
+
+    def retry_after(self, name, response):
+        # Seconds from a Retry-After header (delay or HTTP date), one token interval without one
+        value = response.headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    return max(0.0, _craft_rate_email_utils.parsedate_to_datetime(value).timestamp() - _craft_time.time())
+                except (TypeError, ValueError):
+                    pass
+        limit = self._limit(name)[3]
+        return limit["per_s"] / limit["rate"]
+
+
+craft_rate = _CraftRate()
+'''
+
+
+# Process-wide pooled HTTP clients for tool snippets: craft_http (async) and
+# craft_http_sync (threads and process workers). Keep-alive connections are
+# reused across calls, HTTP/2 is used when the h2 package is installed, and a
+# per-host cap keeps one slow API from taking every connection. rate= names a
+# rate limit to wait on before each attempt, 429 answers are retried after their
+# Retry-After. Rendered with the MCP's http settings under its header.
+HTTP_HOOK = '''
+# Shared HTTP clients
+import asyncio as _craft_http_asyncio
+import threading as _craft_http_threading
+import urllib.parse as _craft_urlparse
+
+
+def _craft_http_options():
+    import httpx
+    try:
+        import h2
+        http2 = _CRAFT_HTTP["http2"]
+    except ImportError:
+        http2 = False
+    return {
+        "http2": http2,
+        "timeout": httpx.Timeout(_CRAFT_HTTP["timeout_s"], connect=_CRAFT_HTTP["connect_timeout_s"]),
+        "limits": httpx.Limits(max_connections=int(_CRAFT_HTTP["max_connections"]),
+                               max_keepalive_connections=int(_CRAFT_HTTP["max_keepalive"])),
+        "follow_redirects": True,
+    }
+
+
+class _CraftHTTP:
+    # Same call style as httpx.AsyncClient, the client itself is built on first use
+
+    def __init__(self):
+        self._client = None
+        self._hosts = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(**_craft_http_options())
+        return self._client
+
+    async def request(self, method, url, rate=None, **kwargs):
+        host = _craft_urlparse.urlsplit(str(url)).netloc
+        limit = self._hosts.get(host)
+        if limit is None:
+            limit = self._hosts[host] = _craft_http_asyncio.Semaphore(int(_CRAFT_HTTP["max_per_host"]))
+        retries = craft_rate._limit(rate)[3]["retries"] if rate else 0
+        for attempt in range(retries + 1):
+            if rate:
+                await craft_rate.acquire(rate)
+            async with limit:
+                response = await self.client.request(method, url, **kwargs)
+            if response.status_code != 429 or attempt == retries:
+                return response
+            await _craft_http_asyncio.to_thread(craft_rate.backoff, rate, craft_rate.retry_after(rate, response))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+
+class _CraftHTTPSync:
+    # Same call style as httpx.Client, shared by every thread of the process
+
+    def __init__(self):
+        self._client = None
+        self._hosts = {}
+        self._lock = _craft_http_threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import httpx
+                self._client = httpx.Client(**_craft_http_options())
+            return self._client
+
+    def request(self, method, url, rate=None, **kwargs):
+        host = _craft_urlparse.urlsplit(str(url)).netloc
+        with self._lock:
+            limit = self._hosts.get(host)
+            if limit is None:
+                limit = self._hosts[host] = _craft_http_threading.BoundedSemaphore(int(_CRAFT_HTTP["max_per_host"]))
+        retries = craft_rate._limit(rate)[3]["retries"] if rate else 0
+        for attempt in range(retries + 1):
+            if rate:
+                craft_rate.acquire_sync(rate)
+            with limit:
+                response = self.client.request(method, url, **kwargs)
+            if response.status_code != 429 or attempt == retries:
+                return response
+            craft_rate.backoff(rate, craft_rate.retry_after(rate, response))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+craft_http = _CraftHTTP()
+craft_http_sync = _CraftHTTPSync()
+'''
+
+
+# Times every tool body and queues a span for traces.jsonl when the caller
+# propagated a trace context through the request _meta. A writer thread,
+# started on the first span, appends them off the event loop.
+TRACE_HOOK = '''
+# Tracing
+import atexit as _craft_atexit
+import queue as _craft_queue
+import threading as _craft_threading
+
+_CRAFT_TRACE_FILE = _craft_os.environ.get("CRAFTMCP_TRACE_FILE", "traces.jsonl")
+_CRAFT_TRACE_MAX_BYTES = 5 * 1024 * 1024
+
+_craft_trace_queue = _craft_queue.SimpleQueue()
+_craft_trace_state = {"writer": None, "lock": _craft_threading.Lock()}
+
+
+def _craft_trace_parent():
+    try:
+        meta = mcp.get_context().request_context.meta
+    except Exception:
+        return None
+    if meta is None:
+        return None
+    return getattr(meta, "craftmcp_trace", None) or (meta.model_extra or {}).get("craftmcp_trace")
+
+
+def _craft_trace_export(name, parent, wall_start, start, error):
+    record = {
+        "trace_id": parent["trace_id"],
+        "span_id": _craft_secrets.token_hex(8),
+        "parent_id": parent["span_id"],
+        "name": f"tool.body {name}",
+        "source": "mcp",
+        "start": wall_start,
+        "duration_ms": round((_craft_time.perf_counter() - start) * 1000, 3),
+        "status": "error" if error else "ok",
+        "attributes": {"tool": name, "pid": _craft_os.getpid(), **({"error": repr(error)[:500]} if error else {})},
+    }
+    # Only enqueued here, the file is written by the writer thread off the event loop
+    if _craft_trace_state["writer"] is None:
+        _craft_trace_start()
+    _craft_trace_queue.put(record)
+
+
+def _craft_trace_start():
+    with _craft_trace_state["lock"]:
+        if _craft_trace_state["writer"] is None:
+            writer = _craft_threading.Thread(target=_craft_trace_write, name="craftmcp-traces", daemon=True)
+            writer.start()
+            _craft_trace_state["writer"] = writer
+            _craft_atexit.register(_craft_trace_stop)
+
+
+def _craft_trace_write():
+    while True:
+        records = [_craft_trace_queue.get()]
+        # Everything queued meanwhile goes out in the same write
+        while not _craft_trace_queue.empty():
+            records.append(_craft_trace_queue.get())
+        spans = [record for record in records if record is not None]
+        try:
+            if _craft_os.path.exists(_CRAFT_TRACE_FILE) and _craft_os.path.getsize(_CRAFT_TRACE_FILE) > _CRAFT_TRACE_MAX_BYTES:
+                _craft_os.replace(_CRAFT_TRACE_FILE, _CRAFT_TRACE_FILE + ".1")
+            with open(_CRAFT_TRACE_FILE, "a") as f:
+                f.write("".join(_craft_json.dumps(record) + "\\n" for record in spans))
+        except OSError:
+            pass
+        if len(spans) < len(records):
+            return
+
+
+def _craft_trace_stop():
+    # Flushes spans still queued when the server exits
+    _craft_trace_queue.put(None)
+    _craft_trace_state["writer"].join(timeout=2)
+
+
+def _craft_traced(fn, name):
+    if _craft_inspect.iscoroutinefunction(fn):
+        @_craft_functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            parent = _craft_trace_parent()
+            if parent is None:
+                return await fn(*args, **kwargs)
+            wall_start, start, error = _craft_time.time(), _craft_time.perf_counter(), None
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                _craft_trace_export(name, parent, wall_start, start, error)
+    else:
+        @_craft_functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            parent = _craft_trace_parent()
+            if parent is None:
+                return fn(*args, **kwargs)
+            wall_start, start, error = _craft_time.time(), _craft_time.perf_counter(), None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                _craft_trace_export(name, parent, wall_start, start, error)
+
+    return wrapper
+
+
+for _craft_tool in mcp._tool_manager.list_tools():
+    _craft_tool.fn = _craft_traced(_craft_tool.fn, _craft_tool.name)
+'''
+
+
+# On-demand profiler. SIGUSR1 reads profile_request.json from the MCP folder,
+# runs a sampling or cProfile window and writes profile_<id>_<pid>.json.
+# Only the signal handler is installed until a profile is requested.
+PROFILE_HOOK = '''
+# Profiling
+import signal as _craft_signal
+import threading as _craft_threading
+
+_craft_profile_state = {"active": None}
+
+
+def _craft_profile_sample(request, stop):
+    import sys
+    from collections import Counter
+    stacks, own = Counter(), _craft_threading.get_ident()
+    while not stop.wait(request.get("interval_ms", 5) / 1000):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({_craft_os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(stack))] += 1
+    return "\\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+
+
+def _craft_profile_write(request, data):
+    path = f"profile_{request['id']}_{_craft_os.getpid()}.json"
+    with open(path + ".tmp", "w") as f:
+        _craft_json.dump({"pid": _craft_os.getpid(), "mode": request["mode"], **data}, f)
+    _craft_os.replace(path + ".tmp", path)
+
+
+def _craft_profile_finish_deterministic(request, profile):
+    import io, pstats, marshal, base64
+    profile.disable()
+    profile.create_stats()
+    stats = profile.stats
+    if request.get("format") == "pstats":
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+        data = {"format": "pstats", "data": base64.b64encode(marshal.dumps(stats)).decode(), "summary": summary.getvalue()}
+    else:
+        lines = []
+        for (filename, line, func), (_, _, _, _, callers) in stats.items():
+            label = f"{func} ({_craft_os.path.basename(filename)}:{line})"
+            for (c_file, c_line, c_func), (_, _, c_tottime, _) in callers.items():
+                if int(c_tottime * 1e6):
+                    lines.append(f"{c_func} ({_craft_os.path.basename(c_file)}:{c_line});{label} {int(c_tottime * 1e6)}")
+        data = {"format": "collapsed", "data": "\\n".join(lines)}
+    _craft_profile_write(request, data)
+
+
+def _craft_profile_signal(signum, frame):
+    active = _craft_profile_state["active"]
+    # Second signal (sent by the timer below) closes a deterministic window
+    if active is not None:
+        if active[0] == "deterministic":
+            _craft_profile_state["active"] = None
+            _craft_profile_finish_deterministic(active[1], active[2])
+        return
+    try:
+        with open("profile_request.json") as f:
+            request = _craft_json.load(f)
+    except (OSError, ValueError):
+        return
+
+    if request.get("mode") == "deterministic":
+        import cProfile
+        profile = cProfile.Profile()
+        _craft_profile_state["active"] = ("deterministic", request, profile)
+        profile.enable()
+        timer = _craft_threading.Timer(request["duration_s"], _craft_os.kill, (_craft_os.getpid(), _craft_signal.SIGUSR1))
+        timer.daemon = True
+        timer.start()
+        return
+
+    def run():
+        stop = _craft_threading.Event()
+        timer = _craft_threading.Timer(request["duration_s"], stop.set)
+        timer.daemon = True
+        timer.start()
+        data = _craft_profile_sample(request, stop)
+        _craft_profile_state["active"] = None
+        _craft_profile_write(request, {"format": "collapsed", "data": data})
+
+    _craft_profile_state["active"] = ("sampling", request, None)
+    _craft_threading.Thread(target=run, name="craftmcp-sampler", daemon=True).start()
+
+
+if hasattr(_craft_signal, "SIGUSR1"):
+    _craft_signal.signal(_craft_signal.SIGUSR1, _craft_profile_signal)
+'''
+
+
+# Swaps one tool, prompt or resource in a running server. The API writes the new
+# source to reload_request.json and sends SIGUSR2. The swap runs between two event
+# loop callbacks: calls already running keep the old object and finish on the old
+# code, later calls and listings see the new one. Answers with
+# reload_<id>_<pid>.json.
+RELOAD_HOOK = '''
+# Hot reload
+import signal as _craft_signal
+import asyncio as _craft_asyncio
+
+_CRAFT_RELOAD_REQUEST_FILE = "reload_request.json"
+
+
+def _craft_reload_registries(kind):
+    if kind == "tool":
+        return [mcp._tool_manager._tools]
+    if kind == "prompt":
+        return [mcp._prompt_manager._prompts]
+    return [mcp._resource_manager._resources, mcp._resource_manager._templates]
+
+
+def _craft_reload_matching(registry, keys):
+    # Static resources are keyed by their parsed URI, which may have gained a trailing slash
+    return [k for k in list(registry) if k in keys or k.rstrip("/") in keys]
+
+
+def _craft_reload_apply(request):
+    kind, key = request["kind"], request["key"]
+    keys = {key, request.get("old_key") or key}
+    registries = _craft_reload_registries(kind)
+    previous = [(registry, k, registry.pop(k)) for registry in registries for k in _craft_reload_matching(registry, keys)]
+    try:
+        exec(compile(request["code"], f"<reload {kind} {key}>", "exec"), globals())
+        if kind == "tool":
+            # Same wrappers, in the same order, as the hooks apply at startup
+            tool = mcp._tool_manager._tools[key]
+            execution = request.get("execution", "inline")
+            _CRAFT_EXECUTION[key] = execution
+            if execution == "process":
+                # Its workers imported the previous file, new calls get a pool that imports the new one
+                stale = _craft_pools.pop("process", None)
+                if stale is not None:
+                    stale.shutdown(wait=False)
+            if __name__ == "__main__" and execution != "inline" and not tool.is_async:
+                tool.fn = _craft_offloaded(tool.fn, execution)
+                tool.is_async = True
+            tool.fn = _craft_traced(_craft_blob_args(tool.fn), tool.name)
+    except BaseException:
+        for registry in registries:
+            for k in _craft_reload_matching(registry, {key}):
+                registry.pop(k)
+        for registry, k, item in previous:
+            registry[k] = item
+        raise
+
+
+def _craft_reload_signal(signum, frame):
+    try:
+        with open(_CRAFT_RELOAD_REQUEST_FILE) as f:
+            request = _craft_json.load(f)
+    except (OSError, ValueError):
+        return
+
+    def run():
+        result = {"pid": _craft_os.getpid(), "session": _craft_os.environ.get("CRAFTMCP_SESSION"), "status": "reloaded"}
+        try:
+            _craft_reload_apply(request)
+        except Exception as e:
+            result.update(status="error", error=f"{type(e).__name__}: {e}")
+        path = f"reload_{request['id']}_{_craft_os.getpid()}.json"
+        with open(path + ".tmp", "w") as f:
+            _craft_json.dump(result, f)
+        _craft_os.replace(path + ".tmp", path)
+
+    try:
+        _craft_asyncio.get_running_loop().call_soon_threadsafe(run)
+    except RuntimeError:
+        run()
+
+
+if hasattr(_craft_signal, "SIGUSR2"):
+    _craft_signal.signal(_craft_signal.SIGUSR2, _craft_reload_signal)
+'''
+
+
+# Startup and shutdown run once per process around the FastMCP lifespan, with a
+# shared context object tools read as the module global "shared" (or from the
+# lifespan context of a FastMCP Context). Transports that open several
+# sessions, such as HTTP, share the same startup.
+LIFESPAN_HOOK = '''
+# Lifespan
+import asyncio as _craft_lifespan_asyncio
+import contextlib as _craft_contextlib
+import dataclasses as _craft_dataclasses
+
+
+@_craft_dataclasses.dataclass
+class CraftContext:
+    pass
+
+
+shared = CraftContext()
+_craft_lifespan_state = {"sessions": 0, "lock": None}
+
+
+@_craft_contextlib.asynccontextmanager
+async def _craft_lifespan(server):
+    state = _craft_lifespan_state
+    if state["lock"] is None:
+        state["lock"] = _craft_lifespan_asyncio.Lock()
+    async with state["lock"]:
+        if state["sessions"] == 0:
+            await _craft_startup(shared)
+        state["sessions"] += 1
+    try:
+        yield shared
+    finally:
+        async with state["lock"]:
+            state["sessions"] -= 1
+            if state["sessions"] == 0:
+                await _craft_shutdown(shared)
+'''
+
+
+def render_lifespan(mcp_metadata: dict) -> str:
+    # Empty when the MCP has no startup, shutdown or context
+    startup, shutdown = mcp_metadata.get("startup", ""), mcp_metadata.get("shutdown", "")
+    context = mcp_metadata.get("context", {})
+    if not (startup.strip() or shutdown.strip() or context):
+        return ""
+    fields = "\n".join(f"    {name}: {type_str!r} = None" for name, type_str in context.items()) or "    pass"
+    code = LIFESPAN_HOOK.replace("class CraftContext:\n    pass\n", f"class CraftContext:\n{fields}\n", 1)
+    functions = f"{_async_body('_craft_startup', startup)}\n\n\n{_async_body('_craft_shutdown', shutdown)}\n\n\n"
+    code = code.replace("@_craft_contextlib.asynccontextmanager\n", functions + "@_craft_contextlib.asynccontextmanager\n", 1)
+    return code.strip("\n")
+
+
+# Hooks a server answers signals with, by the header they start with. Processes
+# are started with the ones their file has in CRAFTMCP_HOOKS, and only those are
+# signalled: SIGUSR1 or SIGUSR2 would terminate a server without the hook.
+HOOK_MARKERS = {"profile": "# Profiling\n", "reload": "# Hot reload\n"}
+
+
+def render_hooks(mcp_metadata: dict, tool_execution: dict | None = None, blob_dir: str = "blobs",
+                 rate_db: str = "ratelimits.db") -> str:
+    # tool_execution: tool name -> execution mode, from the linked tools' metadata
+    policies = {name: mode for name, mode in (tool_execution or {}).items() if mode != "inline"}
+    sizes = {**POOL_DEFAULTS, **mcp_metadata.get("pools", {})}
+    execution = EXECUTION_HOOK.replace("# Execution policies\n",
+                                       f"# Execution policies\n_CRAFT_EXECUTION = {policies!r}\n_CRAFT_POOL_SIZES = {sizes!r}\n", 1)
+    # Absolute, the server runs from its own folder
+    blobs = BLOB_HOOK.replace("# Blob references\n",
+                              f"# Blob references\n_CRAFT_BLOB_DIR = _craft_os.environ.get(\"CRAFTMCP_BLOB_DIR\", {blob_dir!r})\n", 1)
+    rate_limits = {name: {**RATE_DEFAULTS, **limit} for name, limit in mcp_metadata.get("rate_limits", {}).items()}
+    rate = RATE_HOOK.replace("# Rate limits\n", f"# Rate limits\n_CRAFT_RATE = {rate_limits!r}\n"
+                             f"_CRAFT_RATE_DB = _craft_os.environ.get(\"CRAFTMCP_RATE_DB\", {rate_db!r})\n", 1)
+    http_settings = {**HTTP_DEFAULTS, **mcp_metadata.get("http", {})}
+    http = HTTP_HOOK.replace("# Shared HTTP clients\n", f"# Shared HTTP clients\n_CRAFT_HTTP = {http_settings!r}\n", 1)
+    hooks = [HOOK_IMPORTS, execution, blobs, rate, http, TRACE_HOOK, PROFILE_HOOK, RELOAD_HOOK]
+    return "\n\n\n".join(hook.strip("\n") for hook in hooks)
+
+
+def render_entrypoint(mcp_metadata: dict) -> str:
+    # stdio by default, streamable HTTP on a port or a unix socket in the MCP folder
+    transport = mcp_metadata.get("transport", {})
+    # In-process MCPs are imported by the API's workers, the file still runs as a stdio server
+    if transport.get("type", "stdio") != "http":
+        return 'if __name__ == "__main__":\n    mcp.run(transport="stdio")'
+
+    lines = ['if __name__ == "__main__":', "    import uvicorn"]
+    if "socket" in transport:
+        # DNS rebinding checks need a TCP Host header, a local socket is reached by the API only
+        lines += ["    mcp.settings.transport_security = None",
+                  f'    uvicorn.run(mcp.streamable_http_app(), uds={transport["socket"]!r}, log_level="warning")']
+        return "\n".join(lines)
+
+    host = transport.get("host", "127.0.0.1")
+    port = transport.get("port") or urlsplit(transport.get("url", "")).port or 8000
+    # Host header checks only come off for servers explicitly exposed with "public": true
+    if host not in ("127.0.0.1", "localhost", "::1") and transport.get("public") is True:
+        lines.append("    mcp.settings.transport_security = None")
+    lines.append(f'    uvicorn.run(mcp.streamable_http_app(), host={host!r}, port={int(port)}, log_level="warning")')
+    return "\n".join(lines)
+
@@ -1,11 +1,22 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
+import asyncio
 import hashlib
+import json
 import os
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+import time
+from contextlib import AsyncExitStack
 from system_db_handler import SystemDBHandler
+from metrics_handler import tool_calls, tool_errors, tool_latency
+from tracing_handler import span, current_context
+from logging_handler import log_event, annotate, should_log
+from admission_handler import admission
+from pool_handler import pool
+from response_handler import FastJSONResponse, json_line
+from coalesce_handler import single_flight, call_key, COALESCE_ENABLED
+import logging
 
 
 router = APIRouter()
@@ -14,6 +25,8 @@ security = HTTPBearer()
 
 
 MCP_DIR = "mcps_servers"
+MAP_MAX_ITEMS = int(os.environ.get("CRAFTMCP_MAP_MAX_ITEMS", "10000"))
+MAP_MAX_CONCURRENCY = int(os.environ.get("CRAFTMCP_MAP_MAX_CONCURRENCY", "64"))
 
 
 def hash_token(token: str) -> str:
@@ -27,43 +40,211 @@ class InfereRequest(BaseModel):
     arguments: dict = {}      # optional, only for inference
 
 
-@router.post("/infere-mcp")
-async def infere_mcp(
-    payload: InfereRequest,
-    credentials: HTTPAuthorizationCredentials = Depends(security)
-):
-    token = credentials.credentials
-    token_hash = hash_token(token)
-    user = db.fetch_records("users", f"token='{token_hash}'")
+class MapRequest(BaseModel):
+    mcp_id: int
+    name: str
+    items: list[dict]           # one arguments object per call
+    concurrency: int = 8
+    ordered: bool = False       # emit results in item order instead of as they finish
+    stop_on_error: bool = False # start no further items after the first failed one
+
+
+def _log_invocation(payload: InfereRequest, outcome: str, duration_ms: float, result):
+    if not should_log(outcome, duration_ms):
+        return
+    # Sizes are only computed for events that are actually written
+    result_bytes = len(result.model_dump_json()) if hasattr(result, "model_dump_json") else 0
+    log_event(
+        "invocation",
+        logging.INFO if outcome == "success" else logging.WARNING,
+        mcp_id=payload.mcp_id,
+        type=payload.type,
+        name=payload.name,
+        outcome=outcome,
+        duration_ms=round(duration_ms, 3),
+        arguments_bytes=len(json.dumps(payload.arguments, default=str)),
+        result_bytes=result_bytes
+    )
+
+
+def _linked_tool(mcp_id: int, name: str) -> dict | None:
+    # Metadata of the tool with that name linked to the MCP, None for names the caller made up
+    tools = db.fetch_records("tools", "name='{}'".format(name.replace("'", "''")))
+    for tool in tools:
+        metadata = json.loads(tool[6])
+        if mcp_id in metadata.get("linked_mcp_ids", []):
+            return metadata
+    return None
+
+
+def _call_options(mcp_id: int, type: str, name: str | None):
+    # Metrics label and coalescing for a call, unknown names share one "other" series
+    if type != "tool" or not name:
+        return "other", False
+    with span("db.lookup", mcp_id=mcp_id, target=name):
+        tool = _linked_tool(mcp_id, name)
+    if tool is None:
+        return "other", False
+    # Tools opt out with "coalesce": false in their metadata, e.g. when they have side effects
+    return name, COALESCE_ENABLED and tool.get("coalesce", True)
+
+
+def _authorize(credentials: HTTPAuthorizationCredentials, mcp_id: int):
+    with span("auth"):
+        token = credentials.credentials
+        token_hash = hash_token(token)
+        user = db.fetch_records("users", f"token='{token_hash}'")
 
     if not user:
         raise HTTPException(status_code=403, detail="Unauthorized")
     username = user[0][1]
     is_admin = bool(user[0][3])
+    annotate(user=username)
 
     # Fetch MCP record
-    mcp = db.fetch_records("mcps", f"id={payload.mcp_id}")
+    with span("db.lookup", mcp_id=mcp_id):
+        mcp = db.fetch_records("mcps", f"id={mcp_id}")
     if not mcp:
         raise HTTPException(status_code=404, detail="MCP not found")
     if not is_admin and mcp[0][3] != username:
         raise HTTPException(status_code=403, detail="You do not own this MCP")
+    # Killed by its on_breach "fail" policy or crashed, calls must not bring it back until /run-mcp
+    with span("db.lookup", mcp_id=mcp_id, table="mcp_status"):
+        status = db.fetch_records("mcp_status", f"mcp_id={mcp_id}")
+    if status and status[0][1] == "failed":
+        raise HTTPException(status_code=409, detail="MCP is marked failed, start it again with /run-mcp")
 
-    mcp_file = os.path.join(MCP_DIR, f"mcp_{payload.mcp_id}", f"mcp_{payload.mcp_id}.py")
+    mcp_file = os.path.join(MCP_DIR, f"mcp_{mcp_id}", f"mcp_{mcp_id}.py")
     if not os.path.exists(mcp_file):
         raise HTTPException(status_code=500, detail="MCP file not found or not exported")
 
-    server_params = StdioServerParameters(
-        command="uv",
-        args=["run", f"mcp_{payload.mcp_id}.py"],
-        cwd=os.path.dirname(mcp_file)
-    )
+    return username, mcp_file, json.loads(mcp[0][4])
+
+
+@router.post("/infere-mcp")
+async def infere_mcp(
+    payload: InfereRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    username, mcp_file, metadata = _authorize(credentials, payload.mcp_id)
+    label, coalesce = _call_options(payload.mcp_id, payload.type, payload.name)
 
-    async with stdio_client(server_params) as (read, write):
-        async with ClientSession(read, write) as session:
-            await session.initialize()
+    # Rendered straight from the MCP result models, without a jsonable_encoder pass
+    return FastJSONResponse(await _call(payload, username, mcp_file, metadata, label, coalesce))
 
-            # 🔁 LISTING MODE
-            if not payload.name:
+
+@router.post("/map-mcp")
+async def map_mcp(
+    payload: MapRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(payload.items) > MAP_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAP_MAX_ITEMS} items per map")
+    if not 1 <= payload.concurrency <= MAP_MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"concurrency must be between 1 and {MAP_MAX_CONCURRENCY}")
+
+    username, mcp_file, metadata = _authorize(credentials, payload.mcp_id)
+    label, coalesce = _call_options(payload.mcp_id, "tool", payload.name)
+    annotate(map_items=len(payload.items))
+
+    # One NDJSON line per item as it completes, then a summary line
+    return StreamingResponse(_map(payload, username, mcp_file, metadata, label, coalesce), media_type="application/x-ndjson")
+
+
+async def _call(payload: InfereRequest, username: str, mcp_file: str, metadata: dict, label: str, coalesce: bool):
+    # Identical tool calls already in flight share that execution and its result
+    if coalesce:
+        key = call_key(payload.mcp_id, payload.type, payload.name, payload.arguments)
+        if key in single_flight.inflight:
+            annotate(coalesced=True)
+        with span("coalesce", mcp_id=payload.mcp_id, target=payload.name):
+            return await single_flight.run(key, lambda: _invoke(payload, username, mcp_file, metadata, label))
+    return await _invoke(payload, username, mcp_file, metadata, label)
+
+
+async def _map(payload: MapRequest, username: str, mcp_file: str, metadata: dict, label: str, coalesce: bool):
+    start = time.perf_counter()
+    done = asyncio.Queue()
+    pending = iter(range(len(payload.items)))  # shared by the workers, each takes the next index
+    stopped = asyncio.Event()
+    counts = {"success": 0, "tool_error": 0, "error": 0}
+
+    async def worker():
+        try:
+            for index in pending:
+                if stopped.is_set():
+                    break
+                call = InfereRequest(mcp_id=payload.mcp_id, type="tool", name=payload.name, arguments=payload.items[index])
+                # Each item goes through admission on its own, so the MCP and user limits still apply
+                try:
+                    result = (await _call(call, username, mcp_file, metadata, label, coalesce))["result"]
+                    line = {"index": index, "status": "tool_error" if getattr(result, "isError", False) else "success", "result": result}
+                except HTTPException as e:
+                    line = {"index": index, "status": "error", "status_code": e.status_code, "error": e.detail}
+                except Exception as e:
+                    line = {"index": index, "status": "error", "status_code": 500, "error": str(e)}
+                if line["status"] != "success" and payload.stop_on_error:
+                    stopped.set()
+                done.put_nowait(line)
+        finally:
+            done.put_nowait(None)
+
+    with span("map", mcp_id=payload.mcp_id, target=payload.name, items=len(payload.items), concurrency=payload.concurrency):
+        workers = [asyncio.create_task(worker()) for _ in range(min(payload.concurrency, len(payload.items)))]
+        try:
+            buffered, next_index, running = {}, 0, len(workers)
+            while running:
+                line = await done.get()
+                if line is None:
+                    running -= 1
+                    continue
+                counts[line["status"]] += 1
+                if not payload.ordered:
+                    yield json_line(line)
+                    continue
+                # Ordered output holds finished items back until every earlier one is out
+                buffered[line["index"]] = line
+                while next_index in buffered:
+                    yield json_line(buffered.pop(next_index))
+                    next_index += 1
+            # Items after a stop were never run, what is left are the ones that finished past the gap
+            for index in sorted(buffered):
+                yield json_line(buffered[index])
+        finally:
+            # The client went away, calls that are still running are cancelled
+            for task in workers:
+                task.cancel()
+
+    finished = sum(counts.values())
+    yield json_line({
+        "status": "stopped" if stopped.is_set() else "completed",
+        "total": len(payload.items),
+        **counts,
+        "skipped": len(payload.items) - finished,
+        "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+    })
+
+
+async def _invoke(payload: InfereRequest, username: str, mcp_file: str, metadata: dict, label: str):
+    limits = metadata.get("limits", {})
+
+    async with AsyncExitStack() as stack:
+        # Per-user and per-MCP concurrency, queued callers are served in weighted fair order
+        with span("admission.wait", mcp_id=payload.mcp_id):
+            await stack.enter_async_context(admission.slot(username, payload.mcp_id, limits.get("max_concurrency")))
+
+        # Least busy warm replica, spawned and initialized on the first call or after eviction
+        with span("mcp.session", mcp_id=payload.mcp_id):
+            try:
+                session = await stack.enter_async_context(pool.session(payload.mcp_id, mcp_file, metadata))
+            except Exception as e:
+                raise HTTPException(status_code=503, detail=f"MCP server unavailable: {e}")
+
+        # 🔁 LISTING MODE
+        if not payload.name:
+            with span("mcp.list", mcp_id=payload.mcp_id, type=payload.type):
                 if payload.type == "tool":
                     return {"status": "available", "type": "tool", "items": await session.list_tools()}
                 elif payload.type == "prompt":
@@ -73,17 +254,36 @@ async def infere_mcp(
                 else:
                     raise HTTPException(status_code=400, detail="Invalid type for listing")
 
-            # 🚀 INFERENCE MODE
-            try:
+        # 🚀 INFERENCE MODE
+        labels = (payload.mcp_id, label)
+        tool_calls.inc(labels)
+        start = time.perf_counter()
+        result, outcome = None, "error"
+        try:
+            # JSON-RPC round trip, the tool body span is recorded by the server itself
+            with span("mcp.call", mcp_id=payload.mcp_id, type=payload.type, target=payload.name):
                 if payload.type == "tool":
-                    result = await session.call_tool(payload.name, payload.arguments)
+                    result = await session.call_tool(payload.name, payload.arguments, meta={"craftmcp_trace": current_context()})
                 elif payload.type == "prompt":
-                    result = await session.call_prompt(payload.name, payload.arguments)
+                    result = await session.get_prompt(payload.name, payload.arguments)
                 elif payload.type == "resource":
-                    result, _ = await session.read_resource(payload.name)
+                    result = await session.read_resource(payload.name)
                 else:
                     raise HTTPException(status_code=400, detail="Invalid type for invocation")
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+        except HTTPException:
+            tool_errors.inc(labels)
+            raise
+        except Exception as e:
+            tool_errors.inc(labels)
+            raise HTTPException(status_code=500, detail=f"Inference failed: {e}")
+        else:
+            outcome = "tool_error" if getattr(result, "isError", False) else "success"
+        finally:
+            elapsed = time.perf_counter() - start
+            tool_latency.observe(labels, elapsed)
+            _log_invocation(payload, outcome, elapsed * 1000, result)
+
+        if outcome == "tool_error":
+            tool_errors.inc(labels)
 
-            return {"status": "success", "result": result}
\ No newline at end of file
+        return {"status": "success", "result": result}
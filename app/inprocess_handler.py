@@ -0,0 +1,166 @@
+# In-process execution for trusted MCPs: the exported module is imported once into
+# each worker of a dedicated process pool and its tools are called directly, without
+# a server process or JSON-RPC. Workers are spawned fresh (no fork of the API) and only
+# import what the exported module imports, so this file keeps to stdlib and mcp.
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import multiprocessing.util
+import importlib.util
+import asyncio
+import base64
+import json
+import sys
+import os
+from mcp import types
+
+
+# Worker side
+
+_module = None
+_loop = None
+
+
+def _load(script_path: str, env_keys: list):
+    global _module, _loop
+    # Same environment a stdio server would get, the API's own secrets stay out
+    for key in list(os.environ):
+        if key not in env_keys:
+            del os.environ[key]
+    folder = os.path.dirname(script_path)
+    os.chdir(folder)
+    sys.path.insert(0, folder)
+    spec = importlib.util.spec_from_file_location("craftmcp_inprocess", script_path)
+    _module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = _module
+    spec.loader.exec_module(_module)
+    _loop = asyncio.new_event_loop()
+    # Startup runs once per worker, as it would once per server process
+    lifespan = getattr(_module, "_craft_lifespan", None)
+    if lifespan is not None:
+        context = lifespan(_module.mcp)
+        _loop.run_until_complete(context.__aenter__())
+        # atexit does not run in pool workers, multiprocessing finalizers do
+        multiprocessing.util.Finalize(None, lambda: _loop.run_until_complete(context.__aexit__(None, None, None)), exitpriority=10)
+
+
+def _with_meta(meta: dict | None):
+    # Lets the generated trace hook find the caller's trace context, as under a real request
+    if not meta:
+        return None
+    try:
+        from mcp.server.lowlevel.server import request_ctx
+        from mcp.shared.context import RequestContext
+        return request_ctx.set(RequestContext(request_id=0, meta=types.RequestParams.Meta(**meta),
+                                              session=None, lifespan_context=None))
+    except Exception:
+        return None
+
+
+def _tool_result(results) -> types.CallToolResult:
+    # Mirrors the lowlevel server's conversion of FastMCP tool results
+    if isinstance(results, types.CallToolResult):
+        return results
+    if isinstance(results, tuple) and len(results) == 2:
+        content, structured = results
+    elif isinstance(results, dict):
+        content, structured = [types.TextContent(type="text", text=json.dumps(results, indent=2))], results
+    else:
+        content, structured = results, None
+    return types.CallToolResult(content=list(content), structuredContent=structured, isError=False)
+
+
+def _resource_result(uri: str, contents) -> types.ReadResourceResult:
+    items = []
+    for item in contents:
+        if isinstance(item.content, bytes):
+            items.append(types.BlobResourceContents(uri=uri, mimeType=item.mime_type,
+                                                    blob=base64.b64encode(item.content).decode()))
+        else:
+            items.append(types.TextResourceContents(uri=uri, mimeType=item.mime_type or "text/plain", text=item.content))
+    return types.ReadResourceResult(contents=items)
+
+
+def _worker(method: str, args: tuple, meta: dict | None = None):
+    mcp = _module.mcp
+    token = _with_meta(meta)
+    try:
+        if method == "ping":
+            return os.getpid()
+        if method == "call_tool":
+            try:
+                return _tool_result(_loop.run_until_complete(mcp.call_tool(*args)))
+            except Exception as e:
+                return types.CallToolResult(content=[types.TextContent(type="text", text=str(e))], isError=True)
+        if method == "list_tools":
+            return types.ListToolsResult(tools=_loop.run_until_complete(mcp.list_tools()))
+        if method == "list_prompts":
+            return types.ListPromptsResult(prompts=_loop.run_until_complete(mcp.list_prompts()))
+        if method == "get_prompt":
+            return _loop.run_until_complete(mcp.get_prompt(*args))
+        if method == "list_resources":
+            return types.ListResourcesResult(resources=_loop.run_until_complete(mcp.list_resources()))
+        if method == "read_resource":
+            return _resource_result(str(args[0]), _loop.run_until_complete(mcp.read_resource(*args)))
+        raise ValueError(f"Unknown method {method}")
+    finally:
+        if token is not None:
+            from mcp.server.lowlevel.server import request_ctx
+            request_ctx.reset(token)
+
+
+# API side
+
+class InProcessSession:
+    # Same coroutine methods /infere-mcp uses on a ClientSession, answered by the worker pool
+
+    def __init__(self, script_path: str, workers: int):
+        from mcp.client.stdio import get_default_environment
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_load,
+            initargs=(os.path.abspath(script_path), list(get_default_environment()))
+        )
+        self.workers = workers
+
+
+    async def _submit(self, method: str, *args, meta: dict | None = None):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, _worker, method, args, meta)
+
+
+    async def initialize(self):
+        # Starts every worker so import errors surface now, not on the first call
+        await asyncio.gather(*[self._submit("ping") for _ in range(self.workers)])
+
+
+    def pids(self) -> list[int]:
+        return list(getattr(self.executor, "_processes", None) or {})
+
+
+    async def call_tool(self, name: str, arguments: dict | None = None, meta: dict | None = None, **kwargs):
+        return await self._submit("call_tool", name, arguments or {}, meta=meta)
+
+
+    async def list_tools(self):
+        return await self._submit("list_tools")
+
+
+    async def list_prompts(self):
+        return await self._submit("list_prompts")
+
+
+    async def get_prompt(self, name: str, arguments: dict | None = None):
+        return await self._submit("get_prompt", name, arguments)
+
+
+    async def list_resources(self):
+        return await self._submit("list_resources")
+
+
+    async def read_resource(self, uri):
+        return await self._submit("read_resource", str(uri))
+
+
+    async def aclose(self):
+        await asyncio.to_thread(self.executor.shutdown, wait=True, cancel_futures=True)
@@ -0,0 +1,125 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import logging
+import atexit
+import random
+import queue
+import json
+import time
+import os
+
+
+LOG_DIR = os.environ.get("CRAFTMCP_LOG_DIR", "logs")
+LOG_FILE = os.path.join(LOG_DIR, "craftmcp.jsonl")
+LOG_MAX_BYTES = int(os.environ.get("CRAFTMCP_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("CRAFTMCP_LOG_BACKUPS", "5"))
+LOG_LEVEL = os.environ.get("CRAFTMCP_LOG_LEVEL", "INFO").upper()
+
+# Fraction of successful request/invocation events that are written,
+# errors and calls slower than LOG_SLOW_MS are always written
+LOG_SAMPLE_RATE = float(os.environ.get("CRAFTMCP_LOG_SAMPLE_RATE", "1.0"))
+LOG_SLOW_MS = float(os.environ.get("CRAFTMCP_LOG_SLOW_MS", "1000"))
+
+os.makedirs(LOG_DIR, exist_ok=True)
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Handlers only enqueue, the listener thread formats and writes
+_queue = queue.SimpleQueue()
+_file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+_file_handler.setFormatter(JsonFormatter())
+_listener = QueueListener(_queue, _file_handler, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)
+
+logger = logging.getLogger("craftmcp")
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(QueueHandler(_queue))
+logger.propagate = False
+
+# Per-request fields (user, trace id...) that handlers fill in as they learn them
+request_context = ContextVar("craftmcp_log_context", default=None)
+
+
+def annotate(**fields):
+    context = request_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        context = request_context.get()
+        if context:
+            fields = {**context, **fields}
+        logger.log(level, event, extra={"fields": fields})
+
+
+def should_log(outcome: str, duration_ms: float) -> bool:
+    if outcome != "success" or duration_ms >= LOG_SLOW_MS:
+        return True
+    return LOG_SAMPLE_RATE >= 1.0 or random.random() < LOG_SAMPLE_RATE
+
+
+class RequestLogMiddleware:
+    # One "request" event per HTTP call: route, status, duration and body sizes
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        context = {}
+        token = request_context.set(context)
+        state = {"status": 500, "request_bytes": 0, "response_bytes": 0}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["request_bytes"] += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["response_bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            request_context.reset(token)
+            outcome = "success" if state["status"] < 400 else "error"
+            if should_log(outcome, duration_ms):
+                route = scope.get("route")
+                logger.info("request", extra={"fields": {
+                    **context,
+                    "method": scope.get("method"),
+                    "route": getattr(route, "path", scope.get("path")),
+                    "status": state["status"],
+                    "outcome": outcome,
+                    "duration_ms": round(duration_ms, 3),
+                    "request_bytes": state["request_bytes"],
+                    "response_bytes": state["response_bytes"],
+                }})
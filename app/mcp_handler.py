@@ -6,6 +6,10 @@ from datetime import datetime
 import json
 import hashlib
 from system_db_handler import SystemDBHandler
+from supervisor_handler import validate_limits
+from pool_handler import validate_replicas, validate_transport
+from codegen_handler import validate_pools, validate_lifespan, validate_http, validate_rate_limits, validate_imports, validate_globals, render_globals
+from builtin_handler import validate_builtins
 
 
 router = APIRouter()
@@ -17,11 +21,52 @@ def hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
 
+# Metadata fields checked on create and modify, each validator returns the value it accepts
+VALIDATORS = {
+    "imports": validate_imports,
+    "globals": validate_globals,
+    "limits": validate_limits,
+    "replicas": validate_replicas,
+    "transport": validate_transport,
+    "pools": validate_pools,
+    "builtins": validate_builtins,
+    "http": validate_http,
+    "rate_limits": validate_rate_limits,
+}
+
+
+def _validated(fields: dict) -> dict:
+    try:
+        return {field: VALIDATORS[field](value) if field in VALIDATORS else value for field, value in fields.items()}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _check_lifespan(metadata: dict):
+    # startup, shutdown and context are checked together, a patch may change only one of them
+    try:
+        validate_lifespan(metadata.get("startup", ""), metadata.get("shutdown", ""), metadata.get("context", {}))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 class MCPCreate(BaseModel):
     name: str
     description: str = ""
     imports: list[str] = Field(default_factory=list, description="Custom import statements (e.g., ['import httpx'])")
+    lazy_imports: bool = Field(False, description="Import modules of plain 'import x' statements on first use instead of at server start")
     globals: dict = Field(default_factory=dict, description="Global variables used in the MCP server file")
+    limits: dict = Field(default_factory=dict, description="Resource limits, e.g. {'max_rss_mb': 512, 'max_cpu_percent': 50, 'on_breach': 'restart'}")
+    pinned: bool = Field(False, description="Keep the warm sessions of this MCP out of idle and memory eviction")
+    replicas: dict = Field(default_factory=dict, description="Warm session replicas for /infere-mcp, e.g. {'min': 1, 'max': 4}")
+    pools: dict = Field(default_factory=dict, description="Pool sizes for tools with execution 'thread' or 'process', e.g. {'threads': 8, 'processes': 2}")
+    transport: dict = Field(default_factory=dict, description="Server transport, {'type': 'stdio'} (default) or {'type': 'http', 'port': 8101} / {'type': 'http', 'socket': 'mcp.sock'}")
+    builtins: list[str] = Field(default_factory=list, description="Built-in tools to include, e.g. ['parse_stream']")
+    startup: str = Field("", description="Body of an async function run once per server process, sets up the shared context, e.g. 'shared.vt = httpx.AsyncClient()'")
+    shutdown: str = Field("", description="Body of an async function run when the server stops, e.g. 'await shared.vt.aclose()'")
+    context: dict = Field(default_factory=dict, description="Fields of the shared context and their types, e.g. {'vt': 'httpx.AsyncClient'}")
+    http: dict = Field(default_factory=dict, description="Shared HTTP client settings, e.g. {'timeout_s': 30, 'max_per_host': 10, 'http2': True}")
+    rate_limits: dict = Field(default_factory=dict, description="Outbound quotas keyed by the global holding the API key, e.g. {'VT_API_KEY': {'rate': 4, 'per_s': 60}}")
 
 
 @router.post("/create-mcp")
@@ -39,19 +84,34 @@ def create_mcp(
     
     username = user[0][1]  # column index 1 = username
 
+    _validated({field: getattr(payload, field) for field in VALIDATORS})
+    _check_lifespan(payload.model_dump())
+
     # Build MCP metadata
     metadata = {
         "name": payload.name,
         "description": payload.description,
         "imports": payload.imports,
+        "lazy_imports": payload.lazy_imports,
         "globals": payload.globals,
+        "limits": payload.limits,
+        "pinned": payload.pinned,
+        "replicas": payload.replicas,
+        "transport": payload.transport,
+        "pools": payload.pools,
+        "builtins": payload.builtins,
+        "startup": payload.startup,
+        "shutdown": payload.shutdown,
+        "context": payload.context,
+        "http": payload.http,
+        "rate_limits": payload.rate_limits,
         "created_at": datetime.utcnow().isoformat(),
         "owner": username
     }
 
     # Generate MCP skeleton code
     import_section = "\n".join(payload.imports)
-    global_section = "\n".join(f"{k} = {json.dumps(v)}" for k, v in payload.globals.items())
+    global_section = render_globals(payload.globals)
 
     skeleton_code = f'''
 # Custom Imports
@@ -128,7 +188,19 @@ class MCPPatch(BaseModel):
     name: str | None = None
     description: str | None = None
     imports: list[str] | None = None
+    lazy_imports: bool | None = None
     globals: dict | None = None
+    limits: dict | None = None
+    pinned: bool | None = None
+    replicas: dict | None = None
+    transport: dict | None = None
+    pools: dict | None = None
+    builtins: list[str] | None = None
+    startup: str | None = None
+    shutdown: str | None = None
+    context: dict | None = None
+    http: dict | None = None
+    rate_limits: dict | None = None
 
 
 @router.post("/modify-mcp")
@@ -159,18 +231,13 @@ def modify_mcp(
         raise HTTPException(status_code=403, detail="Not allowed to modify this MCP")
 
     # Patch metadata
-    if patch.name is not None:
-        metadata["name"] = patch.name
-    if patch.description is not None:
-        metadata["description"] = patch.description
-    if patch.imports is not None:
-        metadata["imports"] = patch.imports
-    if patch.globals is not None:
-        metadata["globals"] = patch.globals
+    changes = {field: value for field, value in patch.model_dump().items() if value is not None}
+    metadata.update(_validated(changes))
+    _check_lifespan(metadata)
 
     # Regenerate skeleton code
     import_section = "\n".join(metadata.get("imports", []))
-    global_section = "\n".join(f"{k} = {json.dumps(v)}" for k, v in metadata.get("globals", {}).items())
+    global_section = render_globals(metadata.get("globals", {}))
 
     skeleton_code = f'''
 # Custom Imports
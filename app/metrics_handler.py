@@ -0,0 +1,217 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import PlainTextResponse
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from bisect import bisect_left
+from threading import Lock
+import hashlib
+import secrets
+import time
+import os
+
+
+router = APIRouter()
+security = HTTPBearer()
+
+# Lets a Prometheus scraper read /metrics without holding an admin token
+SCRAPE_TOKEN = os.environ.get("CRAFTMCP_METRICS_TOKEN", "")
+
+
+# Latency buckets in seconds, shared by every histogram
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_collectors = []
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+
+    def inc(self, label_values: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+
+    def get(self, label_values: tuple = ()) -> float:
+        return self._values.get(label_values, 0)
+
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = list(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+
+    def set(self, label_values: tuple = (), value: float = 0):
+        with self._lock:
+            self._values[label_values] = value
+
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+
+    def observe(self, label_values: tuple, value: float):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = [0] * (len(self.buckets) + 2)
+                self._values[label_values] = series
+            series[idx] += 1
+            series[-1] += value
+
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def register_collector(fn):
+    # fn() is called at scrape time and returns extra exposition lines
+    _collectors.append(fn)
+    return fn
+
+
+# API
+http_requests = Counter("craftmcp_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_latency = Histogram("craftmcp_http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+
+# Tool calls through /infere-mcp
+tool_calls = Counter("craftmcp_tool_calls_total", "MCP invocations by mcp_id and tool", ("mcp_id", "tool"))
+tool_errors = Counter("craftmcp_tool_call_errors_total", "Failed MCP invocations by mcp_id and tool", ("mcp_id", "tool"))
+tool_latency = Histogram("craftmcp_tool_call_duration_seconds", "MCP invocation latency by mcp_id and tool", ("mcp_id", "tool"))
+
+# MCP processes
+mcp_restarts = Counter("craftmcp_mcp_restarts_total", "MCP server relaunches", ("mcp_id",))
+
+# SystemDBHandler
+db_queries = Counter("craftmcp_db_queries_total", "SQLite queries by operation and table", ("op", "table"))
+db_latency = Histogram("craftmcp_db_query_duration_seconds", "SQLite query latency by operation", ("op",),
+                       buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0))
+
+# Caches
+cache_requests = Counter("craftmcp_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+
+
+def cache_hit(cache: str):
+    cache_requests.inc((cache, "hit"))
+
+
+def cache_miss(cache: str):
+    cache_requests.inc((cache, "miss"))
+
+
+@register_collector
+def _cache_hit_ratio() -> list[str]:
+    caches = {label_values[0] for label_values in list(cache_requests._values)}
+    lines = ["# HELP craftmcp_cache_hit_ratio Cache hit ratio since start",
+             "# TYPE craftmcp_cache_hit_ratio gauge"]
+    for cache in sorted(caches):
+        hits = cache_requests.get((cache, "hit"))
+        total = hits + cache_requests.get((cache, "miss"))
+        lines.append(f'craftmcp_cache_hit_ratio{{cache="{cache}"}} {hits / total if total else 0}')
+    return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            lines.extend(collector())
+        except Exception as e:
+            lines.append(f"# collector {getattr(collector, '__name__', collector)} failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware, keeps per-request work to a clock read and two dict updates
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            method = scope.get("method", "")
+            http_requests.inc((method, route_path, status[0]))
+            http_latency.observe((method, route_path), elapsed)
+
+
+@router.get("/metrics")
+def metrics(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    token = credentials.credentials
+    if not (SCRAPE_TOKEN and secrets.compare_digest(token, SCRAPE_TOKEN)):
+        # Imported here, the DB handler itself records its queries in this module
+        from system_db_handler import SystemDBHandler
+        token_hash = hashlib.sha256(token.encode()).hexdigest()
+        if not SystemDBHandler().fetch_records("users", f"token='{token_hash}' AND is_admin=1"):
+            raise HTTPException(status_code=403, detail="Admin privileges required")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,441 @@
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import timedelta
+import asyncio
+import logging
+import time
+import os
+from concurrent.futures.process import BrokenProcessPool
+import anyio
+import httpx
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamable_http_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+from metrics_handler import Counter, register_collector, cache_hit, cache_miss
+from supervisor_handler import session_rss_mb, pids_rss_mb, launch_command, session_usage, script_hooks
+from inprocess_handler import InProcessSession
+from tracing_handler import span
+from logging_handler import log_event
+
+
+# Warm stdio sessions are closed after this long without calls (0 keeps them until evicted for memory)
+POOL_IDLE_S = float(os.environ.get("CRAFTMCP_POOL_IDLE_S", "300"))
+# Total RSS of pooled server processes, least recently used sessions are closed above it (0 = no budget)
+POOL_RSS_BUDGET_MB = float(os.environ.get("CRAFTMCP_POOL_RSS_BUDGET_MB", "2048"))
+POOL_INTERVAL_S = float(os.environ.get("CRAFTMCP_POOL_INTERVAL_S", "10"))
+# Upper bound on a single request to a pooled server, so a dead server cannot hang a caller
+CALL_TIMEOUT_S = float(os.environ.get("CRAFTMCP_MCP_CALL_TIMEOUT_S", "300"))
+
+# Replica autoscaling, bounds come from the MCP's metadata {"replicas": {"min": 1, "max": 4}}
+SCALE_UP_OUTSTANDING = int(os.environ.get("CRAFTMCP_SCALE_UP_OUTSTANDING", "2"))
+SCALE_UP_LATENCY_MS = float(os.environ.get("CRAFTMCP_SCALE_UP_LATENCY_MS", "500"))
+SCALE_DOWN_IDLE_S = float(os.environ.get("CRAFTMCP_SCALE_DOWN_IDLE_S", "60"))
+MAX_REPLICAS = int(os.environ.get("CRAFTMCP_MAX_REPLICAS", "8"))
+
+# Keep-alive pool shared by every session to the same HTTP server
+HTTP_MAX_CONNECTIONS = int(os.environ.get("CRAFTMCP_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("CRAFTMCP_HTTP_MAX_KEEPALIVE", "20"))
+
+TRANSPORTS = ["stdio", "http", "inprocess"]
+LOOPBACK_HOSTS = ["127.0.0.1", "localhost", "::1"]
+INPROCESS_WORKERS = int(os.environ.get("CRAFTMCP_INPROCESS_WORKERS", "2"))
+# Sent by the streamable HTTP client when the server no longer knows the session, e.g. after a restart
+SESSION_TERMINATED = 32600
+
+pool_evictions = Counter("craftmcp_pool_evictions_total", "Pooled MCP sessions closed", ("reason",))
+pool_scale_ups = Counter("craftmcp_pool_scale_ups_total", "Replicas added under load", ("mcp_id",))
+
+
+def validate_replicas(replicas: dict) -> dict:
+    unknown = [k for k in replicas if k not in ["min", "max"]]
+    if unknown:
+        raise ValueError(f"Unknown replica setting(s): {', '.join(unknown)}")
+    low, high = replicas.get("min", 1), replicas.get("max", replicas.get("min", 1))
+    if not isinstance(low, int) or not isinstance(high, int) or low < 1:
+        raise ValueError("replicas min and max must be positive integers")
+    if high < low or high > MAX_REPLICAS:
+        raise ValueError(f"replicas max must be between min and {MAX_REPLICAS}")
+    return replicas
+
+
+def validate_transport(transport: dict) -> dict:
+    unknown = [k for k in transport if k not in ["type", "host", "port", "socket", "url", "workers", "public"]]
+    if unknown:
+        raise ValueError(f"Unknown transport setting(s): {', '.join(unknown)}")
+    kind = transport.get("type", "stdio")
+    if kind not in TRANSPORTS:
+        raise ValueError(f"transport type must be one of {', '.join(TRANSPORTS)}")
+    if kind == "http":
+        if not any(k in transport for k in ["port", "socket", "url"]):
+            raise ValueError("http transport needs a port, socket or url")
+        port = transport.get("port", 1)
+        if not isinstance(port, int) or not 0 < port < 65536:
+            raise ValueError("port must be between 1 and 65535")
+        socket = transport.get("socket", "mcp.sock")
+        if not isinstance(socket, str) or not socket or os.path.basename(socket) != socket:
+            raise ValueError("socket must be a file name, it is created in the MCP folder")
+        if not str(transport.get("url", "http://")).startswith(("http://", "https://")):
+            raise ValueError("url must be an http(s) URL")
+        # Generated servers have no authentication, other hosts could call every tool
+        if transport.get("host", "127.0.0.1") not in LOOPBACK_HOSTS and transport.get("public") is not True:
+            raise ValueError('host is not a loopback address, the server would be reachable without authentication; set "public": true to allow it')
+    if kind == "inprocess":
+        workers = transport.get("workers", INPROCESS_WORKERS)
+        if not isinstance(workers, int) or not 0 < workers <= 32:
+            raise ValueError("workers must be between 1 and 32")
+    return transport
+
+
+def transport_target(script_path: str, transport: dict) -> tuple[str, str | None]:
+    # (endpoint URL, unix socket path or None) of an HTTP MCP server
+    if "url" in transport:
+        return transport["url"], None
+    if "socket" in transport:
+        return "http://localhost/mcp", os.path.join(os.path.dirname(os.path.abspath(script_path)), transport["socket"])
+    host = transport.get("host", "127.0.0.1")
+    if host in ("0.0.0.0", "::", ""):
+        host = "127.0.0.1"
+    return f"http://{host}:{transport['port']}/mcp", None
+
+
+def replica_bounds(metadata: dict) -> tuple[int, int]:
+    # One session to an HTTP server or a worker pool is enough, it serves concurrent requests itself
+    if metadata.get("transport", {}).get("type", "stdio") in ["http", "inprocess"]:
+        return 1, 1
+    replicas = metadata.get("replicas", {})
+    low = replicas.get("min", 1)
+    return low, max(replicas.get("max", low), low)
+
+
+class PooledSession:
+
+    def __init__(self, mcp_id: int, mtime: int, http_target: tuple | None = None, workers: int | None = None):
+        self.mcp_id = mcp_id
+        self.http_target = http_target  # (url, socket) for HTTP servers, None for a spawned stdio server
+        self.workers = workers          # worker processes for in-process execution
+        self.script_path = None
+        self.mtime = mtime          # of the exported script, a re-export retires the session
+        self.tag = os.urandom(8).hex()
+        self.ready = asyncio.get_running_loop().create_future()
+        self.stop = asyncio.Event()
+        self.task = None
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.pinned = False
+        self.retired = False        # takes no new calls, closed once drained
+        self.rss_mb = 0.0
+
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready.done() and not self.ready.exception(),
+            "in_flight": self.in_flight,
+            "idle_s": round(time.monotonic() - self.last_used, 1),
+            "rss_mb": self.rss_mb,
+            "pinned": self.pinned,
+            "usage": session_usage.get(self.tag, (None, None))[1]
+        }
+
+
+class SessionPool:
+    # Long-lived stdio sessions (replicas) per MCP, shared by concurrent /infere-mcp calls.
+    # Each session is owned by a runner task that enters and exits the transport contexts.
+
+    def __init__(self):
+        self.sessions = {}          # mcp_id -> list of PooledSession replicas
+        self.latency_ms = {}        # mcp_id -> EWMA of call time, drives scale-up
+        self.min_replicas = {}      # mcp_id -> replicas kept while the MCP is warm
+        self.http_clients = {}      # url or socket -> shared httpx.AsyncClient
+
+
+    async def _relay(self, read, send):
+        # Forwards server messages to the session, ending when the transport closes (server exit)
+        async with send:
+            async for message in read:
+                await send.send(message)
+
+
+    def _http_client(self, url: str, socket: str | None) -> httpx.AsyncClient:
+        key = socket or url
+        client = self.http_clients.get(key)
+        if client is None:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE)
+            client = httpx.AsyncClient(
+                transport=httpx.AsyncHTTPTransport(uds=socket, limits=limits),
+                timeout=httpx.Timeout(30, read=CALL_TIMEOUT_S)
+            )
+            self.http_clients[key] = client
+        return client
+
+
+    async def _run(self, entry: PooledSession, params: StdioServerParameters | None):
+        try:
+            async with AsyncExitStack() as stack:
+                if entry.workers:
+                    # Imports the exported module in every worker
+                    with span("mcp.load", mcp_id=entry.mcp_id, workers=entry.workers):
+                        session = InProcessSession(entry.script_path, entry.workers)
+                        stack.push_async_callback(session.aclose)
+                        await session.initialize()
+                    waits = []
+                else:
+                    if entry.http_target:
+                        with span("mcp.connect", mcp_id=entry.mcp_id):
+                            url, socket = entry.http_target
+                            read, write, _ = await stack.enter_async_context(
+                                streamable_http_client(url, http_client=self._http_client(url, socket)))
+                    else:
+                        with span("mcp.spawn", mcp_id=entry.mcp_id):
+                            read, write = await stack.enter_async_context(stdio_client(params))
+
+                    relay_send, relay_receive = anyio.create_memory_object_stream(0)
+                    relay = asyncio.create_task(self._relay(read, relay_send))
+                    stack.callback(relay.cancel)
+                    session = await stack.enter_async_context(
+                        ClientSession(relay_receive, write, read_timeout_seconds=timedelta(seconds=CALL_TIMEOUT_S)))
+
+                    # Includes interpreter startup of the spawned server
+                    with span("mcp.initialize", mcp_id=entry.mcp_id):
+                        await session.initialize()
+                    waits = [relay]
+                entry.ready.set_result(session)
+                log_event("pool.session_started", mcp_id=entry.mcp_id)
+                if POOL_RSS_BUDGET_MB:
+                    asyncio.create_task(self.enforce_budget())
+
+                stop = asyncio.create_task(entry.stop.wait())
+                await asyncio.wait(waits + [stop], return_when=asyncio.FIRST_COMPLETED)
+                stop.cancel()
+                if any(w.done() for w in waits):
+                    self._retire(entry, "exited")
+        except Exception as e:
+            # Transports fail inside task groups, surface the underlying error
+            while isinstance(e, ExceptionGroup) and len(e.exceptions) == 1:
+                e = e.exceptions[0]
+            if not entry.ready.done():
+                entry.ready.set_exception(e)
+                entry.ready.exception()  # mark retrieved, callers re-raise it
+            log_event("pool.session_failed", logging.ERROR, mcp_id=entry.mcp_id, error=str(e))
+        finally:
+            entry.retired = True
+            self._discard(entry)
+
+
+    def _discard(self, entry: PooledSession):
+        replicas = self.sessions.get(entry.mcp_id, [])
+        if entry in replicas:
+            replicas.remove(entry)
+            if not replicas:
+                del self.sessions[entry.mcp_id]
+
+
+    def _retire(self, entry: PooledSession, reason: str):
+        self._discard(entry)
+        if not entry.retired:
+            entry.retired = True
+            pool_evictions.inc((reason,))
+            log_event("pool.session_closed", mcp_id=entry.mcp_id, reason=reason,
+                      idle_s=round(time.monotonic() - entry.last_used, 1), rss_mb=entry.rss_mb)
+        if entry.in_flight == 0:
+            entry.stop.set()
+
+
+    def _spawn(self, mcp_id: int, script_path: str, mtime: int, transport: dict, limits: dict) -> PooledSession:
+        if transport.get("type", "stdio") == "http":
+            # Served by /run-mcp or an external process, only a client session is opened here
+            entry = PooledSession(mcp_id, mtime, transport_target(script_path, transport))
+            params = None
+        elif transport.get("type") == "inprocess":
+            entry = PooledSession(mcp_id, mtime, workers=transport.get("workers", INPROCESS_WORKERS))
+            params = None
+        else:
+            entry = PooledSession(mcp_id, mtime)
+            # Same rlimits and cgroup as the server started by /run-mcp
+            command, args = launch_command(mcp_id, limits)
+            params = StdioServerParameters(
+                command=command,
+                args=args,
+                cwd=os.path.dirname(script_path),
+                env={"CRAFTMCP_SESSION": entry.tag, "CRAFTMCP_HOOKS": script_hooks(script_path)}
+            )
+        entry.script_path = script_path
+        self.sessions.setdefault(mcp_id, []).append(entry)
+        entry.task = asyncio.create_task(self._run(entry, params))
+        return entry
+
+
+    def reloaded(self, mcp_id: int, mtime: int, tags: set):
+        # Hot reloaded servers already run the code of the new export, they are not stale.
+        # In-process workers and stdio servers that missed the reload restart on the next call.
+        for entry in self.sessions.get(mcp_id, []):
+            if entry.http_target or entry.tag in tags:
+                entry.mtime = mtime
+
+
+    def _should_scale_up(self, mcp_id: int, replicas: list) -> bool:
+        # One replica at a time, and only once the running ones are all busy
+        if not all(e.ready.done() for e in replicas):
+            return False
+        outstanding = min(e.in_flight for e in replicas)
+        return outstanding >= SCALE_UP_OUTSTANDING or (
+            outstanding >= 1 and self.latency_ms.get(mcp_id, 0) >= SCALE_UP_LATENCY_MS)
+
+
+    @asynccontextmanager
+    async def session(self, mcp_id: int, script_path: str, metadata: dict | None = None):
+        metadata = metadata or {}
+        low, high = replica_bounds(metadata)
+        transport = metadata.get("transport", {})
+        limits = metadata.get("limits", {})
+        self.min_replicas[mcp_id] = low
+        mtime = os.stat(script_path).st_mtime_ns
+        replicas = self.sessions.get(mcp_id, [])
+        if any(e.mtime != mtime for e in replicas):
+            for stale in list(replicas):
+                self._retire(stale, "stale")
+            replicas = []
+
+        if not replicas:
+            cache_miss("mcp_session")
+            for _ in range(low):
+                self._spawn(mcp_id, script_path, mtime, transport, limits)
+            replicas = self.sessions[mcp_id]
+        else:
+            cache_hit("mcp_session")
+            if len(replicas) < high and self._should_scale_up(mcp_id, replicas):
+                self._spawn(mcp_id, script_path, mtime, transport, limits)
+                pool_scale_ups.inc((mcp_id,))
+                log_event("pool.scale_up", mcp_id=mcp_id, replicas=len(replicas),
+                          latency_ms=round(self.latency_ms.get(mcp_id, 0), 1))
+
+        # Least outstanding requests, a ready replica wins ties over one still starting
+        entry = min(replicas, key=lambda e: (e.in_flight, not e.ready.done()))
+        for replica in replicas:
+            replica.pinned = metadata.get("pinned", False)
+        entry.in_flight += 1
+        entry.last_used = time.monotonic()
+        try:
+            session = await asyncio.shield(entry.ready)
+            started = time.perf_counter()
+            try:
+                yield session
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.latency_ms[mcp_id] = 0.8 * self.latency_ms.get(mcp_id, elapsed_ms) + 0.2 * elapsed_ms
+        except McpError as e:
+            if e.error.code in (CONNECTION_CLOSED, SESSION_TERMINATED):
+                self._retire(entry, "exited")
+            raise
+        except (anyio.ClosedResourceError, anyio.BrokenResourceError, BrokenProcessPool):
+            self._retire(entry, "exited")
+            raise
+        finally:
+            entry.in_flight -= 1
+            entry.last_used = time.monotonic()
+            if entry.retired and entry.in_flight == 0:
+                entry.stop.set()
+
+
+    def supervised(self) -> list:
+        # (mcp_id, tag, worker pids) of the replicas that run their own processes, HTTP servers are
+        # supervised as the /run-mcp server
+        result = []
+        for entry in self._entries():
+            if entry.http_target or entry.retired or not entry.ready.done() or entry.ready.exception():
+                continue
+            result.append((entry.mcp_id, entry.tag, entry.ready.result().pids() if entry.workers else None))
+        return result
+
+
+    def breached(self, actions: list):
+        # Replicas over their limits close once their calls drain, a failed MCP loses all of them
+        for mcp_id, tag, action in actions:
+            for entry in list(self.sessions.get(mcp_id, [])):
+                if action == "fail" or entry.tag == tag:
+                    self._retire(entry, "limits")
+
+
+    def _evictable(self, entry: PooledSession) -> bool:
+        return not entry.pinned and not entry.in_flight and entry.ready.done()
+
+
+    def _entries(self) -> list:
+        return [e for replicas in list(self.sessions.values()) for e in replicas]
+
+
+    async def enforce_budget(self):
+        entries = self._entries()
+        if not entries:
+            return
+        rss = await asyncio.to_thread(session_rss_mb, [(e.mcp_id, e.tag) for e in entries if not e.workers])
+        for entry in entries:
+            if entry.workers and entry.ready.done() and not entry.ready.exception():
+                entry.rss_mb = pids_rss_mb(entry.ready.result().pids())
+            else:
+                entry.rss_mb = rss.get(entry.tag, 0.0)
+
+        total = sum(e.rss_mb for e in entries if not e.retired)
+        for entry in sorted(entries, key=lambda e: e.last_used):
+            if total <= POOL_RSS_BUDGET_MB:
+                break
+            if entry.retired or not self._evictable(entry):
+                continue
+            total -= entry.rss_mb
+            self._retire(entry, "memory")
+
+
+    async def sweep(self):
+        now = time.monotonic()
+        # Extra replicas that sat idle go first, down to the MCP's minimum
+        for mcp_id, replicas in list(self.sessions.items()):
+            replicas = sorted(replicas, key=lambda e: e.last_used)
+            low = self.min_replicas.get(mcp_id, 1)
+            for entry in replicas[:max(len(replicas) - low, 0)]:
+                if self._evictable(entry) and now - entry.last_used >= SCALE_DOWN_IDLE_S:
+                    self._retire(entry, "scale_down")
+        if POOL_IDLE_S:
+            for entry in self._entries():
+                if self._evictable(entry) and now - entry.last_used >= POOL_IDLE_S:
+                    self._retire(entry, "idle")
+        if POOL_RSS_BUDGET_MB:
+            await self.enforce_budget()
+
+
+    async def evict_loop(self):
+        while True:
+            await asyncio.sleep(POOL_INTERVAL_S)
+            try:
+                await self.sweep()
+            except Exception as e:
+                log_event("pool.sweep_failed", logging.ERROR, error=str(e))
+
+
+    async def close(self):
+        entries = self._entries()
+        for entry in entries:
+            self._retire(entry, "shutdown")
+            entry.stop.set()
+        tasks = [e.task for e in entries if e.task is not None]
+        if tasks:
+            await asyncio.wait(tasks, timeout=10)
+        for client in self.http_clients.values():
+            await client.aclose()
+        self.http_clients.clear()
+
+
+pool = SessionPool()
+
+
+@register_collector
+def _pool_gauges() -> list[str]:
+    entries = pool._entries()
+    lines = ["# HELP craftmcp_pool_sessions Warm MCP sessions held by the API",
+             "# TYPE craftmcp_pool_sessions gauge",
+             f"craftmcp_pool_sessions {len(entries)}",
+             "# HELP craftmcp_pool_replicas Warm sessions per MCP",
+             "# TYPE craftmcp_pool_replicas gauge"]
+    lines += [f'craftmcp_pool_replicas{{mcp_id="{mcp_id}"}} {len(replicas)}' for mcp_id, replicas in list(pool.sessions.items())]
+    return lines + ["# HELP craftmcp_pool_rss_bytes Resident memory of pooled MCP servers at the last sweep",
+                    "# TYPE craftmcp_pool_rss_bytes gauge",
+                    f"craftmcp_pool_rss_bytes {int(sum(e.rss_mb for e in entries) * 1024 * 1024)}"]
@@ -0,0 +1,228 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pydantic import BaseModel
+from collections import Counter
+from threading import Thread, Event
+import cProfile
+import pstats
+import marshal
+import hashlib
+import asyncio
+import base64
+import signal
+import json
+import time
+import sys
+import io
+import os
+from system_db_handler import SystemDBHandler
+from supervisor_handler import find_mcp_pids, has_hook
+
+
+router = APIRouter()
+db = SystemDBHandler()
+security = HTTPBearer()
+
+
+MCP_DIR = "mcps_servers"
+MAX_DURATION_S = 120
+PROFILE_REQUEST_FILE = "profile_request.json"
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _require_admin(token: str):
+    token_hash = hash_token(token)
+    user = db.fetch_records("users", f"token='{token_hash}' AND is_admin=1")
+    if not user:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+
+
+class ProfileRequest(BaseModel):
+    duration_s: float = 10
+    mode: str = "sampling"        # sampling | deterministic
+    format: str = "collapsed"     # collapsed | pstats
+    interval_ms: float = 5        # sampling only
+
+
+class MCPProfileRequest(ProfileRequest):
+    mcp_id: int
+
+
+def _validate(payload: ProfileRequest):
+    if payload.mode not in ["sampling", "deterministic"]:
+        raise HTTPException(status_code=400, detail="mode must be 'sampling' or 'deterministic'")
+    if payload.format not in ["collapsed", "pstats"]:
+        raise HTTPException(status_code=400, detail="format must be 'collapsed' or 'pstats'")
+    if payload.mode == "sampling" and payload.format == "pstats":
+        raise HTTPException(status_code=400, detail="pstats output requires mode 'deterministic'")
+    if not 0 < payload.duration_s <= MAX_DURATION_S:
+        raise HTTPException(status_code=400, detail=f"duration_s must be in (0, {MAX_DURATION_S}]")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    # Samples every thread's stack from a background thread, nothing runs while stopped
+
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = Event()
+        self._thread = None
+
+
+    def _run(self):
+        own = self._thread.ident
+        while not self._stop.wait(self.interval_s):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="craftmcp-sampler", daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def _pstats_payload(profile: cProfile.Profile) -> dict:
+    profile.create_stats()
+    # pstats.Stats() empties profile.stats, dump first
+    data = marshal.dumps(profile.stats)
+    summary = io.StringIO()
+    pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+    return {
+        "format": "pstats",
+        # base64 of a marshal dump, load with pstats.Stats(path) after decoding to a file
+        "data": base64.b64encode(data).decode(),
+        "summary": summary.getvalue(),
+    }
+
+
+def _collapsed_from_profile(profile: cProfile.Profile) -> str:
+    # Deterministic profiles have no stacks, emit caller;callee edges weighted by time in microseconds
+    profile.create_stats()
+    lines = []
+    for (filename, line, func), (_, _, tottime, _, callers) in profile.stats.items():
+        label = f"{func} ({os.path.basename(filename)}:{line})"
+        if not callers:
+            lines.append(f"{label} {int(tottime * 1e6)}")
+        for (c_file, c_line, c_func), (_, _, c_tottime, _) in callers.items():
+            lines.append(f"{c_func} ({os.path.basename(c_file)}:{c_line});{label} {int(c_tottime * 1e6)}")
+    return "\n".join(line for line in lines if not line.endswith(" 0"))
+
+
+@router.post("/profile-api")
+async def profile_api(
+    payload: ProfileRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    _require_admin(credentials.credentials)
+    _validate(payload)
+
+    started = time.time()
+    if payload.mode == "sampling":
+        profiler = SamplingProfiler(payload.interval_ms / 1000)
+        profiler.start()
+        try:
+            await asyncio.sleep(payload.duration_s)
+        finally:
+            profiler.stop()
+        return {"status": "success", "target": "api", "pid": os.getpid(), "started_at": started,
+                "format": "collapsed", "samples": profiler.samples, "data": profiler.collapsed()}
+
+    # cProfile hooks the calling thread only, here the event loop thread
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        await asyncio.sleep(payload.duration_s)
+    finally:
+        profile.disable()
+
+    if payload.format == "pstats":
+        return {"status": "success", "target": "api", "pid": os.getpid(), "started_at": started, **_pstats_payload(profile)}
+    return {"status": "success", "target": "api", "pid": os.getpid(), "started_at": started,
+            "format": "collapsed", "data": _collapsed_from_profile(profile)}
+
+
+@router.post("/profile-mcp")
+async def profile_mcp(
+    payload: MCPProfileRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    _require_admin(credentials.credentials)
+    _validate(payload)
+
+    mcp = db.fetch_records("mcps", f"id={payload.mcp_id}")
+    if not mcp:
+        raise HTTPException(status_code=404, detail="MCP not found")
+
+    folder_path = os.path.join(MCP_DIR, f"mcp_{payload.mcp_id}")
+    pids = find_mcp_pids(payload.mcp_id, python_only=True)
+    if not os.path.isdir(folder_path) or not pids:
+        raise HTTPException(status_code=409, detail="No running server process for this MCP")
+    # SIGUSR1 terminates servers started from a file without the profiling hook
+    pids = [pid for pid in pids if has_hook(pid, "profile")]
+    if not pids:
+        raise HTTPException(status_code=409, detail="The running server was exported without the profiling hook, re-run the MCP first")
+
+    request_id = os.urandom(6).hex()
+    with open(os.path.join(folder_path, PROFILE_REQUEST_FILE), "w") as f:
+        json.dump({
+            "id": request_id,
+            "mode": payload.mode,
+            "format": payload.format,
+            "duration_s": payload.duration_s,
+            "interval_ms": payload.interval_ms
+        }, f)
+
+    # The generated hook starts on SIGUSR1 and writes profile_<id>_<pid>.json when the window ends
+    signalled = []
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGUSR1)
+            signalled.append(pid)
+        except ProcessLookupError:
+            continue
+
+    results = {}
+    await asyncio.sleep(payload.duration_s)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and len(results) < len(signalled):
+        await asyncio.sleep(0.25)
+        for pid in signalled:
+            path = os.path.join(folder_path, f"profile_{request_id}_{pid}.json")
+            if pid in results or not os.path.exists(path):
+                continue
+            with open(path) as f:
+                results[pid] = json.load(f)
+            os.remove(path)
+
+    return {
+        "status": "success" if results else "timeout",
+        "target": "mcp",
+        "mcp_id": payload.mcp_id,
+        "signalled_pids": signalled,
+        "profiles": results
+    }
@@ -5,6 +5,8 @@ from datetime import datetime
 import hashlib
 import json
 from system_db_handler import SystemDBHandler
+from codegen_handler import render_component
+from reload_handler import hot_reload
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
@@ -12,20 +14,6 @@ db = SystemDBHandler()
 security = HTTPBearer()
 
 
-def render_function_signature(param_dict: dict) -> str:
-    params = []
-    for name, val in param_dict.items():
-        if isinstance(val, dict):
-            type_str = val.get("type", "str")
-            default = val.get("default")
-            if isinstance(default, str):
-                default = f'"{default}"'
-            params.append(f"{name}: {type_str} = {default}")
-        else:
-            params.append(f"{name}: {val}")
-    return ", ".join(params)
-
-
 def hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
@@ -67,11 +55,10 @@ def create_prompt(
         "created_at": datetime.utcnow().isoformat()
     }
 
-    signature = render_function_signature(payload.params)
-    skeleton_code = f'''@mcp.prompt()
-def {payload.prompt_name}({signature}) -> str:
-    {payload.snippet.strip()}
-'''
+    try:
+        skeleton_code = render_component("prompt", metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.create_record("prompts", {
         "name": payload.prompt_name,
@@ -189,6 +176,7 @@ def unlink_prompt(
 class PromptPatch(BaseModel):
     prompt_name: str | None = None
     snippet: str | None = None
+    params: dict | None = None
 
 @router.post("/modify-prompt")
 def modify_prompt(
@@ -212,16 +200,18 @@ def modify_prompt(
         raise HTTPException(status_code=403, detail="Not allowed to modify")
 
     metadata = json.loads(prompt[0][5])
+    old_name = metadata["prompt_name"]
     if patch.prompt_name:
         metadata["prompt_name"] = patch.prompt_name
     if patch.snippet:
         metadata["snippet"] = patch.snippet
+    if patch.params is not None:
+        metadata["params"] = patch.params
 
-    skeleton_code = f'''@mcp.prompt()
-def {metadata["prompt_name"]}(message: str) -> str:
-    """Generated prompt"""
-    {metadata["snippet"].strip()}
-'''
+    try:
+        skeleton_code = render_component("prompt", metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.update_record("prompts", {
         "name": metadata["prompt_name"],
@@ -230,7 +220,8 @@ def {metadata["prompt_name"]}(message: str) -> str:
         "skeleton_code": skeleton_code
     }, f"id={prompt_id}")
 
-    return {"status": "modified", "prompt": metadata["prompt_name"]}
+    reloaded = hot_reload("prompt", metadata, old_name, credentials)
+    return {"status": "modified", "prompt": metadata["prompt_name"], "reloaded": reloaded}
 
 @router.get("/export-prompt")
 def export_prompt(
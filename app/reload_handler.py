@@ -0,0 +1,101 @@
+# Hot reload of tools, prompts and resources into running servers. The changed
+# component goes to reload_request.json in the MCP folder and every server process
+# started with the hook gets SIGUSR2, the generated reload hook swaps the function in
+# place and answers with reload_<id>_<pid>.json. The exported file is rewritten first,
+# so process workers, restarts and in-process sessions load the new code from it.
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+import signal
+import time
+import json
+import os
+from codegen_handler import render_component
+from runtime_handler import export_full_mcp, RunRequest
+from supervisor_handler import find_mcp_pids, has_hook
+from logging_handler import log_event
+from pool_handler import pool
+import logging
+
+
+MCP_DIR = "mcps_servers"
+RELOAD_REQUEST_FILE = "reload_request.json"
+RELOAD_TIMEOUT_S = float(os.environ.get("CRAFTMCP_RELOAD_TIMEOUT_S", "5"))
+
+
+def _write(path: str, content: str):
+    with open(path + ".tmp", "w") as f:
+        f.write(content)
+    os.replace(path + ".tmp", path)
+
+
+def _reload_mcp(mcp_id: int, component: dict, credentials: HTTPAuthorizationCredentials) -> dict:
+    folder_path = os.path.join(MCP_DIR, f"mcp_{mcp_id}")
+    script_path = os.path.join(folder_path, f"mcp_{mcp_id}.py")
+    if not os.path.exists(script_path):
+        # Never exported, the next export picks the change up
+        return {"mcp_id": mcp_id, "status": "not_exported"}
+
+    try:
+        code = export_full_mcp(RunRequest(mcp_id=mcp_id), credentials)["exported_code"]
+    except HTTPException as e:
+        return {"mcp_id": mcp_id, "status": "failed", "error": e.detail}
+    _write(script_path, code)
+    mtime = os.stat(script_path).st_mtime_ns
+
+    pids = find_mcp_pids(mcp_id, python_only=True)
+    if not pids:
+        return {"mcp_id": mcp_id, "status": "exported"}
+    # Judged by what each process was started from, not the file just rewritten:
+    # SIGUSR2 terminates a server without the hook
+    hooked = [pid for pid in pids if has_hook(pid, "reload")]
+    stale = [pid for pid in pids if pid not in hooked]
+    if not hooked:
+        # Running servers keep the old code until restarted, pooled sessions restart on their next call
+        return {"mcp_id": mcp_id, "status": "restart_required", "pids": pids}
+
+    request_id = os.urandom(6).hex()
+    _write(os.path.join(folder_path, RELOAD_REQUEST_FILE), json.dumps({"id": request_id, **component}))
+    signalled = []
+    for pid in hooked:
+        try:
+            os.kill(pid, signal.SIGUSR2)
+            signalled.append(pid)
+        except ProcessLookupError:
+            continue
+
+    acks = {}
+    deadline = time.monotonic() + RELOAD_TIMEOUT_S
+    while len(acks) < len(signalled) and time.monotonic() < deadline:
+        time.sleep(0.02)
+        for pid in signalled:
+            path = os.path.join(folder_path, f"reload_{request_id}_{pid}.json")
+            if pid in acks or not os.path.exists(path):
+                continue
+            with open(path) as f:
+                acks[pid] = json.load(f)
+            os.remove(path)
+
+    reloaded = [ack for ack in acks.values() if ack["status"] == "reloaded"]
+    # Replicas that swapped the code in place stay warm on the rewritten file
+    pool.reloaded(mcp_id, mtime, {ack["session"] for ack in reloaded})
+    errors = {pid: ack["error"] for pid, ack in acks.items() if ack["status"] != "reloaded"}
+    missing = [pid for pid in signalled if pid not in acks]
+    status = "reloaded" if len(reloaded) == len(signalled) and not stale else "partial" if reloaded else "failed"
+    log_event("mcp.reload", logging.INFO if status == "reloaded" else logging.WARNING, mcp_id=mcp_id,
+              kind=component["kind"], key=component["key"], status=status, pids=signalled, errors=errors, missing=missing,
+              restart_required=stale)
+    return {"mcp_id": mcp_id, "status": status, "pids": [ack["pid"] for ack in reloaded], "errors": errors, "no_answer": missing,
+            "restart_required": stale}
+
+
+def hot_reload(kind: str, metadata: dict, old_key: str | None, credentials: HTTPAuthorizationCredentials) -> list[dict]:
+    # kind: tool | prompt | resource. Tools and prompts are keyed by name, resources by path template.
+    component = {
+        "kind": kind,
+        "key": metadata["path_template"] if kind == "resource" else metadata[f"{kind}_name"],
+        "old_key": old_key,
+        "code": render_component(kind, metadata),
+        "execution": metadata.get("execution", "inline"),
+    }
+    return [_reload_mcp(mcp_id, component, credentials) for mcp_id in metadata.get("linked_mcp_ids", [])]
@@ -5,6 +5,8 @@ from datetime import datetime
 import hashlib
 import json
 from system_db_handler import SystemDBHandler
+from codegen_handler import render_component
+from reload_handler import hot_reload
 from fastapi.responses import JSONResponse
 
 router = APIRouter()
@@ -12,20 +14,6 @@ db = SystemDBHandler()
 security = HTTPBearer()
 
 
-def render_function_signature(param_dict: dict) -> str:
-    params = []
-    for name, val in param_dict.items():
-        if isinstance(val, dict):
-            type_str = val.get("type", "str")
-            default = val.get("default")
-            if isinstance(default, str):
-                default = f'"{default}"'
-            params.append(f"{name}: {type_str} = {default}")
-        else:
-            params.append(f"{name}: {val}")
-    return ", ".join(params)
-
-
 def hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
@@ -69,11 +57,10 @@ def create_resource(
         "created_at": datetime.utcnow().isoformat()
     }
 
-    signature = render_function_signature(payload.params)
-    skeleton_code = f'''@mcp.resource("{payload.path_template}")
-def {payload.resource_name}({signature}) -> str:
-    {payload.snippet.strip()}
-'''
+    try:
+        skeleton_code = render_component("resource", metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.create_record("resources", {
         "name": payload.resource_name,
@@ -198,6 +185,7 @@ class ResourcePatch(BaseModel):
     resource_name: str | None = None
     path_template: str | None = None
     snippet: str | None = None
+    params: dict | None = None
 
 @router.post("/modify-resource")
 def modify_resource(
@@ -222,18 +210,20 @@ def modify_resource(
         raise HTTPException(status_code=403, detail="Not allowed to modify")
 
     metadata = json.loads(resource[0][5])
+    old_template = metadata["path_template"]
     if patch.resource_name:
         metadata["resource_name"] = patch.resource_name
     if patch.path_template:
         metadata["path_template"] = patch.path_template
     if patch.snippet:
         metadata["snippet"] = patch.snippet
+    if patch.params is not None:
+        metadata["params"] = patch.params
 
-    skeleton_code = f'''@mcp.resource("{metadata["path_template"]}")
-def {metadata["resource_name"]}() -> str:
-    """Generated resource"""
-    {metadata["snippet"].strip()}
-'''
+    try:
+        skeleton_code = render_component("resource", metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.update_record("resources", {
         "name": metadata["resource_name"],
@@ -242,7 +232,8 @@ def {metadata["resource_name"]}() -> str:
         "skeleton_code": skeleton_code
     }, f"id={resource_id}")
 
-    return {"status": "modified", "resource": metadata["resource_name"]}
+    reloaded = hot_reload("resource", metadata, old_template, credentials)
+    return {"status": "modified", "resource": metadata["resource_name"], "reloaded": reloaded}
 
 
 @router.get("/export-resource")
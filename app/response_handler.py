@@ -0,0 +1,149 @@
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from pydantic import BaseModel
+import asyncio
+import orjson
+import gzip
+import zlib
+import os
+from metrics_handler import Counter
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Bodies below this size are sent as is, compressing them costs more than it saves
+COMPRESS_MIN_BYTES = int(os.environ.get("CRAFTMCP_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("CRAFTMCP_GZIP_LEVEL", "5"))
+ZSTD_LEVEL = int(os.environ.get("CRAFTMCP_ZSTD_LEVEL", "3"))
+# Larger whole bodies are compressed off the event loop
+OFFLOAD_BYTES = 1024 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+response_bytes = Counter("craftmcp_http_response_bytes_total", "Compressed response bodies before and after encoding", ("encoding", "stage"))
+
+
+def _default(obj):
+    # MCP results are pydantic models, dumped the way jsonable_encoder would
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json", by_alias=True)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    # orjson rendering, also takes pydantic models anywhere in the content.
+    # Returned directly from a handler it skips FastAPI's jsonable_encoder pass.
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def json_line(content) -> bytes:
+    # One NDJSON record, for streamed responses
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    # zstd when the client takes it and zstandard is installed, gzip otherwise
+    offered = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.strip().lower()] = q
+    for encoding in ("zstd", "gzip"):
+        if encoding == "zstd" and zstandard is None:
+            continue
+        if offered.get(encoding, offered.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _stream_compressor(encoding: str):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def _stream_flush(encoding: str, compressor) -> bytes:
+    # Ends the current block so every chunk reaches the client when it is sent, not at the end
+    if encoding == "zstd":
+        return compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+    return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    # Plain ASGI middleware, negotiates Accept-Encoding for JSON and text bodies.
+    # Whole bodies are compressed in one go, streamed ones chunk by chunk.
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"start": None, "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether compression pays off
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if state["start"] is not None:
+                start, state["start"] = state["start"], None
+                headers = MutableHeaders(raw=start["headers"])
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or (not more and len(body) < COMPRESS_MIN_BYTES)):
+                    state["passthrough"] = True
+                    await send(start)
+                    await send(message)
+                    return
+
+                headers["content-encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more:
+                    compressed = (await asyncio.to_thread(_compress, encoding, body) if len(body) > OFFLOAD_BYTES
+                                  else _compress(encoding, body))
+                    response_bytes.inc((encoding, "raw"), len(body))
+                    response_bytes.inc((encoding, "sent"), len(compressed))
+                    headers["content-length"] = str(len(compressed))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+                del headers["content-length"]
+                state["compressor"] = _stream_compressor(encoding)
+                await send(start)
+
+            chunk = state["compressor"].compress(body)
+            chunk += state["compressor"].flush() if not more else _stream_flush(encoding, state["compressor"])
+            response_bytes.inc((encoding, "raw"), len(body))
+            response_bytes.inc((encoding, "sent"), len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": more})
+
+        await self.app(scope, receive, send_wrapper)
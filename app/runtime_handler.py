@@ -1,14 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
-from subprocess import Popen, PIPE
 import os
 import json
 import hashlib
-from datetime import datetime
 from system_db_handler import SystemDBHandler
-import re
-from signal import SIGTERM
+from metrics_handler import register_collector, mcp_restarts
+from tracing_handler import span
+from codegen_handler import render_hooks, render_entrypoint, render_lifespan, render_component, render_globals, render_imports
+from blob_handler import BLOB_DIR
+from builtin_handler import render_builtins, builtin_dependencies
+from supervisor_handler import spawn_mcp_process, terminate_mcp_process, set_status, usage, applied, stderr_tail
+from logging_handler import log_event, annotate
+from pool_handler import pool
+import logging
+import time
 import shutil
 import subprocess
 
@@ -20,25 +26,65 @@ security = HTTPBearer()
 
 MCP_DIR = "mcps_servers"
 os.makedirs(MCP_DIR, exist_ok=True)
+# Token buckets of generated servers, one file for every MCP on the host so servers sharing an API key share its quota
+RATE_DB = os.path.abspath(os.environ.get("CRAFTMCP_RATE_DB", "ratelimits.db"))
+# Vector collections of the vector_index built-in, outside mcps_servers/ so they outlive /stop-mcp
+VECTOR_DIR = os.path.abspath(os.environ.get("CRAFTMCP_VECTOR_DIR", "vectors"))
 
 
-def render_function_signature(param_dict: dict) -> str:
-    params = []
-    for name, val in param_dict.items():
-        if isinstance(val, dict):
-            type_str = val.get("type", "str")
-            default = val.get("default")
-            if isinstance(default, str):
-                default = f'"{default}"'
-            params.append(f"{name}: {type_str} = {default}")
-        else:
-            params.append(f"{name}: {val}")
-    return ", ".join(params)
+@register_collector
+def _mcp_process_gauge() -> list[str]:
+    counts = {"running": 0, "failed": 0, "stopped": 0}
+    for row in db.fetch_records("mcp_status"):
+        counts[row[1]] = counts.get(row[1], 0) + 1
+    lines = ["# HELP craftmcp_mcp_processes MCP server processes by status",
+             "# TYPE craftmcp_mcp_processes gauge"]
+    for status, count in counts.items():
+        lines.append(f'craftmcp_mcp_processes{{status="{status}"}} {count}')
+    return lines
 
 
 def hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
+
+IMPORT_REPORT_TOP = 10
+# Written just before the module runs, imports logged earlier belong to interpreter startup and
+# runpy (pkgutil is what run_path imports on first use)
+IMPORT_REPORT_MARK = "craftmcp: module import starts"
+
+
+def import_report(folder_path: str, file_name: str) -> dict | None:
+    # Loads the server module once under -X importtime in its own venv, without serving.
+    # Returns the slowest imports done at load time, the cost of every cold start.
+    script = f"import runpy, pkgutil, sys; print({IMPORT_REPORT_MARK!r}, file=sys.stderr, flush=True); runpy.run_path({file_name!r})"
+    try:
+        completed = subprocess.run(["uv", "run", "python", "-X", "importtime", "-c", script],
+                                   cwd=folder_path, capture_output=True, text=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log_event("run_mcp.import_report_failed", logging.WARNING, error=str(e))
+        return None
+    entries = []
+    lines = completed.stderr.splitlines()
+    if IMPORT_REPORT_MARK in lines:
+        lines = lines[lines.index(IMPORT_REPORT_MARK) + 1:]
+    for line in lines:
+        # import time: self [us] | cumulative | imported package, nested imports are indented
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, package = line.split("|", 2)
+        package = package.rstrip()
+        entries.append((len(package) - len(package.lstrip()), package.strip(), int(cumulative_us)))
+    if not entries:
+        return None
+    top_level = min(depth for depth, _, _ in entries)
+    direct = sorted(((name, us) for depth, name, us in entries if depth == top_level), key=lambda e: -e[1])
+    return {
+        "total_ms": round(sum(us for _, us in direct) / 1000, 1),
+        "slowest": [{"module": name, "ms": round(us / 1000, 1)} for name, us in direct[:IMPORT_REPORT_TOP]],
+        "error": completed.stderr.strip().splitlines()[-1] if completed.returncode else None,
+    }
+
 class RunRequest(BaseModel):
     mcp_id: int
 
@@ -67,8 +113,8 @@ def export_full_mcp(
 
     mcp_metadata = json.loads(mcp[0][4])
     mcp_name = mcp_metadata["name"]
-    imports = "\n".join(mcp_metadata.get("imports", []))
-    globals_block = "\n".join(f"{k} = {json.dumps(v)}" for k, v in mcp_metadata.get("globals", {}).items())
+    imports = render_imports(mcp_metadata)
+    globals_block = render_globals(mcp_metadata.get("globals", {}))
 
     tools = db.fetch_records("tools", f"owner='{username}'" if not is_admin else None)
     resources = db.fetch_records("resources", f"owner='{username}'" if not is_admin else None)
@@ -83,23 +129,12 @@ def export_full_mcp(
         result = []
         for row in table:
             try:
-                if kind == "tool":
-                    metadata_idx = 6
-                    code_idx = 7
-                else:
-                    metadata_idx = 5
-                    code_idx = 6
-        
+                metadata_idx = 6 if kind == "tool" else 5
                 metadata = json.loads(row[metadata_idx])
                 linked = metadata.get("linked_mcp_ids", [])
                 if payload.mcp_id in linked:
-                    params = metadata.get("params", {})
-                    original_code = row[code_idx]
-                    signature = render_function_signature(params)
-        
-                    # Replace function signature dynamically
-                    modified_code = re.sub(r"def\s+\w+\(.*?\)", lambda m: f"def {m.group(0).split()[1].split('(')[0]}({signature})", original_code)
-                    result.append(modified_code)
+                    # Rendered from the stored metadata, so the signature always follows the current params
+                    result.append(render_component(kind, metadata))
             except Exception as e:
                 raise HTTPException(status_code=500, detail=f"Failed to parse {kind} id={row[0]}: {e}")
         return result
@@ -108,6 +143,16 @@ def export_full_mcp(
     tools_code = "\n\n".join(collect_code(tools, "tool"))
     resources_code = "\n\n".join(collect_code(resources, "resource"))
     prompts_code = "\n\n".join(collect_code(prompts, "prompt"))
+    tool_execution = {}
+    for row in tools:
+        tool_metadata = json.loads(row[6])
+        if payload.mcp_id in tool_metadata.get("linked_mcp_ids", []):
+            tool_execution[row[1]] = tool_metadata.get("execution", "inline")
+    builtins_code = render_builtins(mcp_metadata, payload.mcp_id, VECTOR_DIR)
+    lifespan_code = render_lifespan(mcp_metadata)
+    lifespan_arg = ", lifespan=_craft_lifespan" if lifespan_code else ""
+    hooks_code = render_hooks(mcp_metadata, tool_execution, BLOB_DIR, RATE_DB)
+    entrypoint_code = render_entrypoint(mcp_metadata)
 
 
     # Final file content
@@ -118,7 +163,9 @@ from mcp.server.fastmcp import FastMCP
 
 {globals_block}
 
-mcp = FastMCP("{mcp_name}")
+{lifespan_code}
+
+mcp = FastMCP("{mcp_name}"{lifespan_arg})
 
 # Resources
 {resources_code}
@@ -126,13 +173,24 @@ mcp = FastMCP("{mcp_name}")
 # Tools
 {tools_code}
 
+# Built-in tools
+{builtins_code}
+
 # Prompts
 {prompts_code}
 
-if __name__ == "__main__":
-    mcp.run(transport="stdio")
+# Runtime hooks
+{hooks_code}
+
+{entrypoint_code}
 """
 
+    # Catches what the per-component checks cannot, e.g. an import line broken before validation existed
+    try:
+        compile(full_code, f"mcp_{payload.mcp_id}.py", "exec")
+    except SyntaxError as e:
+        raise HTTPException(status_code=422, detail=f"Generated server does not compile: {e.msg} (line {e.lineno}: {(e.text or '').strip()})")
+
     return {
     "status": "success",
     "mcp_id": payload.mcp_id,
@@ -146,36 +204,34 @@ def run_mcp(
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
     import shutil
-    from subprocess import run, Popen
-    import re
+    from subprocess import run
 
-    print(">>> Step 1: Starting /run-mcp")
+    log_event("run_mcp.start", mcp_id=payload.mcp_id)
 
-    token = credentials.credentials
-    token_hash = hash_token(token)
-    user = db.fetch_records("users", f"token='{token_hash}'")
+    with span("auth"):
+        token = credentials.credentials
+        token_hash = hash_token(token)
+        user = db.fetch_records("users", f"token='{token_hash}'")
     if not user:
         raise HTTPException(status_code=403, detail="Unauthorized")
 
     username = user[0][1]
     is_admin = bool(user[0][3])
 
-    print(f">>> Step 2: Authenticated user: {username}, is_admin={is_admin}")
+    annotate(user=username)
 
     # Fetch MCP
-    mcp = db.fetch_records("mcps", f"id={payload.mcp_id}")
+    with span("db.lookup", mcp_id=payload.mcp_id):
+        mcp = db.fetch_records("mcps", f"id={payload.mcp_id}")
     if not mcp:
         raise HTTPException(status_code=404, detail="MCP not found")
     if not is_admin and mcp[0][3] != username:
         raise HTTPException(status_code=403, detail="Not allowed to run this MCP")
 
-    print(f">>> Step 3: MCP found for ID {payload.mcp_id}")
-
-    mcp_code_response = export_full_mcp(payload, credentials)
+    with span("mcp.export", mcp_id=payload.mcp_id):
+        mcp_code_response = export_full_mcp(payload, credentials)
     code = mcp_code_response["exported_code"]
 
-    print(">>> Step 4: Full MCP code exported")
-
     # Save path
     folder_path = os.path.join(MCP_DIR, f"mcp_{payload.mcp_id}")
     os.makedirs(folder_path, exist_ok=True)
@@ -184,89 +240,86 @@ def run_mcp(
     with open(file_path, "w") as f:
         f.write(code)
 
-    print(f">>> Step 5: MCP file written to {file_path}")
+    log_event("run_mcp.exported", mcp_id=payload.mcp_id, path=file_path, code_bytes=len(code))
 
     # Init uv project & venv (if not already done)
     if not os.path.exists(os.path.join(folder_path, "pyproject.toml")):
         with open(os.path.join(folder_path, "pyproject.toml"), "w") as f:
             f.write('[project]\nname = "mcp_project"\nversion = "0.1.0"\n')
 
-    print(">>> Step 6: pyproject.toml ensured")
+    previous_status = db.fetch_records("mcp_status", f"mcp_id={payload.mcp_id}")
+    if previous_status and previous_status[0][1] in ["running", "failed"]:
+        mcp_restarts.inc((payload.mcp_id,))
 
     # Init virtual env & install (can comment out pip install for now)
     try:
-        print(">>> Step 7: Running uv venv")
-        run(["uv", "venv"], cwd=folder_path, check=True)
-
-        run(["uv", "pip", "install", "mcp"], cwd=folder_path, check=True)
-
-        # Re-install user libraries inside this MCP's venv
-        user_libs = db.fetch_records("libraries", f"installed_by='{username}'")
-        for lib in user_libs:
-            lib_name = lib[1]
-            print(f">>> Installing {lib_name} into MCP venv...")
-            run(["uv", "pip", "install", lib_name], cwd=folder_path, check=True)
-
-        print(">>> Step 8: Running uv script")
-        process = Popen(
-            ["uv", "run", f"mcp_{payload.mcp_id}.py"],
-            cwd=folder_path,
-            stdout=PIPE,
-            stderr=PIPE
-        )
-
-        #Check for crash within 3 seconds
+        build_start = time.perf_counter()
+        with span("mcp.build", mcp_id=payload.mcp_id):
+            run(["uv", "venv"], cwd=folder_path, check=True)
+
+            run(["uv", "pip", "install", "mcp"], cwd=folder_path, check=True)
+
+            # Re-install user libraries inside this MCP's venv
+            user_libs = db.fetch_records("libraries", f"installed_by='{username}'")
+            for lib in user_libs:
+                lib_name = lib[1]
+                log_event("run_mcp.install_library", mcp_id=payload.mcp_id, library=lib_name)
+                run(["uv", "pip", "install", lib_name], cwd=folder_path, check=True)
+
+            # Packages the enabled built-in tools import, e.g. numpy for embed_texts
+            packages = builtin_dependencies(json.loads(mcp[0][4]))
+            if packages:
+                log_event("run_mcp.install_builtin_dependencies", mcp_id=payload.mcp_id, packages=packages)
+                run(["uv", "pip", "install", *packages], cwd=folder_path, check=True)
+
+        log_event("run_mcp.built", mcp_id=payload.mcp_id, duration_ms=round((time.perf_counter() - build_start) * 1000, 3))
+        with span("mcp.importtime", mcp_id=payload.mcp_id):
+            imports = import_report(folder_path, f"mcp_{payload.mcp_id}.py")
+        if imports:
+            log_event("run_mcp.import_report", mcp_id=payload.mcp_id, **imports)
+        # Replace a server still running from a previous launch
+        terminate_mcp_process(payload.mcp_id)
+        mcp_metadata = json.loads(mcp[0][4])
+        with span("mcp.spawn", mcp_id=payload.mcp_id):
+            process = spawn_mcp_process(payload.mcp_id, mcp_metadata.get("limits", {}))
+
+        #Check for crash within 5 seconds, stdin stays open so a healthy stdio server keeps running
         try:
-            output, error = process.communicate(timeout=5)
-            if process.returncode != 0:
-                #Script failed immediately — track as failed
-                db.update_record("mcp_status", {
-                    "status": "failed",
-                    "pid": process.pid
-                }, f"mcp_id={payload.mcp_id}") if db.fetch_records("mcp_status", f"mcp_id={payload.mcp_id}") \
-                    else db.create_record("mcp_status", {
-                        "mcp_id": payload.mcp_id,
-                        "status": "failed",
-                        "pid": process.pid
-                    })
-
-                # Delete environment folder
-                mcp_folder = os.path.join(MCP_DIR, f"mcp_{payload.mcp_id}")
-                try:
-                    shutil.rmtree(mcp_folder)
-                    print(f">>> Cleaned up failed MCP folder: {mcp_folder}")
-                except Exception as e:
-                    print(f">>> Cleanup failed: {e}")
-
-
-                return {
-                    "status": "failed",
-                    "pid": process.pid,
-                    "path": file_path,
-                    "error": error.decode().strip()
-                }
+            process.wait(timeout=5)
+            error = stderr_tail(payload.mcp_id).strip()
+            #Script exited immediately — track as failed
+            terminate_mcp_process(payload.mcp_id)
+            set_status(payload.mcp_id, "failed", process.pid)
+
+            # Delete environment folder
+            mcp_folder = os.path.join(MCP_DIR, f"mcp_{payload.mcp_id}")
+            try:
+                shutil.rmtree(mcp_folder)
+            except Exception as e:
+                log_event("run_mcp.cleanup_failed", logging.WARNING, mcp_id=payload.mcp_id, error=str(e))
+
+            log_event("run_mcp.failed", logging.ERROR, mcp_id=payload.mcp_id, pid=process.pid, error=error[-2000:])
+
+
+            return {
+                "status": "failed",
+                "pid": process.pid,
+                "path": file_path,
+                "error": error,
+                "import_report": imports
+            }
 
         except subprocess.TimeoutExpired:
             #Still running — mark as running
-            existing_status = db.fetch_records("mcp_status", f"mcp_id={payload.mcp_id}")
-            if existing_status:
-                db.update_record("mcp_status", {
-                    "status": "running",
-                    "pid": process.pid
-                }, f"mcp_id={payload.mcp_id}")
-            else:
-                db.create_record("mcp_status", {
-                    "mcp_id": payload.mcp_id,
-                    "status": "running",
-                    "pid": process.pid
-                })
-
-            print(f">>> Step 9: MCP server launched with PID {process.pid}")
+            set_status(payload.mcp_id, "running", process.pid)
+
+            log_event("run_mcp.started", mcp_id=payload.mcp_id, pid=process.pid)
 
             return {
                 "status": "started",
                 "pid": process.pid,
-                "path": file_path
+                "path": file_path,
+                "import_report": imports
             }
 
     except Exception as e:
@@ -294,11 +347,16 @@ def mcps_status(credentials: HTTPAuthorizationCredentials = Depends(security)):
         mcp_name = mcp[1]
         status_row = db.fetch_records("mcp_status", f"mcp_id={mcp_id}")
         status = status_row[0][1] if status_row else "stopped"
+        limits = json.loads(mcp[4]).get("limits", {})
 
         result.append({
             "id": mcp_id,
             "name": mcp_name,
-            "status": status
+            "status": status,
+            "usage": usage.get(mcp_id) if status == "running" else None,
+            "limits": limits,
+            "limits_applied": applied.get(mcp_id) if limits else None,
+            "sessions": [replica.snapshot() for replica in pool.sessions.get(mcp_id, [])]
         })
     
     return result
@@ -326,6 +384,7 @@ def stop_mcp(
 
     if not is_admin and mcp[0][3] != username:
         raise HTTPException(status_code=403, detail="Not allowed to stop this MCP")
+    annotate(user=username)
 
     # Get status and PID
     status_row = db.fetch_records("mcp_status", f"mcp_id={payload.mcp_id}")
@@ -338,13 +397,9 @@ def stop_mcp(
     if current_status in ["stopped", "failed"]:
         return {"status": f"already {current_status}", "mcp_id": payload.mcp_id}
 
-    # Attempt kill
-    if pid:
-        try:
-            os.kill(pid, SIGTERM)
-            print(f">>> Killed PID {pid}")
-        except ProcessLookupError:
-            print(f">>> PID {pid} not found, already exited")
+    # Kill the launcher and every server process of this MCP
+    terminate_mcp_process(payload.mcp_id)
+    log_event("stop_mcp.killed", mcp_id=payload.mcp_id, pid=pid)
 
     # Mark stopped
     db.update_record("mcp_status", {"status": "stopped", "pid": None}, f"mcp_id={payload.mcp_id}")
@@ -353,9 +408,8 @@ def stop_mcp(
     mcp_folder = os.path.join(MCP_DIR, f"mcp_{payload.mcp_id}")
     try:
         shutil.rmtree(mcp_folder)
-        print(f">>> Deleted MCP folder {mcp_folder}")
     except Exception as e:
-        print(f">>> Failed to delete: {e}")
+        log_event("stop_mcp.cleanup_failed", logging.WARNING, mcp_id=payload.mcp_id, error=str(e))
 
     return {
         "status": "stopped",
@@ -0,0 +1,560 @@
+from subprocess import Popen, PIPE, DEVNULL
+from signal import SIGTERM, SIGKILL
+from collections import deque
+import subprocess
+import threading
+import inspect
+import asyncio
+import json
+import sys
+import time
+import os
+from system_db_handler import SystemDBHandler
+from codegen_handler import HOOK_MARKERS
+from metrics_handler import register_collector, mcp_restarts
+from logging_handler import log_event
+import logging
+
+
+db = SystemDBHandler()
+
+
+MCP_DIR = "mcps_servers"
+SUPERVISOR_INTERVAL_S = float(os.environ.get("CRAFTMCP_SUPERVISOR_INTERVAL", "5"))
+CGROUP_ROOT = "/sys/fs/cgroup"
+CGROUP_PARENT = os.path.join(CGROUP_ROOT, "craftmcp")
+CPU_PERIOD_US = 100000
+STDERR_TAIL_LINES = 200
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+LIMIT_KEYS = ["max_rss_mb", "max_cpu_percent", "max_open_fds", "max_threads", "max_cpu_seconds", "max_address_space_mb",
+              "max_concurrency"]
+BREACH_ACTIONS = ["throttle", "restart", "fail"]
+# Limits the kernel enforces, through the MCP's cgroup or rlimits of its processes
+CGROUP_LIMITS = ["max_rss_mb", "max_cpu_percent", "max_threads"]
+RLIMIT_KEYS = ["max_open_fds", "max_cpu_seconds", "max_address_space_mb"]
+
+# CRAFTMCP_SESSION of the server launched by /run-mcp, pooled sessions carry their own random tag
+RUN_SESSION = "run"
+
+# mcp_id -> Popen of the server launched by /run-mcp, kept so its stdin pipe stays open
+processes = {}
+# mcp_id -> latest usage sample and limit state of the server launched by /run-mcp
+usage = {}
+# pooled session tag -> (mcp_id, latest usage sample and limit state of that session)
+session_usage = {}
+_last_cpu = {}
+_spawned_at = {}
+# mcp_id -> (reader thread, last lines) of the stderr of the server launched by /run-mcp.
+# FastMCP logs every request there, the pipe is drained for the server's whole life or it fills up and blocks it.
+_stderr = {}
+# mcp_id -> {limit: bool}, whether each kernel-enforced limit was actually put in place
+# at the last launch. Limits that were not are only checked by the supervisor polls.
+applied = {}
+
+
+def validate_limits(limits: dict) -> dict:
+    unknown = [k for k in limits if k not in LIMIT_KEYS + ["on_breach"]]
+    if unknown:
+        raise ValueError(f"Unknown limit(s): {', '.join(unknown)}")
+    for key in LIMIT_KEYS:
+        if key in limits and (not isinstance(limits[key], (int, float)) or limits[key] <= 0):
+            raise ValueError(f"{key} must be a positive number")
+    if limits.get("on_breach", "restart") not in BREACH_ACTIONS:
+        raise ValueError(f"on_breach must be one of {', '.join(BREACH_ACTIONS)}")
+    return limits
+
+
+def mcp_limits(mcp_id: int) -> dict:
+    mcp = db.fetch_records("mcps", f"id={mcp_id}")
+    if not mcp:
+        return {}
+    return json.loads(mcp[0][4]).get("limits", {})
+
+
+# /proc accounting
+
+def _scan_proc() -> dict:
+    # pid -> (ppid, argv, stat fields after the command name)
+    table = {}
+    if not os.path.isdir("/proc"):
+        return table
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                argv = [a.decode(errors="replace") for a in f.read().split(b"\0") if a]
+        except OSError:
+            continue
+        fields = stat[stat.rfind(")") + 2:].split()
+        table[int(entry)] = (int(fields[1]), argv, fields)
+    return table
+
+
+def _is_mcp_command(argv: list, script: str) -> bool:
+    return any(os.path.basename(a) == script for a in argv[1:])
+
+
+def find_mcp_pids(mcp_id: int, python_only: bool = False, table: dict | None = None) -> list[int]:
+    # Processes whose command line runs mcp_<id>.py (uv launchers and the python servers)
+    script = f"mcp_{mcp_id}.py"
+    table = _scan_proc() if table is None else table
+    return [pid for pid, (_, argv, _) in table.items()
+            if argv and _is_mcp_command(argv, script) and (not python_only or "python" in os.path.basename(argv[0]))]
+
+
+def has_hook(pid: int, hook: str) -> bool:
+    # Whether the process was started from a file with that hook, see HOOK_MARKERS
+    return hook in _craft_environ(pid).get("CRAFTMCP_HOOKS", "").split(",")
+
+
+def script_hooks(script_path: str) -> str:
+    # CRAFTMCP_HOOKS of a process started from the exported file, read at spawn time since
+    # a later re-export rewrites the file under the running process
+    try:
+        with open(script_path) as f:
+            code = f.read()
+    except OSError:
+        return ""
+    return ",".join(name for name, marker in HOOK_MARKERS.items() if marker in code)
+
+
+def _descendants(roots: set, table: dict) -> set:
+    children = {}
+    for pid, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    found, stack = set(), list(roots)
+    while stack:
+        pid = stack.pop()
+        if pid in found or pid not in table:
+            continue
+        found.add(pid)
+        stack.extend(children.get(pid, []))
+    return found
+
+
+def _count_fds(pid: int) -> int:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+def _craft_environ(pid: int) -> dict:
+    # CRAFTMCP_* variables the process was started with
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            environ = f.read().split(b"\0")
+    except OSError:
+        return {}
+    variables = {}
+    for item in environ:
+        if item.startswith(b"CRAFTMCP_"):
+            name, _, value = item.partition(b"=")
+            variables[name.decode(errors="replace")] = value.decode(errors="replace")
+    return variables
+
+
+def session_tree(mcp_id: int, tag: str, table: dict | None = None) -> set:
+    # Every server process carries CRAFTMCP_SESSION=<tag> in its environment, so one
+    # replica is told apart from the others and from the server started by /run-mcp
+    table = _scan_proc() if table is None else table
+    roots = {pid for pid in find_mcp_pids(mcp_id, table=table) if _craft_environ(pid).get("CRAFTMCP_SESSION") == tag}
+    return _descendants(roots, table)
+
+
+def mcp_process_tree(mcp_id: int, table: dict | None = None) -> set:
+    # Matched by command line and tag rather than the stored PID, which may have been reused
+    return session_tree(mcp_id, RUN_SESSION, table)
+
+
+def session_rss_mb(sessions: list[tuple[int, str]]) -> dict:
+    # tag -> RSS of each pooled stdio session's process tree
+    table = _scan_proc()
+    result = {}
+    for mcp_id, tag in sessions:
+        rss = sum(int(table[pid][2][21]) * PAGE_SIZE for pid in session_tree(mcp_id, tag, table))
+        result[tag] = round(rss / 1024 / 1024, 2)
+    return result
+
+
+def pids_rss_mb(pids: list[int]) -> float:
+    rss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+    return round(rss / 1024 / 1024, 2)
+
+
+def sample_usage(key: tuple, pids: set, table: dict) -> dict:
+    # key is (mcp_id, session tag), CPU percent is measured against that session's previous sample
+    rss = cpu_ticks = threads = fds = 0
+    for pid in pids:
+        fields = table[pid][2]
+        cpu_ticks += int(fields[11]) + int(fields[12])   # utime + stime
+        threads += int(fields[17])
+        rss += int(fields[21]) * PAGE_SIZE
+        fds += _count_fds(pid)
+
+    now = time.monotonic()
+    cpu_seconds = cpu_ticks / CLOCK_TICKS
+    cpu_percent = 0.0
+    previous = _last_cpu.get(key)
+    if previous and now > previous[1] and cpu_seconds >= previous[0]:
+        cpu_percent = (cpu_seconds - previous[0]) / (now - previous[1]) * 100
+    _last_cpu[key] = (cpu_seconds, now)
+
+    return {
+        "pids": sorted(pids),
+        "rss_mb": round(rss / 1024 / 1024, 2),
+        "cpu_seconds": round(cpu_seconds, 2),
+        "cpu_percent": round(cpu_percent, 1),
+        "open_fds": fds,
+        "threads": threads,
+        "sampled_at": time.time()
+    }
+
+
+# Launch with rlimits and cgroup v2
+
+def _cgroup_path(mcp_id: int) -> str:
+    return os.path.join(CGROUP_PARENT, f"mcp_{mcp_id}")
+
+
+def _write(path: str, value: str) -> bool:
+    try:
+        with open(path, "w") as f:
+            f.write(value)
+        return True
+    except OSError:
+        return False
+
+
+def _not_applied(mcp_id: int, keys: list, reason: str):
+    for key in keys:
+        applied[mcp_id][key] = False
+    if keys:
+        log_event("supervisor.limits_not_applied", logging.WARNING, mcp_id=mcp_id, limits=sorted(keys), reason=reason)
+
+
+def prepare_cgroup(mcp_id: int, limits: dict) -> str | None:
+    # Returns the cgroup directory when cgroup v2 is mounted and writable
+    applied[mcp_id] = {key: os.name == "posix" for key in RLIMIT_KEYS if key in limits}
+    wanted = [key for key in CGROUP_LIMITS if key in limits]
+    if not limits:
+        return None
+    if not os.path.exists(os.path.join(CGROUP_ROOT, "cgroup.controllers")):
+        _not_applied(mcp_id, wanted, "cgroup v2 is not mounted")
+        return None
+    path = _cgroup_path(mcp_id)
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError as e:
+        _not_applied(mcp_id, wanted, f"cannot create {path}: {e.strerror}")
+        return None
+    # Fails when the root cgroup is not delegated, e.g. in most containers. The limit files
+    # then do not exist and the writes below fail too.
+    _write(os.path.join(CGROUP_ROOT, "cgroup.subtree_control"), "+cpu +memory +pids")
+    _write(os.path.join(CGROUP_PARENT, "cgroup.subtree_control"), "+cpu +memory +pids")
+    status = applied[mcp_id]
+    if "max_rss_mb" in limits:
+        status["max_rss_mb"] = _write(os.path.join(path, "memory.max"), str(int(limits["max_rss_mb"] * 1024 * 1024)))
+    if "max_cpu_percent" in limits:
+        status["max_cpu_percent"] = _write(os.path.join(path, "cpu.max"), f"{int(limits['max_cpu_percent'] / 100 * CPU_PERIOD_US)} {CPU_PERIOD_US}")
+    if "max_threads" in limits:
+        status["max_threads"] = _write(os.path.join(path, "pids.max"), str(int(limits["max_threads"])))
+    _not_applied(mcp_id, [key for key in wanted if not status[key]], f"cannot write the limit files in {path}")
+    return path
+
+
+def apply_limits(limits: dict, cgroup: str | None):
+    # Runs in the child before it execs the server, self-contained so it can also run
+    # in the launcher of pooled sessions (see launch_command)
+    import resource
+    if cgroup:
+        try:
+            with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+                f.write(str(os.getpid()))
+        except OSError:
+            pass
+    if "max_open_fds" in limits:
+        n = int(limits["max_open_fds"])
+        resource.setrlimit(resource.RLIMIT_NOFILE, (n, n))
+    if "max_cpu_seconds" in limits:
+        n = int(limits["max_cpu_seconds"])
+        resource.setrlimit(resource.RLIMIT_CPU, (n, n + 5))
+    if "max_address_space_mb" in limits:
+        n = int(limits["max_address_space_mb"] * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (n, n))
+
+
+def _preexec(limits: dict, cgroup: str | None):
+    def apply():
+        apply_limits(limits, cgroup)
+    return apply
+
+
+_LAUNCHER = (
+    "import json, os, sys\n"
+    + inspect.getsource(apply_limits)
+    + "apply_limits(json.loads(sys.argv[1]), sys.argv[2] or None)\n"
+    + "os.execvp(sys.argv[3], sys.argv[3:])\n"
+)
+
+
+def launch_command(mcp_id: int, limits: dict | None = None) -> tuple[str, list[str]]:
+    # For clients that start the server themselves, such as pooled stdio sessions. They
+    # take no preexec_fn, so a python launcher applies the same limits and cgroup, then execs uv.
+    limits = limits or {}
+    cgroup = prepare_cgroup(mcp_id, limits)
+    args = ["run", f"mcp_{mcp_id}.py"]
+    if not limits or os.name != "posix":
+        return "uv", args
+    return sys.executable, ["-c", _LAUNCHER, json.dumps(limits), cgroup or "", "uv"] + args
+
+
+def _joined_cgroup(pid: int, cgroup: str) -> bool:
+    try:
+        with open(f"/proc/{pid}/cgroup") as f:
+            return f"0::/{os.path.relpath(cgroup, CGROUP_ROOT)}" in f.read().splitlines()
+    except OSError:
+        return False
+
+
+def _drain(stream, tail: deque):
+    with stream:
+        for line in stream:
+            tail.append(line)
+
+
+def stderr_tail(mcp_id: int, timeout: float = 1.0) -> str:
+    # Last stderr lines of the server, waits up to timeout for the rest of a process that exited
+    entry = _stderr.get(mcp_id)
+    if entry is None:
+        return ""
+    reader, tail = entry
+    reader.join(timeout)
+    return b"".join(tail).decode(errors="replace")
+
+
+def spawn_mcp_process(mcp_id: int, limits: dict | None = None) -> Popen:
+    limits = limits or {}
+    folder_path = os.path.join(MCP_DIR, f"mcp_{mcp_id}")
+    cgroup = prepare_cgroup(mcp_id, limits)
+    process = Popen(
+        ["uv", "run", f"mcp_{mcp_id}.py"],
+        cwd=folder_path,
+        stdin=PIPE,
+        stdout=DEVNULL,
+        stderr=PIPE,
+        env={**os.environ, "CRAFTMCP_SESSION": RUN_SESSION,
+             "CRAFTMCP_HOOKS": script_hooks(os.path.join(folder_path, f"mcp_{mcp_id}.py"))},
+        preexec_fn=_preexec(limits, cgroup) if limits and os.name == "posix" else None
+    )
+    if cgroup and not _joined_cgroup(process.pid, cgroup):
+        _not_applied(mcp_id, [key for key in CGROUP_LIMITS if applied[mcp_id].get(key)], f"cannot move the server into {cgroup}")
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    reader = threading.Thread(target=_drain, args=(process.stderr, tail), name=f"mcp-{mcp_id}-stderr", daemon=True)
+    reader.start()
+    _stderr[mcp_id] = (reader, tail)
+    processes[mcp_id] = process
+    _spawned_at[mcp_id] = time.monotonic()
+    return process
+
+
+def _kill(pids, sig):
+    for target in pids:
+        if target == os.getpid():
+            continue
+        try:
+            os.kill(target, sig)
+        except ProcessLookupError:
+            continue
+
+
+def terminate_mcp_process(mcp_id: int, sig=SIGTERM):
+    _kill(mcp_process_tree(mcp_id), sig)
+    process = processes.pop(mcp_id, None)
+    if process is not None:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    usage.pop(mcp_id, None)
+    _last_cpu.pop((mcp_id, RUN_SESSION), None)
+    _stderr.pop(mcp_id, None)
+
+
+def set_status(mcp_id: int, status: str, pid: int | None):
+    if db.fetch_records("mcp_status", f"mcp_id={mcp_id}"):
+        db.update_record("mcp_status", {"status": status, "pid": pid}, f"mcp_id={mcp_id}")
+    else:
+        db.create_record("mcp_status", {"mcp_id": mcp_id, "status": status, "pid": pid})
+
+
+# Limit enforcement
+
+def _breaches(sample: dict, limits: dict) -> list[str]:
+    checks = [
+        ("max_rss_mb", sample["rss_mb"]),
+        ("max_cpu_percent", sample["cpu_percent"]),
+        ("max_open_fds", sample["open_fds"]),
+        ("max_threads", sample["threads"]),
+    ]
+    return [key for key, value in checks if key in limits and value > limits[key]]
+
+
+def _throttle(mcp_id: int, sample: dict, limits: dict) -> str:
+    # Halve the CPU quota when running under a cgroup, otherwise lower the priority
+    cgroup = _cgroup_path(mcp_id)
+    cpu_max = os.path.join(cgroup, "cpu.max")
+    if os.path.exists(cpu_max):
+        try:
+            with open(cpu_max) as f:
+                quota = f.read().split()[0]
+        except OSError:
+            quota = "max"
+        current = CPU_PERIOD_US if quota == "max" else int(quota)
+        if _write(cpu_max, f"{max(current // 2, CPU_PERIOD_US // 100)} {CPU_PERIOD_US}"):
+            return "cgroup cpu quota halved"
+    for pid in sample["pids"]:
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, 19)
+        except (OSError, AttributeError):
+            continue
+    return "reniced to 19"
+
+
+def enforce(mcp_id: int, sample: dict, limits: dict, tag: str = RUN_SESSION) -> dict | None:
+    breached = _breaches(sample, limits)
+    if not breached:
+        return None
+
+    action = limits.get("on_breach", "restart")
+    # Memory, fds and threads cannot be throttled, escalate to a restart
+    if action == "throttle" and breached != ["max_cpu_percent"]:
+        action = "restart"
+
+    if action == "throttle":
+        detail = _throttle(mcp_id, sample, limits)
+    elif tag != RUN_SESSION:
+        # Only this replica is acted on, the pool retires it and the others keep serving
+        if action == "restart":
+            detail = "session retired, replaced on the next call"
+        else:
+            _kill(sample["pids"], SIGKILL)
+            set_status(mcp_id, "failed", None)
+            detail = "session killed and MCP marked failed"
+    elif action == "restart":
+        terminate_mcp_process(mcp_id)
+        process = spawn_mcp_process(mcp_id, limits)
+        set_status(mcp_id, "running", process.pid)
+        mcp_restarts.inc((mcp_id,))
+        detail = f"restarted as PID {process.pid}"
+    else:
+        terminate_mcp_process(mcp_id, SIGKILL)
+        set_status(mcp_id, "failed", None)
+        detail = "killed and marked failed"
+
+    event = {"at": time.time(), "breached": breached, "action": action, "detail": detail}
+    log_event("supervisor.limit_breached", logging.WARNING, mcp_id=mcp_id, session=tag, sample=sample, **event)
+    return event
+
+
+def supervise_once(sessions: list = ()) -> list[tuple[int, str, str]]:
+    # sessions are the pool's live (mcp_id, tag, worker pids) replicas, worker pids only for in-process ones.
+    # Returns (mcp_id, tag, action) for the replicas the pool has to retire.
+    table = _scan_proc()
+    actions = []
+    for row in db.fetch_records("mcp_status", "status='running'"):
+        mcp_id = row[0]
+        process = processes.get(mcp_id)
+        if process is not None and process.poll() is not None:
+            log_event("supervisor.mcp_exited", logging.ERROR, mcp_id=mcp_id, returncode=process.returncode,
+                      error=stderr_tail(mcp_id).strip()[-2000:])
+            processes.pop(mcp_id, None)
+            _stderr.pop(mcp_id, None)
+            set_status(mcp_id, "failed", None)
+            continue
+        sample = sample_usage((mcp_id, RUN_SESSION), mcp_process_tree(mcp_id, table), table)
+        limits = mcp_limits(mcp_id)
+        previous = usage.get(mcp_id, {})
+        sample["last_breach"] = previous.get("last_breach")
+        # Give a freshly (re)started server one interval to settle before judging it
+        settled = time.monotonic() - _spawned_at.get(mcp_id, 0) >= SUPERVISOR_INTERVAL_S
+        if limits and settled:
+            event = enforce(mcp_id, sample, limits)
+            if event:
+                sample["last_breach"] = event
+                if event["action"] == "fail":
+                    actions.append((mcp_id, None, "fail"))
+        usage[mcp_id] = sample
+
+    # Pooled replicas are sampled and judged one by one, each against the full limits
+    failed = {row[0] for row in db.fetch_records("mcp_status", "status='failed'")}
+    limits_of, seen = {}, set()
+    for mcp_id, tag, workers in sessions:
+        pids = _descendants(set(workers), table) if workers is not None else session_tree(mcp_id, tag, table)
+        if not pids:
+            continue
+        key = (mcp_id, tag)
+        seen.add(key)
+        # A new replica is judged from its second sample on, once its CPU rate is known
+        settled = key in _last_cpu
+        sample = sample_usage(key, pids, table)
+        if mcp_id not in limits_of:
+            limits_of[mcp_id] = mcp_limits(mcp_id)
+        sample["last_breach"] = session_usage.get(tag, (mcp_id, {}))[1].get("last_breach")
+        if limits_of[mcp_id] and settled and mcp_id not in failed:
+            event = enforce(mcp_id, sample, limits_of[mcp_id], tag)
+            if event:
+                sample["last_breach"] = event
+                if event["action"] == "fail":
+                    failed.add(mcp_id)
+                if event["action"] != "throttle":
+                    actions.append((mcp_id, tag, event["action"]))
+        session_usage[tag] = (mcp_id, sample)
+
+    for tag, (mcp_id, _) in list(session_usage.items()):
+        if (mcp_id, tag) not in seen:
+            session_usage.pop(tag, None)
+            _last_cpu.pop((mcp_id, tag), None)
+    return actions
+
+
+async def supervisor_loop(pool):
+    while True:
+        try:
+            actions = await asyncio.to_thread(supervise_once, pool.supervised())
+            pool.breached(actions)
+        except Exception as e:
+            log_event("supervisor.pass_failed", logging.ERROR, error=str(e))
+        await asyncio.sleep(SUPERVISOR_INTERVAL_S)
+
+
+@register_collector
+def _mcp_usage_gauges() -> list[str]:
+    lines = []
+    for metric, key, help_text in [
+        ("craftmcp_mcp_rss_bytes", "rss_mb", "Resident memory of MCP process trees"),
+        ("craftmcp_mcp_cpu_seconds_total", "cpu_seconds", "CPU time of MCP process trees"),
+        ("craftmcp_mcp_open_fds", "open_fds", "Open file descriptors of MCP process trees"),
+        ("craftmcp_mcp_threads", "threads", "Threads of MCP process trees"),
+    ]:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {'counter' if metric.endswith('_total') else 'gauge'}"]
+        # Summed over the /run-mcp server and the pooled replicas of each MCP
+        totals = {}
+        for mcp_id, sample in list(usage.items()) + list(session_usage.values()):
+            totals[mcp_id] = totals.get(mcp_id, 0) + sample[key]
+        for mcp_id, value in totals.items():
+            value = value * 1024 * 1024 if key == "rss_mb" else value
+            lines.append(f'{metric}{{mcp_id="{mcp_id}"}} {value}')
+    return lines
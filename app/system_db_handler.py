@@ -1,5 +1,7 @@
 import sqlite3
+import time
 from pathlib import Path
+from metrics_handler import db_queries, db_latency
 
 
 class SystemDBHandler:
@@ -92,35 +94,49 @@ class SystemDBHandler:
             conn.commit()
 
 
+    def _observe(self, op, table, start):
+        db_queries.inc((op, table))
+        db_latency.observe((op,), time.perf_counter() - start)
+
+
     def create_record(self, table, data: dict):
+        start = time.perf_counter()
         with self._connect() as conn:
             keys = ', '.join(data.keys())
             placeholders = ', '.join('?' for _ in data)
             values = tuple(data.values())
             conn.execute(f"INSERT INTO {table} ({keys}) VALUES ({placeholders})", values)
             conn.commit()
+        self._observe("insert", table, start)
 
 
     def fetch_records(self, table, where_clause=None):
+        start = time.perf_counter()
         with self._connect() as conn:
             cursor = conn.cursor()
             query = f"SELECT * FROM {table}"
             if where_clause:
                 query += f" WHERE {where_clause}"
             cursor.execute(query)
-            return cursor.fetchall()
+            rows = cursor.fetchall()
+        self._observe("select", table, start)
+        return rows
 
 
     def update_record(self, table, updates: dict, where_clause):
+        start = time.perf_counter()
         with self._connect() as conn:
             set_clause = ', '.join(f"{k}=?" for k in updates)
             values = list(updates.values())
             query = f"UPDATE {table} SET {set_clause} WHERE {where_clause}"
             conn.execute(query, values)
             conn.commit()
+        self._observe("update", table, start)
 
 
     def delete_record(self, table, where_clause):
+        start = time.perf_counter()
         with self._connect() as conn:
             conn.execute(f"DELETE FROM {table} WHERE {where_clause}")
             conn.commit()
+        self._observe("delete", table, start)
@@ -5,6 +5,8 @@ from datetime import datetime
 import hashlib
 import json
 from system_db_handler import SystemDBHandler
+from codegen_handler import EXECUTION_MODES, render_component
+from reload_handler import hot_reload
 from fastapi.responses import JSONResponse
 
 
@@ -13,20 +15,6 @@ db = SystemDBHandler()
 security = HTTPBearer()
 
 
-def render_function_signature(param_dict: dict) -> str:
-    params = []
-    for name, val in param_dict.items():
-        if isinstance(val, dict):
-            type_str = val.get("type", "str")
-            default = val.get("default")
-            if isinstance(default, str):
-                default = f'"{default}"'
-            params.append(f"{name}: {type_str} = {default}")
-        else:
-            params.append(f"{name}: {val}")
-    return ", ".join(params)
-
-
 def hash_token(token: str) -> str:
     return hashlib.sha256(token.encode()).hexdigest()
 
@@ -37,12 +25,24 @@ class ToolCreate(BaseModel):
     is_async: bool
     mcp_id: int | None = None
     params: dict = Field(default_factory=dict, description="Function parameters")
+    execution: str = Field("inline", description="Where a sync tool runs in the server: inline, thread or process")
+    coalesce: bool = Field(True, description="Share one execution between identical in-flight calls, disable for tools with side effects")
 
 
 class ToolPatch(BaseModel):
     tool_name: str | None = None
     snippet: str | None = None
     is_async: bool | None = None
+    params: dict | None = None
+    execution: str | None = None
+    coalesce: bool | None = None
+
+
+def validate_execution(execution: str, is_async: bool):
+    if execution not in EXECUTION_MODES:
+        raise HTTPException(status_code=400, detail=f"execution must be one of {', '.join(EXECUTION_MODES)}")
+    if is_async and execution != "inline":
+        raise HTTPException(status_code=400, detail="Async tools run on the event loop, execution must be 'inline'")
 
 
 @router.post("/create-tool")
@@ -67,22 +67,24 @@ def create_tool(
         if not is_admin and mcp[0][3] != username:
             raise HTTPException(status_code=403, detail="Not allowed to link to this MCP")
 
+    validate_execution(payload.execution, payload.is_async)
+
     metadata = {
         "tool_name": payload.tool_name,
         "snippet": payload.snippet,
         "is_async": payload.is_async,
         "params": payload.params,
+        "execution": payload.execution,
+        "coalesce": payload.coalesce,
         "linked_mcp_ids": [payload.mcp_id] if payload.mcp_id else [],
         "owner": username,
         "created_at": datetime.utcnow().isoformat()
     }
 
-    fn_def = "async def" if payload.is_async else "def"
-    signature = render_function_signature(payload.params)
-    skeleton_code = f'''@mcp.tool()
-{fn_def} {payload.tool_name}({signature}) -> str:
-    {payload.snippet.strip()}
-'''
+    try:
+        skeleton_code = render_component("tool", metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.create_record("tools", {
         "name": payload.tool_name,
@@ -115,6 +117,8 @@ def list_tools(credentials: HTTPAuthorizationCredentials = Depends(security)):
         "name": t[1],
         "linked_mcp_ids": json.loads(t[6]).get("linked_mcp_ids", []),
         "is_async": bool(t[4]),
+        "execution": json.loads(t[6]).get("execution", "inline"),
+        "coalesce": json.loads(t[6]).get("coalesce", True),
         "owner": t[2]
     } for t in tools]
 
@@ -261,6 +265,7 @@ def modify_tool(
         raise HTTPException(status_code=403, detail="Not allowed to modify")
 
     metadata = json.loads(tool[0][6])
+    old_name = metadata["tool_name"]
 
     if patch.tool_name:
         metadata["tool_name"] = patch.tool_name
@@ -268,14 +273,18 @@ def modify_tool(
         metadata["snippet"] = patch.snippet
     if patch.is_async is not None:
         metadata["is_async"] = patch.is_async
-
-    fn_def = "async def" if metadata["is_async"] else "def"
-    snippet = metadata["snippet"].strip()
-    new_code = f'''@mcp.tool()
-{fn_def} {metadata["tool_name"]}(message: str) -> str:
-    """Generated tool"""
-    {snippet}
-'''
+    if patch.params is not None:
+        metadata["params"] = patch.params
+    if patch.execution is not None:
+        metadata["execution"] = patch.execution
+    if patch.coalesce is not None:
+        metadata["coalesce"] = patch.coalesce
+    validate_execution(metadata.get("execution", "inline"), metadata["is_async"])
+
+    try:
+        new_code = render_component("tool", metadata)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     db.update_record("tools", {
         "name": metadata["tool_name"],
@@ -285,7 +294,9 @@ def modify_tool(
         "skeleton_code": new_code
     }, f"id={tool_id}")
 
-    return {"status": "modified", "tool": metadata["tool_name"]}
+    # Running servers of the linked MCPs swap the tool in place
+    reloaded = hot_reload("tool", metadata, old_name, credentials)
+    return {"status": "modified", "tool": metadata["tool_name"], "reloaded": reloaded}
 
 
 @router.post("/delete-tool")
@@ -0,0 +1,195 @@
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+from logging.handlers import QueueListener
+import logging
+import hashlib
+import secrets
+import atexit
+import queue
+import json
+import time
+import re
+import os
+from system_db_handler import SystemDBHandler
+from logging_handler import annotate
+
+
+router = APIRouter()
+db = SystemDBHandler()
+security = HTTPBearer()
+
+
+MCP_DIR = "mcps_servers"
+TRACE_BUFFER_SIZE = int(os.environ.get("CRAFTMCP_TRACE_BUFFER", "4096"))
+TRACE_FILE = os.environ.get("CRAFTMCP_TRACE_FILE")  # optional JSONL exporter
+SERVER_TRACE_FILE = "traces.jsonl"  # written by generated servers inside their folder
+
+TRACE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+_spans = deque(maxlen=TRACE_BUFFER_SIZE)
+_current = ContextVar("craftmcp_span", default=None)
+
+
+class _SpanFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.span, default=str)
+
+
+# Spans are only enqueued on the request path, the listener thread writes them,
+# as for the JSON logs
+_export_queue = queue.SimpleQueue()
+if TRACE_FILE:
+    _export_handler = logging.FileHandler(TRACE_FILE)
+    _export_handler.setFormatter(_SpanFormatter())
+    _export_listener = QueueListener(_export_queue, _export_handler)
+    _export_listener.start()
+    atexit.register(_export_listener.stop)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _export(record: dict):
+    _spans.append(record)
+    if TRACE_FILE:
+        _export_queue.put(logging.makeLogRecord({"span": record}))
+
+
+@contextmanager
+def span(name: str, trace_id: str | None = None, parent_id: str | None = None, **attributes):
+    parent = _current.get()
+    record = {
+        "trace_id": trace_id or (parent["trace_id"] if parent else secrets.token_hex(16)),
+        "span_id": secrets.token_hex(8),
+        "parent_id": parent_id or (parent["span_id"] if parent else None),
+        "name": name,
+        "source": "api",
+        "start": time.time(),
+        "duration_ms": None,
+        "status": "ok",
+        "attributes": attributes,
+    }
+    token = _current.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["attributes"]["error"] = repr(e)[:500]
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _current.reset(token)
+        _export(record)
+
+
+def current_context() -> dict | None:
+    # Propagated to generated MCP servers through the JSON-RPC request _meta
+    record = _current.get()
+    if record is None:
+        return None
+    return {"trace_id": record["trace_id"], "span_id": record["span_id"]}
+
+
+def _parse_traceparent(value: str):
+    # W3C traceparent: version-traceid-parentid-flags
+    parts = value.split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+class TracingMiddleware:
+    # Opens the root span for every HTTP request and returns its id in x-trace-id
+
+    def __init__(self, app):
+        self.app = app
+
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace_id, parent_id = None, None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                trace_id, parent_id = _parse_traceparent(value.decode("latin-1"))
+                break
+
+        method = scope.get("method", "")
+        with span(f"{method} {scope.get('path', '')}", trace_id=trace_id, parent_id=parent_id, **{"http.method": method}) as root:
+            annotate(trace_id=root["trace_id"])
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    root["attributes"]["status_code"] = message["status"]
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", root["trace_id"].encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            route = scope.get("route")
+            if route is not None:
+                root["name"] = f"{method} {route.path}"
+
+
+def _server_spans(trace_id: str, mcp_ids: set) -> list:
+    # Only the MCPs the trace called into, their spans are the only ones that can match
+    found = []
+    for mcp_id in sorted(mcp_ids):
+        path = os.path.join(MCP_DIR, f"mcp_{mcp_id}", SERVER_TRACE_FILE)
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                # Cheap substring filter first, the id must still be the span's own trace id
+                if trace_id not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("trace_id") == trace_id:
+                    found.append(record)
+    return found
+
+
+@router.get("/traces")
+def list_traces(
+    trace_id: str | None = None,
+    name: str | None = None,
+    min_duration_ms: float = 0,
+    limit: int = 100,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    token = credentials.credentials
+    token_hash = hash_token(token)
+    user = db.fetch_records("users", f"token='{token_hash}' AND is_admin=1")
+    if not user:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+
+    spans = list(_spans)
+
+    # Full trace: API spans plus the tool body spans recorded by MCP servers
+    if trace_id is not None:
+        if not TRACE_ID_RE.match(trace_id):
+            raise HTTPException(status_code=400, detail="Invalid trace_id, expected 32 lowercase hex chars")
+        trace = [s for s in spans if s["trace_id"] == trace_id]
+        mcp_ids = {s["attributes"]["mcp_id"] for s in trace if "mcp_id" in s["attributes"]}
+        trace += _server_spans(trace_id, mcp_ids)
+        trace.sort(key=lambda s: s["start"])
+        return {"trace_id": trace_id, "spans": trace}
+
+    # Otherwise list recent request spans, newest first
+    roots = [s for s in spans if "http.method" in s["attributes"]]
+    if name:
+        roots = [s for s in roots if name in s["name"]]
+    roots = [s for s in roots if s["duration_ms"] >= min_duration_ms]
+    roots.sort(key=lambda s: s["start"], reverse=True)
+    return {"traces": roots[:limit]}
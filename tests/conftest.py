@@ -0,0 +1,10 @@
+import tempfile
+import sys
+import os
+
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+# The handlers create system.db, logs/ and mcps_servers/ in the working directory on import
+os.chdir(tempfile.mkdtemp(prefix="craftmcp-tests-"))
@@ -0,0 +1,153 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+import admission_handler
+from admission_handler import AdmissionController
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    # Small limits, read by the controller on every call
+    def set_limits(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(admission_handler, name, value)
+    set_limits(MAX_CONCURRENT=1, MAX_CONCURRENT_PER_USER=1, MAX_CONCURRENT_PER_MCP=1,
+               MAX_QUEUE=8, MAX_QUEUE_PER_USER=8, QUEUE_TIMEOUT_S=5, USER_WEIGHTS={})
+    return set_limits
+
+
+async def _hold(controller, user, order, mcp_id=1, release=None):
+    async with controller.slot(user, mcp_id):
+        order.append(user)
+        if release is not None:
+            await release.wait()
+
+
+async def _queue_behind_holder(controller, users):
+    # One call holds the only slot, the others queue in the given order
+    order, release = [], asyncio.Event()
+    holder = asyncio.create_task(_hold(controller, "holder", order, release=release))
+    await asyncio.sleep(0)
+    tasks = []
+    for user in users:
+        tasks.append(asyncio.create_task(_hold(controller, user, order)))
+        await asyncio.sleep(0)
+    assert controller.queued == len(users)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    return order[1:]
+
+
+def test_per_user_and_per_mcp_limits(limits):
+    limits(MAX_CONCURRENT=10, MAX_CONCURRENT_PER_USER=1, MAX_CONCURRENT_PER_MCP=2)
+
+    async def run():
+        controller = AdmissionController()
+        release = asyncio.Event()
+        order = []
+        tasks = [asyncio.create_task(_hold(controller, user, order, mcp_id, release))
+                 for user, mcp_id in [("alice", 1), ("alice", 2), ("bob", 1), ("carol", 1)]]
+        await asyncio.sleep(0)
+        # alice is at her own limit, MCP 1 is full with alice and bob
+        assert sorted(order) == ["alice", "bob"]
+        assert controller.running_by_mcp == {1: 2}
+        assert controller.queued == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        assert controller.running == 0 and controller.queued == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_answers_429_with_retry_after(limits):
+    limits(MAX_QUEUE=1)
+
+    async def run():
+        controller = AdmissionController()
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, "alice", [], release=release))
+        waiter = asyncio.create_task(_hold(controller, "bob", []))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await _hold(controller, "carol", [])
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 429
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+
+def test_per_user_queue_limit(limits):
+    limits(MAX_QUEUE_PER_USER=1)
+
+    async def run():
+        controller = AdmissionController()
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, "alice", [], release=release))
+        waiter = asyncio.create_task(_hold(controller, "alice", []))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await _hold(controller, "alice", [])
+        # Another user still gets a place in the queue
+        other = asyncio.create_task(_hold(controller, "bob", []))
+        await asyncio.sleep(0)
+        assert controller.queued == 2
+        release.set()
+        await asyncio.gather(holder, waiter, other)
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 429
+
+
+def test_queue_timeout_answers_429_and_leaves_the_queue(limits):
+    limits(QUEUE_TIMEOUT_S=0.05)
+
+    async def run():
+        controller = AdmissionController()
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(controller, "alice", [], release=release))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            await _hold(controller, "bob", [])
+        assert controller.queued == 0 and not controller.queues
+        release.set()
+        await holder
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.status_code == 429
+    assert "Retry-After" in rejected.headers
+
+
+def test_waiting_users_are_served_in_fair_order(limits):
+    # alice queued three calls before bob queued one, bob does not wait behind all of them
+    order = asyncio.run(_queue_behind_holder(AdmissionController(), ["alice", "alice", "alice", "bob"]))
+    assert order == ["alice", "bob", "alice", "alice"]
+
+
+def test_weights_share_slots_in_proportion(limits):
+    limits(USER_WEIGHTS={"alice": 2.0})
+    order = asyncio.run(_queue_behind_holder(AdmissionController(), ["alice"] * 4 + ["bob"] * 4))
+    assert order[:6].count("alice") == 4
+    assert order[:6].count("bob") == 2
+
+
+def test_cancelled_waiter_gives_its_place_back(limits):
+    async def run():
+        controller = AdmissionController()
+        release, order = asyncio.Event(), []
+        holder = asyncio.create_task(_hold(controller, "alice", order, release=release))
+        await asyncio.sleep(0)
+        gone = asyncio.create_task(_hold(controller, "bob", order))
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.gather(gone, return_exceptions=True)
+        assert controller.queued == 0
+        release.set()
+        await holder
+        await _hold(controller, "carol", order)
+        return order
+
+    assert asyncio.run(run()) == ["alice", "carol"]
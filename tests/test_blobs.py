@@ -0,0 +1,31 @@
+import pytest
+from mcp.server.fastmcp import FastMCP
+from codegen_handler import HOOK_IMPORTS, BLOB_HOOK
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    # The blob section of a generated server, on its own
+    namespace = {"_CRAFT_BLOB_DIR": str(tmp_path), "mcp": FastMCP("blobs")}
+    exec(HOOK_IMPORTS + BLOB_HOOK, namespace)
+    return namespace
+
+
+def test_blob_round_trip(blobs):
+    ref = blobs["craft_blob_put"](b"line 1\nline 2\n")
+    blob = blobs["_craft_resolve"](ref)
+    assert blob.digest == ref.removeprefix("blob:")
+    assert blob[:] == b"line 1\nline 2\n"
+    assert blob.readline() == b"line 1\n"
+
+
+def test_empty_blob_can_be_read(blobs):
+    writer = blobs["CraftBlobWriter"]()
+    ref = writer.close()
+    blob = blobs["_craft_resolve"](ref)
+    assert blob.digest == ref.removeprefix("blob:")
+    assert len(blob) == 0
+    assert blob[:] == b""
+    assert blob.readline() == b""
+    assert bytes(memoryview(blob)) == b""
+    assert blob.find(b"x") == -1
@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+import inference_handler
+from coalesce_handler import SingleFlight, call_key
+from inference_handler import InfereRequest
+
+
+class _Counted:
+    # Stand-in for a tool call: counts executions and finishes when released
+    def __init__(self, result="done"):
+        self.calls = 0
+        self.result = result
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_call_key_ignores_argument_order():
+    assert call_key(1, "tool", "search", {"q": "x", "k": 5}) == call_key(1, "tool", "search", {"k": 5, "q": "x"})
+    assert call_key(1, "tool", "search", {"q": "x"}) != call_key(1, "tool", "search", {"q": "y"})
+    assert call_key(1, "tool", "search", {}) != call_key(2, "tool", "search", {})
+
+
+def test_identical_calls_share_one_execution():
+    async def run():
+        flight, fn = SingleFlight(), _Counted()
+        callers = [asyncio.create_task(flight.run("k", fn)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert len(flight.inflight) == 1
+        fn.release.set()
+        results = await asyncio.gather(*callers)
+        assert fn.calls == 1 and results == ["done"] * 5
+        # Finished executions are not cached, the next call runs again
+        assert not flight.inflight
+        assert await flight.run("k", fn) == "done"
+        assert fn.calls == 2
+
+    asyncio.run(run())
+
+
+def test_errors_reach_every_caller():
+    async def run():
+        flight, fn = SingleFlight(), _Counted(ValueError("boom"))
+        callers = [asyncio.create_task(flight.run("k", fn)) for _ in range(3)]
+        await asyncio.sleep(0)
+        fn.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert fn.calls == 1
+        assert all(isinstance(r, ValueError) for r in results)
+
+    asyncio.run(run())
+
+
+def test_caller_that_goes_away_does_not_cancel_the_others():
+    async def run():
+        flight, fn = SingleFlight(), _Counted()
+        first = asyncio.create_task(flight.run("k", fn))
+        second = asyncio.create_task(flight.run("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        fn.release.set()
+        assert await second == "done"
+        assert first.cancelled() and fn.calls == 1
+
+    asyncio.run(run())
+
+
+def test_tools_opt_out_with_coalesce_false(monkeypatch):
+    monkeypatch.setattr(inference_handler, "COALESCE_ENABLED", True)
+    tools = {"search": {"linked_mcp_ids": [1]}, "send": {"linked_mcp_ids": [1], "coalesce": False}}
+    monkeypatch.setattr(inference_handler, "_linked_tool", lambda mcp_id, name: tools.get(name))
+    assert inference_handler._call_options(1, "tool", "search") == ("search", True)
+    assert inference_handler._call_options(1, "tool", "send") == ("send", False)
+    # Names that are not a linked tool are neither coalesced nor get their own metrics series
+    assert inference_handler._call_options(1, "tool", "made_up") == ("other", False)
+    assert inference_handler._call_options(1, "prompt", "search") == ("other", False)
+
+
+@pytest.mark.parametrize("coalesce, executions", [(True, 1), (False, 3)])
+def test_opted_out_calls_run_separately(monkeypatch, coalesce, executions):
+    calls = []
+
+    async def invoke(payload, username, mcp_file, metadata, label):
+        calls.append(payload.arguments)
+        await asyncio.sleep(0.01)
+        return {"status": "success", "result": "ok"}
+
+    monkeypatch.setattr(inference_handler, "_invoke", invoke)
+
+    async def run():
+        payload = InfereRequest(mcp_id=1, type="tool", name="send", arguments={"to": "x"})
+        return await asyncio.gather(*[inference_handler._call(payload, "alice", "mcp_1.py", {}, "send", coalesce)
+                                      for _ in range(3)])
+
+    assert asyncio.run(run()) == [{"status": "success", "result": "ok"}] * 3
+    assert len(calls) == executions
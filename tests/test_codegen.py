@@ -0,0 +1,51 @@
+import ast
+import pytest
+from codegen_handler import render_component
+
+
+def _tool(**metadata):
+    return {"tool_name": "lookup", "snippet": "return str(q)", "params": {"q": "str"}, **metadata}
+
+
+def test_valid_components_render():
+    assert "def lookup(q: str) -> str:\n    return str(q)\n" in render_component("tool", _tool())
+    assert render_component("tool", _tool(is_async=True)).startswith("@mcp.tool()\nasync def lookup(")
+    resource = render_component("resource", {"resource_name": "item", "path_template": "items://{id}",
+                                              "snippet": "return id", "params": {"id": "str"}})
+    assert resource.startswith("@mcp.resource('items://{id}')\ndef item(id: str)")
+    assert render_component("tool", _tool(params={"q": "str", "k": {"type": "int", "default": 5}})).count("k: int = 5") == 1
+
+
+@pytest.mark.parametrize("snippet, line", [
+    ("return str(q", 1),
+    ("x = 1\n    return x)", 2),
+    ("return await q", 1),
+])
+def test_snippets_that_do_not_compile_are_rejected(snippet, line):
+    with pytest.raises(ValueError, match=rf"Tool lookup does not compile: .* \(snippet line {line}\)"):
+        render_component("tool", _tool(snippet=snippet))
+
+
+@pytest.mark.parametrize("name", ["not-a-name", "class", "1st", "lookup(); import os"])
+def test_invalid_names_are_rejected(name):
+    with pytest.raises(ValueError, match="Invalid tool name"):
+        render_component("tool", _tool(tool_name=name))
+
+
+@pytest.mark.parametrize("params, error", [
+    ({"q; import os": "str"}, "Invalid parameter name"),
+    ({"lambda": "str"}, "Invalid parameter name"),
+    ({"q": "str) -> None:\n    pass\ndef f(x: int"}, "Invalid type for parameter q"),
+    ({"k": {"type": "int", "default": 5}, "q": "str"}, "has no default but follows one that has"),
+])
+def test_invalid_params_are_rejected(params, error):
+    with pytest.raises(ValueError, match=error):
+        render_component("tool", _tool(params=params))
+
+
+def test_defaults_are_literals_not_code():
+    default = "x'); import os; ('"
+    code = render_component("tool", _tool(params={"q": {"type": "str", "default": default}}))
+    function = ast.parse(code).body[0]
+    assert len(ast.parse(code).body) == 1
+    assert function.args.defaults[0].value == default
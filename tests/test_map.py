@@ -0,0 +1,73 @@
+import asyncio
+import json
+from fastapi import HTTPException
+from mcp.types import CallToolResult, TextContent
+import inference_handler
+from inference_handler import MapRequest
+
+
+def _fake_call(monkeypatch, delays: dict, failures: dict = None):
+    # Stand-in for one tool call per item: sleeps, then returns, reports a tool error or raises
+    started = []
+
+    async def call(payload, username, mcp_file, metadata, label, coalesce):
+        n = payload.arguments["n"]
+        started.append(n)
+        await asyncio.sleep(delays.get(n, 0))
+        failure = (failures or {}).get(n)
+        if isinstance(failure, Exception):
+            raise failure
+        return {"status": "success", "result": CallToolResult(content=[TextContent(type="text", text=str(n))],
+                                                              isError=failure == "tool_error")}
+
+    monkeypatch.setattr(inference_handler, "_call", call)
+    return started
+
+
+def _run_map(**request) -> list[dict]:
+    payload = MapRequest(mcp_id=1, name="echo", **request)
+
+    async def run():
+        return [json.loads(line) async for line in inference_handler._map(payload, "alice", "mcp_1.py", {}, "echo", False)]
+
+    return asyncio.run(run())
+
+
+def test_unordered_lines_follow_completion(monkeypatch):
+    _fake_call(monkeypatch, {0: 0.06, 1: 0.03, 2: 0})
+    lines = _run_map(items=[{"n": 0}, {"n": 1}, {"n": 2}], concurrency=3)
+    assert [line["index"] for line in lines[:-1]] == [2, 1, 0]
+    assert lines[-1]["status"] == "completed" and lines[-1]["success"] == 3
+
+
+def test_ordered_lines_follow_item_order(monkeypatch):
+    _fake_call(monkeypatch, {0: 0.06, 1: 0.03, 2: 0})
+    lines = _run_map(items=[{"n": 0}, {"n": 1}, {"n": 2}], concurrency=3, ordered=True)
+    assert [line["index"] for line in lines[:-1]] == [0, 1, 2]
+    assert [line["result"]["content"][0]["text"] for line in lines[:-1]] == ["0", "1", "2"]
+
+
+def test_failures_are_reported_per_item(monkeypatch):
+    _fake_call(monkeypatch, {}, {1: "tool_error", 2: HTTPException(status_code=503, detail="MCP server unavailable")})
+    lines = _run_map(items=[{"n": 0}, {"n": 1}, {"n": 2}], concurrency=1, ordered=True)
+    assert [line["status"] for line in lines[:-1]] == ["success", "tool_error", "error"]
+    assert lines[2]["status_code"] == 503
+    summary = lines[-1]
+    assert (summary["status"], summary["success"], summary["tool_error"], summary["error"]) == ("completed", 1, 1, 1)
+
+
+def test_stop_on_error_starts_no_further_items(monkeypatch):
+    started = _fake_call(monkeypatch, {}, {1: "tool_error"})
+    lines = _run_map(items=[{"n": n} for n in range(5)], concurrency=1, stop_on_error=True)
+    assert started == [0, 1]
+    assert lines[-1]["status"] == "stopped"
+    assert lines[-1]["skipped"] == 3 and lines[-1]["total"] == 5
+
+
+def test_stop_on_error_still_emits_items_already_running(monkeypatch):
+    # Item 0 fails while 1 is running, 1 is reported, 2 and 3 are never started
+    started = _fake_call(monkeypatch, {0: 0.01, 1: 0.05}, {0: RuntimeError("boom")})
+    lines = _run_map(items=[{"n": n} for n in range(4)], concurrency=2, ordered=True, stop_on_error=True)
+    assert sorted(started) == [0, 1]
+    assert [(line["index"], line["status"]) for line in lines[:-1]] == [(0, "error"), (1, "success")]
+    assert lines[-1]["status"] == "stopped" and lines[-1]["skipped"] == 2
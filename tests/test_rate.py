@@ -0,0 +1,83 @@
+import asyncio
+import time
+import pytest
+from codegen_handler import HOOK_IMPORTS, RATE_HOOK, RATE_DEFAULTS
+
+
+@pytest.fixture
+def rate(tmp_path):
+    # The rate limit section of a generated server, on its own
+    def load(limits: dict, **globals_):
+        namespace = {"_CRAFT_RATE": {name: {**RATE_DEFAULTS, **limit} for name, limit in limits.items()},
+                     "_CRAFT_RATE_DB": str(tmp_path / "ratelimits.db"), **globals_}
+        exec(HOOK_IMPORTS + RATE_HOOK, namespace)
+        return namespace
+    return load
+
+
+def test_burst_is_free_then_callers_queue_one_interval_apart(rate):
+    limiter = rate({"KEY": {"rate": 10, "burst": 2}}, KEY="secret")["craft_rate"]
+    waits = [limiter._reserve("KEY")[0] for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02)
+    assert waits[3] == pytest.approx(0.2, abs=0.02)
+
+
+def test_tokens_refill_over_time(rate):
+    limiter = rate({"KEY": {"rate": 50, "burst": 1}}, KEY="secret")["craft_rate"]
+    assert limiter._reserve("KEY")[0] == 0.0
+    time.sleep(0.05)
+    assert limiter._reserve("KEY")[0] == pytest.approx(0.0, abs=0.005)
+
+
+def test_wait_over_max_wait_is_refused(rate):
+    namespace = rate({"KEY": {"rate": 1, "per_s": 60, "max_wait_s": 5}}, KEY="secret")
+    limiter = namespace["craft_rate"]
+    assert limiter._reserve("KEY")[0] == 0.0
+    with pytest.raises(namespace["CraftRateLimited"]):
+        limiter._reserve("KEY")
+
+
+def test_buckets_are_shared_by_key_value_across_processes(rate):
+    # Two servers, two globals holding the same API key, one quota
+    first = rate({"VT_KEY": {"rate": 10, "burst": 1}}, VT_KEY="secret")["craft_rate"]
+    second = rate({"OTHER_KEY": {"rate": 10, "burst": 1}}, OTHER_KEY="secret")["craft_rate"]
+    assert first._reserve("VT_KEY")[0] == 0.0
+    assert second._reserve("OTHER_KEY")[0] == pytest.approx(0.1, abs=0.02)
+    third = rate({"VT_KEY": {"rate": 10, "burst": 1}}, VT_KEY="another")["craft_rate"]
+    assert third._reserve("VT_KEY")[0] == 0.0
+
+
+def test_backoff_holds_every_caller_back(rate):
+    limiter = rate({"KEY": {"rate": 100, "burst": 5}}, KEY="secret")["craft_rate"]
+    limiter.backoff("KEY", 1.0)
+    assert limiter._reserve("KEY")[0] == pytest.approx(1.0, abs=0.05)
+
+
+def test_acquire_paces_calls_at_the_rate(rate):
+    limiter = rate({"KEY": {"rate": 50, "burst": 1}}, KEY="secret")["craft_rate"]
+
+    async def run():
+        start = time.monotonic()
+        await asyncio.gather(*[limiter.acquire("KEY") for _ in range(6)])
+        return time.monotonic() - start
+
+    # The first call is free, the other five are 20 ms apart
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_retry_after_reads_seconds_or_falls_back_to_one_interval(rate):
+    limiter = rate({"KEY": {"rate": 4, "per_s": 60}}, KEY="secret")["craft_rate"]
+
+    class Response:
+        def __init__(self, headers):
+            self.headers = headers
+
+    assert limiter.retry_after("KEY", Response({"retry-after": "7"})) == 7.0
+    assert limiter.retry_after("KEY", Response({})) == 15.0
+
+
+def test_unknown_key_is_an_error(rate):
+    limiter = rate({})["craft_rate"]
+    with pytest.raises(ValueError):
+        limiter._reserve("MISSING")
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+import signal
+import pytest
+from codegen_handler import render_component, render_hooks
+
+
+def _tool(name="lookup", snippet="return 'v1'"):
+    return {"tool_name": name, "snippet": snippet, "params": {"q": "str"}}
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    # A generated server with its hooks, imported rather than run, from its own folder
+    monkeypatch.chdir(tmp_path)
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGUSR1, signal.SIGUSR2)}
+    namespace = {"__name__": "mcp_reload_test"}
+    code = ("from mcp.server.fastmcp import FastMCP\nmcp = FastMCP('reload-test')\n\n"
+            + render_component("tool", _tool()) + "\n\n"
+            + render_hooks({}, {}, str(tmp_path / "blobs"), str(tmp_path / "ratelimits.db")))
+    exec(compile(code, "mcp_reload_test.py", "exec"), namespace)
+    yield namespace
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def _call(server, name):
+    return asyncio.run(server["mcp"]._tool_manager.call_tool(name, {"q": "x"}))
+
+
+def _apply(server, tool, old_key=None):
+    server["_craft_reload_apply"]({"kind": "tool", "key": tool["tool_name"], "old_key": old_key,
+                                   "code": render_component("tool", tool), "execution": "inline"})
+
+
+def test_swap_replaces_the_function_in_place(server):
+    assert _call(server, "lookup") == "v1"
+    _apply(server, _tool(snippet="return 'v2'"))
+    assert _call(server, "lookup") == "v2"
+    assert list(server["mcp"]._tool_manager._tools) == ["lookup"]
+
+
+def test_rename_drops_the_old_name(server):
+    _apply(server, _tool(name="search", snippet="return 'renamed'"), old_key="lookup")
+    assert list(server["mcp"]._tool_manager._tools) == ["search"]
+    assert _call(server, "search") == "renamed"
+
+
+def test_failed_reload_rolls_back_to_the_previous_tool(server):
+    broken = {"kind": "tool", "key": "lookup", "old_key": None, "execution": "inline",
+              "code": render_component("tool", _tool(snippet="return 'v2'")) + "\nraise RuntimeError('boom')\n"}
+    with pytest.raises(RuntimeError):
+        server["_craft_reload_apply"](broken)
+    assert _call(server, "lookup") == "v1"
+
+
+def test_failed_rename_restores_the_old_name(server):
+    broken = {"kind": "tool", "key": "search", "old_key": "lookup", "execution": "inline",
+              "code": render_component("tool", _tool(name="search")) + "\nraise RuntimeError('boom')\n"}
+    with pytest.raises(RuntimeError):
+        server["_craft_reload_apply"](broken)
+    assert list(server["mcp"]._tool_manager._tools) == ["lookup"]
+    assert _call(server, "lookup") == "v1"
+
+
+def _signal_reload(server, request) -> dict:
+    with open("reload_request.json", "w") as f:
+        json.dump(request, f)
+    # Outside a running loop the handler applies the request at once
+    server["_craft_reload_signal"](signal.SIGUSR2, None)
+    with open(f"reload_{request['id']}_{os.getpid()}.json") as f:
+        return json.load(f)
+
+
+def test_signal_answers_with_the_outcome(server):
+    ack = _signal_reload(server, {"id": "a1", "kind": "tool", "key": "lookup", "old_key": None, "execution": "inline",
+                                  "code": render_component("tool", _tool(snippet="return 'v2'"))})
+    assert (ack["status"], ack["pid"]) == ("reloaded", os.getpid())
+    assert _call(server, "lookup") == "v2"
+
+    ack = _signal_reload(server, {"id": "a2", "kind": "tool", "key": "lookup", "old_key": None, "execution": "inline",
+                                  "code": "raise ValueError('bad')"})
+    assert ack["status"] == "error" and "ValueError: bad" in ack["error"]
+    assert _call(server, "lookup") == "v2"
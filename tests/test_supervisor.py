@@ -0,0 +1,68 @@
+import asyncio
+import shutil
+import socket
+import time
+import sys
+import os
+import pytest
+from mcp import ClientSession
+from mcp.client.streamable_http import streamable_http_client
+from codegen_handler import render_entrypoint
+from supervisor_handler import MCP_DIR, spawn_mcp_process, terminate_mcp_process, stderr_tail
+
+
+SERVER = '''from mcp.server.fastmcp import FastMCP
+
+mcp = FastMCP("stderr-test")
+
+
+@mcp.tool()
+def echo(n: int) -> str:
+    return str(n)
+
+
+'''
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise TimeoutError(f"Server did not listen on port {port}")
+
+
+@pytest.mark.skipif(shutil.which("uv") is None, reason="uv is needed to launch generated servers")
+def test_http_server_keeps_serving_past_a_full_stderr_pipe(monkeypatch):
+    # FastMCP logs every request on stderr, about a thousand calls fill an undrained pipe
+    monkeypatch.setenv("UV_PYTHON", sys.executable)
+    mcp_id, port, calls = 9035, _free_port(), 3000
+    folder = os.path.join(MCP_DIR, f"mcp_{mcp_id}")
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, f"mcp_{mcp_id}.py"), "w") as f:
+        f.write(SERVER + render_entrypoint({"transport": {"type": "http", "port": port}}))
+
+    async def run():
+        async with streamable_http_client(f"http://127.0.0.1:{port}/mcp") as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                for n in range(calls):
+                    result = await asyncio.wait_for(session.call_tool("echo", {"n": n}), timeout=10)
+                    assert result.content[0].text == str(n)
+
+    process = spawn_mcp_process(mcp_id)
+    try:
+        _wait_for_port(port, timeout=60)
+        asyncio.run(run())
+        assert process.poll() is None
+        assert "CallToolRequest" in stderr_tail(mcp_id, timeout=0)
+    finally:
+        terminate_mcp_process(mcp_id)
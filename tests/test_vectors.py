@@ -0,0 +1,47 @@
+import hashlib
+import os
+import pytest
+from fastapi.testclient import TestClient
+from mcp.server.fastmcp import FastMCP
+
+pytest.importorskip("numpy")
+
+from app import app
+from builtin_handler import render_builtins
+from runtime_handler import MCP_DIR, VECTOR_DIR
+from supervisor_handler import set_status
+from system_db_handler import SystemDBHandler
+
+
+TOKEN = "vectors-test-token"
+
+
+def _server(mcp_id: int) -> dict:
+    # The vector_index section of a generated server, loaded from its MCP folder like the real one
+    folder = os.path.join(MCP_DIR, f"mcp_{mcp_id}")
+    os.makedirs(folder, exist_ok=True)
+    namespace = {"__file__": os.path.abspath(os.path.join(folder, f"mcp_{mcp_id}.py")), "mcp": FastMCP("vectors")}
+    exec(render_builtins({"builtins": ["vector_index"]}, mcp_id, VECTOR_DIR), namespace)
+    return namespace
+
+
+def test_collections_survive_stop_and_run():
+    SystemDBHandler().update_record("users", {"token": hashlib.sha256(TOKEN.encode()).hexdigest()}, "username='admin'")
+    client = TestClient(app)
+    response = client.post("/create-mcp", json={"name": "vectors-test", "builtins": ["vector_index"]},
+                           headers={"Authorization": f"Bearer {TOKEN}"})
+    assert response.status_code == 200, response.text
+    mcp_id = response.json()["id"]
+
+    server = _server(mcp_id)
+    server["_craft_vec_upsert"]("docs", ["a", "b"], [[1.0, 0.0], [0.0, 1.0]], ["first", "second"])
+
+    # /stop-mcp deletes the MCP folder and its environment
+    set_status(mcp_id, "running", None)
+    response = client.post("/stop-mcp", json={"mcp_id": mcp_id}, headers={"Authorization": f"Bearer {TOKEN}"})
+    assert response.json()["env_cleaned"]
+
+    # A new /run-mcp starts from a fresh folder
+    server = _server(mcp_id)
+    result = server["_craft_vec_query"]("docs", [[0.0, 1.0]], 1, True)
+    assert result["results"] == [[{"id": "b", "score": 1.0, "document": "second"}]]